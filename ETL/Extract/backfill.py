@@ -0,0 +1,311 @@
+''' Backfill of the instants missed while collection was down, from historical files on local disk. Three kinds of file
+are read:
+
+    - OWM bulk history exports, as JSON (a list of hourly records) or CSV (one hourly record per row)
+    - replay recordings (see replay.py), one response per file under weather/ and forecast/ directories
+    - archives of raw responses, one JSON record per line with the endpoint, name, recorded_at, status and body, as
+      RawOWM writes them to raw_archive (see raw.py)
+
+Every response is put through the same transform as get_current_weather() and five_day() (raw.py, shape_current() and
+shape_forecast()), so the documents are the same as the ones a live run loads to obs_temp and cast_temp, and
+make_instants() turns them into instants as usual. Locations are matched to zipcodes through the geocode cache: a
+response goes to every zipcode in the same forecast cell as its coordinates (see cells.py), or to the zipcode it was
+recorded for. Of the hourly observations for an instant only the one closest to the instant is kept, as a live run
+would have taken it, whichever files they are in: the observations are matched on the _id of their instant document
+(see instant_key.py) across the whole run and loaded once every file has been read. The files are read and transformed in parallel worker processes and the documents are loaded in
+chunks with unordered insert_many().
+
+    python backfill.py [--workers 4] [--start unix time] [--end unix time] [--database test] path [path ...]
+'''
+
+import os
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from pymongo.errors import BulkWriteError
+
+import db_pool
+from raw import observation_from_raw, forecast_from_raw
+from cells import cell_for, cell_size, fan_out
+from geocode import load_geocodes
+from request_and_load import dbncol, shape_current, shape_forecast
+from instant_key import instant_id
+
+try:
+    from config import backfill_workers     # processes reading and transforming the files
+except ImportError:
+    backfill_workers = 4
+try:
+    from config import backfill_chunk   # documents per insert_many()
+except ImportError:
+    backfill_chunk = 1000
+
+extensions = ('.json', '.jsonl', '.csv')
+
+
+def bulk_to_raw(record):
+    ''' Make a current weather response body from a record of an OWM bulk history export.
+
+    :param record: a record from the JSON export, or a row of the CSV export
+    :type record: dict
+
+    :return: the body, as the current weather API would have sent it
+    :type: dict
+    '''
+    if 'main' in record:
+        body = dict(record)
+    else:
+        # the CSV export flattens the nested fields into columns, ie wind_speed and weather_main
+        def number(value):
+            return float(value) if value not in (None, '') else None
+        fields = ('temp', 'feels_like', 'temp_min', 'temp_max', 'pressure', 'sea_level', 'grnd_level', 'humidity')
+        body = {'dt': int(record['dt']), 'lat': record['lat'], 'lon': record['lon'], 'city_name': record.get('city_name'),
+                'main': {field: number(record[field]) for field in fields if number(record.get(field)) is not None},
+                'wind': {field: number(record[f'wind_{field}']) for field in ('speed', 'deg', 'gust')
+                         if number(record.get(f'wind_{field}')) is not None},
+                'clouds': {'all': number(record.get('clouds_all')) or 0},
+                'weather': [{'id': int(record['weather_id']), 'main': record.get('weather_main'),
+                             'description': record.get('weather_description'), 'icon': record.get('weather_icon')}]
+                           if record.get('weather_id') else []}
+        if number(record.get('visibility')) is not None:
+            body['visibility'] = number(record['visibility'])
+        for precipitation in ('rain', 'snow'):
+            amounts = {period: number(record[f'{precipitation}_{period}']) for period in ('1h', '3h')
+                       if number(record.get(f'{precipitation}_{period}')) is not None}
+            if amounts:
+                body[precipitation] = amounts
+    body['coord'] = {'lat': float(body.pop('lat')), 'lon': float(body.pop('lon'))}
+    body['name'] = body.pop('city_name', None)
+    return body
+
+def read_responses(filename):
+    ''' Read the responses in a file.
+
+    :param filename: the path to a bulk export, a replay recording or an archive of raw responses
+    :type filename: string
+
+    :return: the endpoint, the zipcode or coordinates it was recorded for (None if it is not known), the unix time it
+    was received and the body of each response that was a success
+    :type: generator of 4-tuples
+    '''
+    folder = os.path.basename(os.path.dirname(filename))
+    name = os.path.basename(filename).rsplit('.', 1)[0]
+    with open(filename, 'r') as f:
+        if filename.endswith('.csv'):
+            for row in csv.DictReader(f):
+                body = bulk_to_raw(row)
+                yield 'weather', None, body['dt'], body
+        elif filename.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get('status', 200) == 200:
+                        yield record['endpoint'], record.get('name'), record['recorded_at'], record['body']
+        else:
+            data = json.load(f)
+            if isinstance(data, list):
+                for record in data:
+                    body = bulk_to_raw(record)
+                    yield 'weather', None, body['dt'], body
+            elif data.get('status', 200) == 200 and folder in ('weather', 'forecast', 'group'):
+                yield folder, name, data['recorded_at'], data['body']
+
+def list_files(paths):
+    ''' The backfill files at the paths, looking through directories. '''
+
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                filenames += sorted(os.path.join(root, name) for name in files if name.endswith(extensions))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+class Locations:
+    ''' Matches the coordinates in the responses to the zipcodes in the geocode cache. '''
+
+    def __init__(self, geocodes, size=cell_size or 0.01):
+        '''
+        :param geocodes: the coordinates for each zipcode
+        :type geocodes: dict
+        :param size: degrees per cell. zipcodes in the same cell as a response's coordinates get the response
+        :type size: float
+        '''
+
+        self.codes = set(geocodes)
+        self.geocodes = geocodes
+        self.size = size
+        self.cells = {}
+        for code, coords in geocodes.items():
+            self.cells.setdefault(cell_for(coords, size)[0], []).append(code)
+
+    def zipcodes(self, name, coords):
+        ''' The zipcodes for a response.
+
+        :param name: the zipcode or coordinates the response was recorded for, or None
+        :type name: string
+        :param coords: the coordinates in the response
+        :type coords: dict
+
+        :return: the zipcodes
+        :type: list
+        '''
+        if name in self.codes:
+            return [name]
+        return self.cells.get(cell_for(coords, self.size)[0], [])
+
+
+locations = None    # the Locations of each worker process, set by start_worker()
+
+
+def keep_closest(observations, current):
+    ''' Keep the observation if it is the closest to its instant so far.
+
+    :param observations: the observation kept for each instant document's _id
+    :type observations: dict
+    :param current: an obs_temp document
+    :type current: dict
+    '''
+    _id = instant_id(current['Weather']['zipcode'], current['Weather']['instant'])
+    kept = observations.get(_id)
+    if kept is None or current['Weather']['time_to_instant'] < kept['Weather']['time_to_instant']:
+        observations[_id] = current
+
+
+def start_worker(geocodes):
+    global locations
+    locations = Locations(geocodes)
+
+def documents(filename, start=0, end=None):
+    ''' Read a file and make the obs_temp and cast_temp documents for it. Runs in a worker process.
+
+    :param filename: the path to the file
+    :type filename: string
+    :param start: leave out instants before this unix time
+    :type start: int
+    :param end: leave out instants after this unix time
+    :type end: int
+
+    :return: the obs_temp documents, the cast_temp documents, and the number of responses that matched no zipcode
+    :type: 3-tuple
+    '''
+    observations = {}   # the observation closest to the instant for each instant document
+    forecasts = []
+    unmatched = 0
+    for endpoint, name, received, body in read_responses(filename):
+        if endpoint == 'forecast':
+            forecast = forecast_from_raw(body, received)
+            coords = forecast['Location']['coordinates']
+            codes = locations.zipcodes(name, coords)
+            if codes:
+                forecast = shape_forecast(forecast, coords, codes[0])
+                forecast['weathers'] = [cast for cast in forecast['weathers']
+                                        if cast['instant'] >= start and (end is None or cast['instant'] <= end)]
+                if forecast['weathers']:
+                    forecasts += [fan_out(forecast, code, locations.geocodes.get(code)) for code in codes]
+            unmatched += not codes
+            continue
+        for item in body['list'] if endpoint == 'group' else [body]:
+            codes = locations.zipcodes(name if endpoint == 'weather' else None, item['coord'])
+            unmatched += not codes
+            for code in codes:
+                current = shape_current(observation_from_raw(item, received), code)
+                instant = current['Weather']['instant']
+                if instant < start or (end is not None and instant > end):
+                    continue
+                keep_closest(observations, current)
+    return list(observations.values()), forecasts, unmatched
+
+
+class Backfill:
+    ''' Loads the documents from the backfill files to obs_temp and cast_temp. '''
+
+    def __init__(self, client, database='test', workers=backfill_workers, chunk=backfill_chunk, start=0, end=None):
+        '''
+        :param client: a MongoClient instance
+        :type client: pymongo.MongoClient
+        :param database: the database to be used
+        :type database: str
+        :param workers: the number of processes reading the files
+        :type workers: int
+        :param chunk: documents per insert_many()
+        :type chunk: int
+        :param start: leave out instants before this unix time
+        :type start: int
+        :param end: leave out instants after this unix time
+        :type end: int
+        '''
+
+        self.client = client
+        self.database = database
+        self.workers = workers
+        self.chunk = chunk
+        self.start = start
+        self.end = end
+        self.loaded = {'obs_temp': 0, 'cast_temp': 0}
+        self.errors = 0
+        self.unmatched = 0
+
+    def load(self, docs, collection):
+        ''' Insert the documents in chunks, carrying on past the ones that fail. '''
+
+        col = dbncol(self.client, collection, database=self.database)
+        for i in range(0, len(docs), self.chunk):
+            try:
+                result = col.insert_many(docs[i:i + self.chunk], ordered=False)
+                self.loaded[collection] += len(result.inserted_ids)
+            except BulkWriteError as e:
+                self.loaded[collection] += e.details['nInserted']
+                self.errors += len(e.details['writeErrors'])
+                print(f'{len(e.details["writeErrors"])} documents failed to load to {collection}: '
+                      f'{e.details["writeErrors"][0]["errmsg"]}')
+
+    def run(self, paths):
+        ''' Backfill from the files at the paths.
+
+        :param paths: files, or directories to look through for files
+        :type paths: list
+
+        :return: the number of documents loaded to obs_temp and to cast_temp
+        :type: dict
+        '''
+        filenames = list_files(paths)
+        started = time.time()
+        print(f'backfilling from {len(filenames)} files with {self.workers} workers')
+        observations = {}   # the observation closest to the instant for each instant document, from all the files
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=start_worker,
+                                 initargs=(load_geocodes(),)) as executor:
+            jobs = executor.map(documents, filenames, [self.start]*len(filenames), [self.end]*len(filenames))
+            for found, forecasts, unmatched in jobs:
+                for current in found:
+                    keep_closest(observations, current)
+                self.load(forecasts, 'cast_temp')
+                self.unmatched += unmatched
+        self.load(list(observations.values()), 'obs_temp')
+        seconds = time.time() - started
+        records = self.loaded['obs_temp'] + self.loaded['cast_temp']
+        print(f'loaded {self.loaded["obs_temp"]} observations and {self.loaded["cast_temp"]} forecasts in '
+              f'{seconds:.0f} seconds ({records / max(seconds, 1e-9) * 3600:.0f} documents an hour); '
+              f'{self.errors} failed and {self.unmatched} responses matched no zipcode')
+        return self.loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='backfill obs_temp and cast_temp from historical weather files')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--workers', type=int, default=backfill_workers)
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--end', type=int, default=None)
+    parser.add_argument('--database', default='test')
+    args = parser.parse_args()
+
+    client = db_pool.client_for('local')
+    try:
+        Backfill(client, args.database, workers=args.workers, start=args.start, end=args.end).run(args.paths)
+    finally:
+        db_pool.close()
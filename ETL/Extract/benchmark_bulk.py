@@ -0,0 +1,64 @@
+''' Benchmark the documents per second written to obs_temp and cast_temp by load_weather() one document at a time and
+through a BulkLoader. Both write the same locations, made from sample responses by the RawOWM path, to a scratch
+database on the MongoDB in config, which is dropped afterwards.
+
+    python benchmark_bulk.py [number of locations] [bulk size]
+'''
+
+import sys
+import time
+import copy
+
+import db_pool
+
+from bulk import BulkLoader
+from request_and_load import load_weather
+from benchmark_raw import sample_bodies, raw_path
+
+database = 'benchmark_bulk'
+
+
+def locations(n):
+    ''' n (current, forecasts) pairs, each for its own zipcode. '''
+
+    current_body, forecast_body = sample_bodies()
+    current, forecasts = raw_path(current_body, forecast_body, {'lon': -80.44, 'lat': 35.99}, '27006')
+    pairs = []
+    for i in range(n):
+        code = f'{i:05d}'
+        current = copy.deepcopy(current)
+        forecasts = copy.deepcopy(forecasts)
+        current['Weather']['zipcode'] = forecasts['zipcode'] = code
+        pairs.append((current, forecasts))
+    return pairs
+
+def docs_per_second(client, n, loader=None):
+    ''' Load n locations and return the documents written per second. '''
+
+    client.drop_database(database)
+    pairs = locations(n)
+    start = time.perf_counter()
+    for current, forecasts in pairs:
+        load_weather(current, client, database, 'obs_temp', loader=loader)
+        load_weather(forecasts, client, database, 'cast_temp', loader=loader)
+    if loader:
+        loader.close()
+    seconds = time.perf_counter() - start
+    written = client[database]['obs_temp'].count_documents({}) + client[database]['cast_temp'].count_documents({})
+    assert written == 2*n, f'{written} documents written for {n} locations'
+    return 2*n / seconds
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    client = db_pool.client_for('local')
+    try:
+        before = docs_per_second(client, n)
+        after = docs_per_second(client, n, BulkLoader(client, database, size=size))
+    finally:
+        client.drop_database(database)
+        db_pool.close()
+    print(f'load_weather: {before:.0f} documents/s')
+    print(f'bulk loader:  {after:.0f} documents/s with batches of {size}')
+    print(f'the bulk loader writes {after/before:.1f} times as many documents a second over {n} locations')
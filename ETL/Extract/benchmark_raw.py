@@ -0,0 +1,76 @@
+''' Benchmark the CPU time spent turning API responses into documents, per location, with the pyowm path and with the
+RawOWM path. Both are fed the same response bodies so only the parsing and reshaping is measured, not the network.
+
+    python benchmark_raw.py [number of locations]
+'''
+
+import sys
+import json
+import time
+import copy
+
+from pyowm.weatherapi25.parsers.observationparser import ObservationParser
+from pyowm.weatherapi25.parsers.forecastparser import ForecastParser
+
+from raw import observation_from_raw, forecast_from_raw
+from request_and_load import shape_current, shape_forecast
+
+
+def sample_weather(dt):
+    ''' One weather in the form the API sends it. '''
+
+    return {'dt': dt,
+            'main': {'temp': 291.5, 'feels_like': 290.1, 'temp_min': 290.2, 'temp_max': 292.8, 'pressure': 1016,
+                     'sea_level': 1016, 'grnd_level': 990, 'humidity': 72, 'temp_kf': 1.3},
+            'weather': [{'id': 500, 'main': 'Rain', 'description': 'light rain', 'icon': '10d'}],
+            'clouds': {'all': 75},
+            'wind': {'speed': 3.6, 'deg': 220},
+            'rain': {'3h': 0.44},
+            'visibility': 10000,
+            'sys': {'pod': 'd'},
+            'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(dt))}
+
+def sample_bodies():
+    ''' A current weather body and a 40 item forecast body. '''
+
+    now = 10800*(int(time.time())//10800)
+    current = sample_weather(now)
+    current.update({'coord': {'lon': -80.44, 'lat': 35.99}, 'id': 4460243, 'name': 'Advance', 'cod': 200,
+                    'sys': {'country': 'US', 'sunrise': now - 20000, 'sunset': now + 20000}})
+    forecast = {'cod': '200', 'message': 0, 'cnt': 40,
+                'list': [sample_weather(now + 10800*k) for k in range(1, 41)],
+                'city': {'id': 4460243, 'name': 'Advance', 'coord': {'lat': 35.99, 'lon': -80.44}, 'country': 'US'}}
+    return json.dumps(current), json.dumps(forecast)
+
+def pyowm_path(current_body, forecast_body, coords, code):
+    ''' What get_current_weather() and five_day() do with a response when raw is False. '''
+
+    observation = ObservationParser().parse_JSON(current_body)
+    forecast = ForecastParser().parse_JSON(forecast_body)
+    return (shape_current(json.loads(observation.to_JSON()), code),
+            shape_forecast(json.loads(forecast.to_JSON()), coords, code))
+
+def raw_path(current_body, forecast_body, coords, code):
+    ''' What get_current_weather() and five_day() do with a response when raw is True. '''
+
+    return (shape_current(observation_from_raw(json.loads(current_body)), code),
+            shape_forecast(forecast_from_raw(json.loads(forecast_body)), copy.copy(coords), code))
+
+def cpu_per_location(path, n):
+    ''' Run the path for n locations and return the CPU seconds it took for each one. '''
+
+    current_body, forecast_body = sample_bodies()
+    coords = {'lon': -80.44, 'lat': 35.99}
+    start = time.process_time()
+    for i in range(n):
+        path(current_body, forecast_body, coords, '27006')
+    return (time.process_time() - start) / n
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before = cpu_per_location(pyowm_path, n)
+    after = cpu_per_location(raw_path, n)
+    print(f'pyowm: {before*1000:.3f} ms CPU per location')
+    print(f'raw:   {after*1000:.3f} ms CPU per location')
+    print(f'raw path takes {after/before:.0%} of the pyowm CPU time over {n} locations')
@@ -0,0 +1,127 @@
+''' Circuit breakers for the weather API, one for each API key and endpoint ('weather' for the current weather and
+'forecast' for the 3-hourly forecast). When OWM starts failing in bulk a breaker trips open on the error rate of its
+recent calls and the KeyScheduler stops handing out its key for that endpoint, sending the calls to a healthy key
+instead. After a cooldown a single half-open probe is let through: if it succeeds the breaker closes again, if not it
+stays open for another cooldown. When every key is open for an endpoint the calls fail straight away with
+CircuitOpenError rather than each one burning its retries against a provider that is down. '''
+
+import time
+from collections import deque
+
+from pyowm.exceptions.api_call_error import APICallError
+
+try:
+    from config import breaker_window, breaker_min_calls, breaker_threshold, breaker_cooldown
+except ImportError:
+    breaker_window = 20     # the number of recent calls the error rate is taken over
+    breaker_min_calls = 5   # the fewest calls the breaker will trip on
+    breaker_threshold = 0.5     # the error rate that trips the breaker
+    breaker_cooldown = 30   # seconds an open breaker waits before letting a probe through
+
+
+class CircuitOpenError(APICallError):
+    ''' Raised when the breakers are open for every API key on an endpoint. It is an APICallError, so the call is
+    retried with backoff like any other failed call. '''
+
+    def __init__(self, endpoint):
+        super().__init__(f'circuit open on every API key for {endpoint}')
+
+
+class CircuitBreaker:
+    ''' The breaker for a single API key and endpoint. It is 'closed' while calls go through, 'open' while they are
+    held back, and 'half_open' while a probe is out after the cooldown.
+    '''
+
+    def __init__(self, window=breaker_window, min_calls=breaker_min_calls, threshold=breaker_threshold,
+                 cooldown=breaker_cooldown):
+        '''
+        :param window: the number of recent calls the error rate is taken over
+        :type window: int
+        :param min_calls: the fewest calls the breaker will trip on
+        :type min_calls: int
+        :param threshold: the error rate that trips the breaker
+        :type threshold: float
+        :param cooldown: seconds to wait after tripping before letting a probe through
+        :type cooldown: float
+        '''
+
+        self.results = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened_at = None
+
+    @property
+    def available(self):
+        ''' Whether a call can be made on this key and endpoint right now. '''
+
+        if self.state == 'closed':
+            return True
+        if self.state == 'open':
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return False   # a probe is already out
+
+    def wait_time(self):
+        ''' The number of seconds until the breaker lets a call through. While a probe is out that is at most another
+        cooldown, if the probe fails. '''
+
+        if self.state == 'closed':
+            return 0
+        if self.state == 'open':
+            return max(0, self.opened_at + self.cooldown - time.monotonic())
+        return self.cooldown
+
+    def claim(self):
+        ''' Take the call the breaker is letting through. If the cooldown is over this call becomes the probe. '''
+
+        if self.state == 'open':
+            self.state = 'half_open'
+
+    def record(self, success):
+        ''' Record the outcome of a call and open or close the breaker accordingly.
+
+        :param success: False if the call failed with an APICallError
+        :type success: bool
+        '''
+        if self.state == 'half_open':
+            if success:
+                self.state = 'closed'
+                self.results.clear()
+            else:
+                self.trip()
+            return
+        self.results.append(success)
+        failures = self.results.count(False)
+        if len(self.results) >= self.min_calls and failures / len(self.results) >= self.threshold:
+            self.trip()
+
+    def trip(self):
+        ''' Open the breaker. '''
+
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+
+
+class Breakers:
+    ''' The circuit breakers for every API key and endpoint, made as they are needed. '''
+
+    def __init__(self, **kwargs):
+        '''
+        :param kwargs: the settings for each CircuitBreaker
+        '''
+
+        self.kwargs = kwargs
+        self.breakers = {}
+
+    def get(self, key, endpoint):
+        ''' Get the breaker for the API key and endpoint. '''
+
+        if (key, endpoint) not in self.breakers:
+            self.breakers[key, endpoint] = CircuitBreaker(**self.kwargs)
+        return self.breakers[key, endpoint]
+
+    def states(self):
+        ''' The state of each breaker, for the printout at the end of a run. '''
+
+        return {f'{key[-4:]} {endpoint}': breaker.state for (key, endpoint), breaker in self.breakers.items()}
@@ -0,0 +1,50 @@
+''' Spatial deduplication of the forecast calls. Zipcodes close together get the same five day forecast, so the cached
+coordinates of each zipcode are snapped to a grid of cell_size degrees and the forecast is fetched once for each cell,
+at the cell's center. The forecast is then fanned out to every zipcode in the cell, with the zipcode's own coordinates,
+before it is loaded. Cells are off unless cell_size is set in config; with the default of 0 a forecast is fetched for
+every zipcode. '''
+
+import copy
+
+try:
+    from config import cell_size   # degrees of latitude and longitude per cell
+except ImportError:
+    cell_size = 0
+
+
+def cell_for(coords, size=cell_size):
+    ''' Get the cell the coordinates fall in.
+
+    :param coords: the coordinates, ie {'lon': -80.44, 'lat': 35.99}
+    :type coords: dict
+    :param size: degrees per cell
+    :type size: float
+
+    :return: the id of the cell, ie 'cell 36.0,-80.4', and the coordinates of its center
+    :type: 2-tuple
+    '''
+    lat = round(round(coords['lat'] / size) * size, 6)
+    lon = round(round(coords['lon'] / size) * size, 6)
+    return f'cell {lat},{lon}', {'lat': lat, 'lon': lon}
+
+def fan_out(forecast, code, coords=None):
+    ''' Make a copy of a cell's forecast for one of the zipcodes in the cell, labelled with the zipcode and its own
+    coordinates rather than the cell's.
+
+    :param forecast: the forecast fetched for the cell, as returned by five_day()
+    :type forecast: dict
+    :param code: the zipcode
+    :type code: string
+    :param coords: the coordinates of the zipcode, if known
+    :type coords: dict
+
+    :return: the forecast for the zipcode
+    :type: dict
+    '''
+    forecast = copy.deepcopy(forecast)
+    forecast['zipcode'] = code
+    if coords:
+        forecast['coordinates'] = coords
+    for cast in forecast['weathers']:
+        cast['zipcode'] = code
+    return forecast
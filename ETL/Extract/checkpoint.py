@@ -0,0 +1,125 @@
+''' Checkpoints for collection runs. A run writes a checkpoint in resources/ as it goes with its run id, the instant it is
+collecting for, the zipcodes it has loaded and the ones waiting on a retry. If the run dies partway through the zip
+list, the next run for the same instant picks the checkpoint back up and only collects the zipcodes that are not done
+yet, so no API calls are spent twice on an instant. Each checkpoint is kept under the key of its run, a hash of the
+database and the zip list, so request_and_load() and get_and_make() collecting different lists for the same instant
+neither skip each other's zipcodes nor overwrite each other's progress. A checkpoint from an earlier instant is ignored
+and a new run is started, and the checkpoints of other runs are removed once their instant has passed. '''
+
+import os
+import glob
+import json
+import time
+import hashlib
+
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+
+def run_key(codes, database='test'):
+    ''' The key of the runs that collect the zip list into the database, whatever order the zipcodes come in.
+
+    :param codes: the zipcodes the run was asked to collect
+    :type codes: list
+    :param database: the database the run loads to
+    :type database: str
+
+    :return: the key, ie '3f2a9c0d41be'
+    :type: string
+    '''
+    return hashlib.sha1(json.dumps([database] + sorted(codes)).encode()).hexdigest()[:12]
+
+def checkpoint_file(key, directory=directory):
+    ''' The path to the checkpoint of the runs with the key. '''
+
+    return os.path.join(directory, f'checkpoint-{key}.json')
+
+def new_run(instant, key):
+    ''' Start the checkpoint for a new run.
+
+    :param instant: the instant the run is collecting for
+    :type instant: int
+    :param key: the key of the run, see run_key()
+    :type key: string
+
+    :return: the checkpoint
+    :type: dict
+    '''
+    started = int(time.time())
+    return {'run_id': f'{started}-{os.getpid()}', 'key': key, 'instant': instant, 'started': started, 'done': [],
+            'pending': []}
+
+def load_checkpoint(instant, key, directory=directory):
+    ''' Get the checkpoint to carry on from for the instant, or a new one if the last run with the key was for another
+    instant.
+
+    :param instant: the instant the run is collecting for
+    :type instant: int
+    :param key: the key of the run, see run_key()
+    :type key: string
+    :param directory: the directory the checkpoints are kept in
+    :type directory: string
+
+    :return: the checkpoint
+    :type: dict
+    '''
+    prune(instant, directory)
+    try:
+        with open(checkpoint_file(key, directory), 'r') as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return new_run(instant, key)
+    if checkpoint.get('instant') != instant:
+        return new_run(instant, key)
+    return checkpoint
+
+def save_checkpoint(checkpoint, directory=directory):
+    ''' Write the checkpoint to its file, by way of a temporary file so a crash cannot leave half of it behind.
+
+    :param checkpoint: the checkpoint
+    :type checkpoint: dict
+    :param directory: the directory the checkpoints are kept in
+    :type directory: string
+    '''
+    checkpoint['saved'] = int(time.time())
+    filename = checkpoint_file(checkpoint['key'], directory)
+    temp = f'{filename}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp, filename)
+
+def prune(instant, directory=directory):
+    ''' Remove the checkpoints of runs for instants before this one, which can never be picked back up.
+
+    :param instant: the instant being collected
+    :type instant: int
+    :param directory: the directory the checkpoints are kept in
+    :type directory: string
+    '''
+    for filename in glob.glob(os.path.join(directory, 'checkpoint-*.json')):
+        try:
+            with open(filename, 'r') as f:
+                past = json.load(f).get('instant', 0) < instant
+        except (OSError, ValueError):
+            continue
+        if past:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass    # another run pruned it first
+
+def update(checkpoint, done=(), failed=()):
+    ''' Add the zipcodes loaded and the ones that ran out of retries since the last save.
+
+    :param checkpoint: the checkpoint
+    :type checkpoint: dict
+    :param done: the zipcodes loaded
+    :type done: list
+    :param failed: the zipcodes dead lettered
+    :type failed: list
+    '''
+    finished = set(checkpoint['done'])
+    checkpoint['done'].extend(code for code in done if code not in finished)
+    finished.update(done)
+    pending = set(checkpoint['pending']) | set(failed)
+    checkpoint['pending'] = sorted(pending - finished)
@@ -0,0 +1,210 @@
+''' A long running collector that works to the instant windows. An observation belongs to the instant at the end of the
+3 hour window it was taken in, and the closer to that instant it is taken the better it stands for it, but the cron
+jobs start whenever they start and fetch observations wherever in the window they happen to be. The daemon instead
+plans each window in two phases. The forecasts are fetched first, paced evenly over the early part of the window. The
+observations are then fetched in one run at the full quota, timed to end just before the instant, so every location
+gets an observation close to the instant and the quota is never exceeded along the way. The forecasts are fetched by
+cached coordinates, so a zipcode that is not in the geocode cache yet has its forecast fetched along with its
+observation instead, from the coordinates in the observation.
+
+    python daemon.py [csv file of zipcodes]
+'''
+
+import os
+import sys
+import math
+import time
+
+import pool
+import db_pool
+from fetch import collect, shared_quota
+from pipeline import Loader
+from cells import cell_for, cell_size
+from breaker import Breakers
+from quota import QuotaLedger
+from ratelimit import KeyScheduler, calls_per_minute
+from geocode import load_geocodes, save_geocodes, ids_filename
+from health import LocationHealth
+from metrics import metrics
+from ingest import direct_ingest
+from versions import is_fresh, load_versions, save_versions
+from retry import dead_letter
+from request_and_load import read_list_from_file
+
+try:
+    from config import observation_margin   # seconds left between the end of the observations and the instant
+except ImportError:
+    observation_margin = 120
+try:
+    from config import observation_slack    # the observation phase is planned this much longer than it should take
+except ImportError:
+    observation_slack = 1.25
+
+
+def next_instant(now=None):
+    ''' The instant at the end of the current window. '''
+
+    return 10800*(int(now or time.time())//10800 + 1)
+
+def observation_lead(n, keys, rate=calls_per_minute, slack=observation_slack, margin=observation_margin):
+    ''' The number of seconds before the instant the observations have to start to be done in time.
+
+    :param n: the number of locations
+    :type n: int
+    :param keys: the number of API keys
+    :type keys: int
+    :param rate: the API quota for each key
+    :type rate: int
+    :param slack: the extra share of time allowed for retries and slow calls
+    :type slack: float
+    :param margin: seconds to leave between the last observation and the instant
+    :type margin: float
+
+    :return: seconds
+    :type: float
+    '''
+    return n / (keys*rate/60) * slack + margin
+
+def forecast_rate(calls, seconds, keys, rate=calls_per_minute):
+    ''' The calls per minute per key that spread the forecast calls over the time there is for them, within the quota.
+
+    :param calls: the number of forecast calls to make
+    :type calls: int
+    :param seconds: the time there is to make them in
+    :type seconds: float
+    :param keys: the number of API keys
+    :type keys: int
+    :param rate: the API quota for each key
+    :type rate: int
+
+    :return: calls per minute for each key
+    :type: int
+    '''
+    if seconds <= 0:
+        return rate
+    return max(1, min(rate, math.ceil(calls*60 / (keys*seconds))))
+
+
+class WindowDaemon:
+    ''' Collects the zipcodes window after window, forecasts first and observations last. '''
+
+    def __init__(self, codes, client, database='test', after_window=None):
+        '''
+        :param codes: a list of zipcodes
+        :type codes: list of five-digit valid strings of US zip codes
+        :param client: a MongoClient instance
+        :type client: pymongo.MongoClient
+        :param database: the database to be used
+        :type database: str
+        :param after_window: called after the observations for each window are loaded, ie to make instants. Not
+        called when direct_ingest is set in config
+        :type after_window: function
+        '''
+
+        self.codes = codes
+        self.client = client
+        self.database = database
+        self.after_window = None if direct_ingest else after_window
+        self.geocodes = load_geocodes()
+        self.city_ids = load_geocodes(ids_filename)
+        self.versions = load_versions()
+        self.health = LocationHealth()
+        self.breakers = Breakers()   # one set for the life of the daemon so a failing key stays benched across phases
+        self.ledger = QuotaLedger(client) if shared_quota else None
+        self.keys = len(KeyScheduler().keys)
+
+    def scheduler(self, rate=calls_per_minute):
+        ''' A scheduler pacing the calls at rate per key, within the shared quota. '''
+
+        return KeyScheduler(calls_per_minute=rate, burst=1, breakers=self.breakers, ledger=self.ledger)
+
+    def forecast_calls(self):
+        ''' The number of forecast calls the locations will need this window, counting each cell once. '''
+
+        locations = {cell_for(self.geocodes[code])[0] if cell_size else code
+                     for code in self.codes if code in self.geocodes}
+        return sum(not is_fresh(self.versions, location) for location in locations)
+
+    def phase(self, endpoints, scheduler, codes=None):
+        ''' Collect and load one of the endpoints for all the locations.
+
+        :param endpoints: the calls to make, ie ('forecast',)
+        :type endpoints: tuple
+        :param scheduler: the scheduler pacing the calls
+        :type scheduler: ratelimit.KeyScheduler
+        :param codes: the zipcodes to collect, defaults to all of them
+        :type codes: list
+
+        :return: the number of locations loaded
+        :type: int
+        '''
+        failures = []
+        with Loader(self.client, self.database, versions=self.versions) as loader:
+            collect(self.health.active(self.codes if codes is None else codes), scheduler=scheduler,
+                    geocodes=self.geocodes, versions=self.versions, failures=failures, loader=loader,
+                    endpoints=endpoints, health=self.health, city_ids=self.city_ids)
+        if failures:
+            dead_letter(self.client, self.database, failures)
+        save_geocodes(self.geocodes)
+        save_geocodes(self.city_ids, ids_filename)
+        save_versions(self.versions)
+        self.health.save()
+        return len(loader.done)
+
+    def window(self):
+        ''' Collect the window the daemon is in, then wait for the instant. When there is no time left for the
+        forecasts before the observations have to start, they are collected after the observations instead. '''
+
+        instant = next_instant()
+        metrics.reset()
+        ungeocoded = [code for code in self.codes if code not in self.geocodes]
+        geocoded = [code for code in self.codes if code in self.geocodes]
+        start = instant - observation_lead(len(self.codes) + len(ungeocoded), self.keys)
+        forecasted = time.time() < start
+        if forecasted:
+            calls = self.forecast_calls()
+            rate = forecast_rate(calls, start - time.time(), self.keys)
+            print(f'window {instant}: {calls} forecast calls at {rate} per minute per key')
+            n = self.phase(('forecast',), self.scheduler(rate), geocoded)
+            print(f'window {instant}: loaded forecasts for {n} locations')
+            print(f'window {instant}: observations start in {max(0, start - time.time()):.0f} seconds')
+            time.sleep(max(0, start - time.time()))
+        scheduler = self.scheduler()
+        if ungeocoded:
+            print(f'window {instant}: {len(ungeocoded)} zipcodes have no cached coordinates; collecting their '
+                  f'forecasts with their observations')
+            self.phase(('weather', 'forecast'), scheduler, ungeocoded)
+        n = self.phase(('weather',), scheduler, geocoded)
+        print(f'window {instant}: loaded observations for {n} locations, {instant - time.time():.0f} seconds before '
+              f'the instant')
+        if not forecasted:
+            n = self.phase(('forecast',), scheduler, geocoded)
+            print(f'window {instant}: no time for the forecasts before the observations; loaded them after, for {n} '
+                  f'locations')
+        metrics.write()
+        if self.after_window:
+            self.after_window()
+        time.sleep(max(0, instant - time.time()))
+
+    def run(self):
+        ''' Collect window after window until stopped. '''
+
+        while True:
+            self.window()
+
+
+if __name__ == '__main__':
+    from make_instants import make_instants
+    from indexes import ensure_indexes
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    filename = sys.argv[1] if len(sys.argv) > 1 else os.path.join(directory, 'resources', 'success_zipsNC.csv')
+    client = db_pool.client_for('local')
+    ensure_indexes(client, 'test')
+    try:
+        WindowDaemon(read_list_from_file(filename), client, 'test', after_window=lambda: make_instants(client)).run()
+    except KeyboardInterrupt:
+        print('stopping')
+    finally:
+        db_pool.close()
+        pool.close() # close the keep-alive sessions to the weather API
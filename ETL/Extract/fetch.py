@@ -0,0 +1,519 @@
+''' Concurrent fetch engine for the weather API. The OWM calls are blocking, so each one is handed off to a worker thread
+while asyncio keeps a bounded number of them in flight for each API key. This lets the current weather and five day
+forecasts for thousands of zipcodes be collected together instead of one zipcode at a time. Every call takes a token
+from the KeyScheduler first, which decides which API key it goes out on. When the coordinates for a zipcode are in the
+geocode cache, its current weather and forecast calls are made at the same time, and its forecast is skipped altogether
+when the forecast versions show there cannot be a new one yet. Failed calls are retried with backoff on the event loop
+(see retry.py) and the locations that run out of attempts are handed back to the caller to be dead lettered. Nearby
+zipcodes share a single forecast call for their cell (see cells.py), and collected locations are streamed to the
+database through a Loader (see pipeline.py). Zipcodes whose OWM city id is known from an earlier run get their current
+weather in grouped calls of up to observation_group city ids, and only fall back to a call of their own when the group
+does not cover them. Every call is timed and counted in the run's metrics (see metrics.py). '''
+
+import copy
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from pyowm.exceptions.api_call_error import APICallError
+from pyowm.exceptions.api_response_error import APIResponseError
+
+from request_and_load import get_current_weather, current_weather_at_ids, shape_current, five_day
+from ratelimit import KeyScheduler
+from geocode import record, load_geocodes, save_geocodes, ids_filename
+from versions import is_fresh, new_version, record_version, load_versions, save_versions
+from retry import retrying, RetriesExhausted, dead_letter, dead_letters, clear_dead_letters
+from cells import cell_for, fan_out, cell_size
+from pipeline import Loader
+from checkpoint import load_checkpoint, save_checkpoint, update, run_key
+from quota import QuotaLedger
+from workqueue import WorkQueue
+from priority import Prioritizer, by_priority
+from health import LocationHealth
+from metrics import metrics
+from ingest import direct_ingest
+
+try:
+    from config import in_flight    # the maximum number of requests in flight per API key
+except ImportError:
+    in_flight = 8
+try:
+    from config import work_queue   # share the zip list with other hosts through the work queue
+except ImportError:
+    work_queue = False
+try:
+    from config import prioritize   # collect the most valuable locations first and shed what there is no time for
+except ImportError:
+    prioritize = True
+try:
+    from config import shared_quota     # reserve every call in the quota ledger shared with other processes
+except ImportError:
+    shared_quota = True
+try:
+    from config import observation_group    # city ids per grouped current weather call, at most 20. 0 for no grouping
+except ImportError:
+    observation_group = 20
+
+
+class FetchRun:
+    ''' The state shared by the fetches of one batch of zipcodes: the scheduler handing out API keys, the caches, the
+    semaphore bounding the requests in flight on each key, the threads the blocking calls are run in and the loader the
+    results are streamed to.
+    '''
+
+    def __init__(self, scheduler=None, geocodes=None, versions=None, failures=None, cell_forecasts=None,
+                 in_flight=in_flight, cell_size=cell_size, loader=None, endpoints=('weather', 'forecast'),
+                 health=None, city_ids=None, group_size=observation_group):
+        '''
+        :param scheduler: the rate limiter handing out the API keys. A new one is made if it is not given
+        :type scheduler: ratelimit.KeyScheduler
+        :param geocodes: the cached coordinates for each zipcode. New coordinates are added to it
+        :type geocodes: dict
+        :param versions: the last forecast version for each zipcode or cell. New versions are recorded in it
+        :type versions: dict
+        :param failures: the zipcode, endpoint and RetriesExhausted error for each call that ran out of retries are
+        added to it
+        :type failures: list
+        :param cell_forecasts: the forecasts already fetched for each cell in this run
+        :type cell_forecasts: dict
+        :param in_flight: the maximum number of requests in flight per API key
+        :type in_flight: int
+        :param cell_size: degrees per forecast cell. 0 fetches a forecast for every zipcode
+        :type cell_size: float
+        :param loader: the loader to put each location on as soon as it is collected, rather than returning them all
+        at the end
+        :type loader: pipeline.Loader
+        :param endpoints: the calls to make for each location. With only 'forecast', zipcodes that are not in the
+        geocode cache are skipped
+        :type endpoints: tuple
+        :param health: the zipcode health tracker the outcome of each current weather call is recorded in
+        :type health: health.LocationHealth
+        :param city_ids: the cached OWM city id for each zipcode. New city ids are added to it
+        :type city_ids: dict
+        :param group_size: the number of city ids in each grouped current weather call. 0 calls each zipcode on its own
+        :type group_size: int
+        '''
+
+        self.scheduler = scheduler or KeyScheduler()
+        self.geocodes = {} if geocodes is None else geocodes
+        self.versions = {} if versions is None else versions
+        self.failures = [] if failures is None else failures
+        self.cell_forecasts = {} if cell_forecasts is None else cell_forecasts
+        self.in_flight = in_flight
+        self.cell_size = cell_size
+        self.loader = loader
+        self.endpoints = endpoints
+        self.health = health
+        self.city_ids = {} if city_ids is None else city_ids
+        self.group_size = min(group_size, 20)
+        self.cells = {}     # the forecast fetch for each cell in this batch
+        self.groups = {}    # the grouped current weather fetch each zipcode is in for this batch
+
+    async def call_api(self, func, *args, endpoint, **kwargs):
+        ''' Run one of the blocking API functions in the executor with the API key the scheduler hands out, once the
+        semaphore for that key lets it through. The outcome is recorded on the key's circuit breaker for the endpoint,
+        and the time waited, the time taken and the outcome in the run's metrics.
+
+        :param func: the function making the API call, ie get_current_weather() or five_day(). It must take a key
+        argument
+        :type func: function
+        :param endpoint: 'weather' or 'forecast'
+        :type endpoint: string
+
+        :return: whatever func returns
+        '''
+        loop = asyncio.get_running_loop()
+        waited = time.time()
+        key = await self.scheduler.acquire(endpoint)
+        breaker = self.scheduler.breakers.get(key, endpoint)
+        async with self.semaphores[key]:
+            start = time.time()
+            metrics.wait(endpoint, start - waited)
+            try:
+                result = await loop.run_in_executor(self.executor,
+                                                    functools.partial(func, *args, key=key, retry=False, **kwargs))
+            except APICallError as e:
+                metrics.call(endpoint, key, type(e).__name__, time.time() - start)
+                breaker.record(False)
+                raise
+            except Exception as e:
+                metrics.call(endpoint, key, type(e).__name__, time.time() - start)
+                breaker.record(True)   # the API answered, even if the answer was an error
+                raise
+        metrics.call(endpoint, key, 'ok', time.time() - start)
+        breaker.record(True)
+        return result
+
+    async def fetch_group(self, ids):
+        ''' Get the current weather at a group of city ids in one call.
+
+        :param ids: the city ids
+        :type ids: list
+
+        :return: the observation at each city id that came back, or None if the call failed
+        :type: dict
+        '''
+        try:
+            return await retrying(lambda: self.call_api(current_weather_at_ids, ids, endpoint='weather'),
+                                  f'current weather for {len(ids)} city ids', endpoint='weather')
+        except (RetriesExhausted, APIResponseError) as e:
+            print(f'got {type(e).__name__} while collecting current weather for {len(ids)} city ids. Collecting them '
+                  f'one at a time.')
+
+    def group(self, codes):
+        ''' Start a grouped current weather fetch for each group_size of the city ids of the zipcodes. '''
+
+        codes = [code for code in codes if code in self.city_ids]
+        ids = list(dict.fromkeys(self.city_ids[code] for code in codes))    # zipcodes in the same city share an id
+        groups = {}
+        for i in range(0, len(ids), self.group_size):
+            task = asyncio.ensure_future(self.fetch_group(ids[i:i + self.group_size]))
+            groups.update(dict.fromkeys(ids[i:i + self.group_size], task))
+        self.groups = {code: groups[self.city_ids[code]] for code in codes}
+
+    async def fetch_current(self, code):
+        ''' Get the current weather for a zipcode, from its grouped call if it is in one that came back with it.
+
+        :param code: the zipcode
+        :type code: string
+
+        :return: the current weather, or None if it could not be collected
+        :type: dict
+        '''
+        if code in self.groups:
+            observations = await self.groups[code]
+            if observations and self.city_ids[code] in observations:
+                if self.health:
+                    self.health.succeeded(code)
+                return shape_current(copy.deepcopy(observations[self.city_ids[code]]), code)
+        try:
+            current = await retrying(lambda: self.call_api(get_current_weather, code, endpoint='weather'),
+                                     f'current weather for {code}', endpoint='weather')
+        except RetriesExhausted as e:
+            print(f'{e} while collecting current weather for {code}. Dead lettering it.')
+            self.failures.append((code, 'weather', e))
+            return
+        except (AttributeError, APIResponseError) as e:
+            print(f'got {type(e).__name__} while collecting current weather for {code}. Continuing to next code.')
+            if self.health:
+                self.health.failed(code, e)
+            return
+        if self.health:
+            self.health.succeeded(code)
+        if current.get('city_id'):
+            self.city_ids[code] = current['city_id']
+        return current
+
+    async def fetch_forecast(self, location, coords, code):
+        ''' Get the five day forecast for a location, unless the last one collected is too recent to have been replaced
+        or the new one turns out to be the same as the last one.
+
+        :param location: the zipcode or cell the forecast is for, ie the key to its version
+        :type location: string
+        :param coords: the coordinates to get the forecast at
+        :type coords: dict
+        :param code: the zipcode the forecast is labelled with
+        :type code: string
+
+        :raises RetriesExhausted: when the call runs out of retries
+
+        :return: the forecasts and the location and version to record once they are loaded, or None if there is
+        nothing new to load
+        :type: 2-tuple
+        '''
+        if is_fresh(self.versions, location):
+            return
+        try:
+            forecasts = await retrying(lambda: self.call_api(five_day, coords, code=code, endpoint='forecast'),
+                                       f'forecast for {location}', endpoint='forecast')
+        except (AttributeError, APIResponseError) as e:
+            print(f'got {type(e).__name__} while collecting forecasts for {location}. Continuing to next code.')
+            return
+        version, new = new_version(self.versions, location, forecasts)
+        if new:
+            return forecasts, (location, version)
+        print(f'forecast for {location} has not changed since {self.versions[location]["reception_time"]}; not '
+              f'loading it.')
+        record_version(self.versions, location, version)    # there is nothing to load that could be lost
+
+    async def forecast_for(self, code, coords):
+        ''' Get the five day forecast for a zipcode. When cells are in use the forecast is fetched once for the
+        zipcode's cell, by whichever of its zipcodes asks first, and fanned out to the rest.
+
+        :param code: the zipcode
+        :type code: string
+        :param coords: the coordinates of the zipcode
+        :type coords: dict
+
+        :return: the forecasts and the location and version to record once they are loaded, both None if there is
+        nothing new to load
+        :type: 2-tuple
+        '''
+        try:
+            if not self.cell_size:
+                return await self.fetch_forecast(code, coords, code) or (None, None)
+            cell, center = cell_for(coords, self.cell_size)
+            if cell not in self.cell_forecasts:
+                if cell not in self.cells:
+                    self.cells[cell] = asyncio.ensure_future(self.fetch_forecast(cell, center, code))
+                self.cell_forecasts[cell] = await self.cells[cell]
+        except RetriesExhausted as e:
+            print(f'{e} while collecting forecasts for {code}. Dead lettering it.')
+            self.failures.append((code, 'forecast', e))
+            return None, None
+        if not self.cell_forecasts[cell]:
+            return None, None
+        forecast, version = self.cell_forecasts[cell]
+        return fan_out(forecast, code, coords), version
+
+    async def fetch_location(self, code):
+        ''' Get the current weather and the five day forecast for a single zipcode. If the zipcode is in the geocode
+        cache both calls are made at once, otherwise the forecast waits for the coordinates from the current weather and
+        they are added to the cache.
+
+        :param code: the zipcode
+        :type code: string
+
+        :return: the current weather and the forecasts, or None if the current weather could not be collected. The
+        forecasts are None when there is no new forecast to load. When only one of the endpoints is being called the
+        other is None, and the location is only returned if there is something to load
+        :type: 2-tuple of dicts
+        '''
+        version = None
+        if 'weather' not in self.endpoints:
+            current = None
+            forecasts, version = await self.forecast_for(code, self.geocodes[code]) if code in self.geocodes \
+                else (None, None)
+            if forecasts is None:
+                return
+        elif 'forecast' not in self.endpoints:
+            current, forecasts = await self.fetch_current(code), None
+            if current is None:
+                return
+            record(self.geocodes, current)
+        elif code in self.geocodes:
+            current, (forecasts, version) = await asyncio.gather(self.fetch_current(code),
+                                                                 self.forecast_for(code, self.geocodes[code]))
+            if current is None:
+                return  # the forecast is dropped with it, and its version left unrecorded to be fetched again
+        else:
+            current = await self.fetch_current(code)
+            if current is None:
+                return
+            record(self.geocodes, current)
+            forecasts, version = await self.forecast_for(code, current['coordinates'])
+        if self.loader:
+            # the loader records the forecast's version once the location is written (see pipeline.py)
+            await self.loader.put_async((current, forecasts, version))
+            return
+        if version:
+            record_version(self.versions, *version)
+        return current, forecasts
+
+    async def fetch_all(self, codes):
+        ''' Get the current weather and five day forecasts for all the zipcodes, keeping no more than in_flight
+        requests going at once on each API key.
+
+        :param codes: a list of zipcodes
+        :type codes: list of five-digit valid strings of US zip codes
+
+        :return: the (current, forecasts) pair for each zipcode that was collected, in the order of codes. forecasts
+        is None when there was no new forecast for the zipcode. Empty when the locations went to the loader
+        :type: list
+        '''
+        self.semaphores = {key: asyncio.Semaphore(self.in_flight) for key in self.scheduler.keys}
+        self.cells = {}
+        self.groups = {}
+        with ThreadPoolExecutor(max_workers=len(self.semaphores)*self.in_flight) as self.executor:
+            if 'weather' in self.endpoints and self.group_size:
+                self.group(codes)
+            results = await asyncio.gather(*(self.fetch_location(code) for code in codes))
+        return [result for result in results if result]
+
+
+def collect(codes, **kwargs):
+    ''' Blocking entry point to FetchRun.fetch_all() for the synchronous request_and_load() and get_and_make(). Pass
+    the same scheduler and caches to every call in a run so the pacing carries over from one batch of zipcodes to the
+    next.
+
+    :param codes: a list of zipcodes
+    :type codes: list of five-digit valid strings of US zip codes
+    :param kwargs: the scheduler, caches and settings for the FetchRun
+
+    :return: the (current, forecasts) pair for each zipcode that was collected, unless a loader was given
+    :type: list
+    '''
+    return asyncio.run(FetchRun(**kwargs).fetch_all(codes))
+
+def collect_and_load(codes, client, database='test', after_batch=None):
+    ''' Collect the zipcodes and stream them to the obs_temp and cast_temp collections as they come in (see
+    pipeline.py), then try the dead letters for the current instant again while the instant is still open. Every 60
+    locations loaded the failures are dead lettered, the caches and the run's checkpoint are saved and after_batch is
+    called. When the last run for this instant did not finish, the zipcodes it already loaded are skipped (see
+    checkpoint.py). The zipcodes are collected in order of priority, and the least valuable are shed if they cannot
+    all be collected before the instant (see priority.py). With work_queue set in config the zipcodes go through the
+    shared work queue instead, and this process collects whichever batches it claims (see workqueue.py). This is the
+    run loop of request_and_load() and get_and_make().
+
+    :param codes: a list of zipcodes
+    :type codes: list of five-digit valid strings of US zip codes
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+    :param after_batch: called after each 60 locations are loaded, ie to make instants from them. Not called when
+    direct_ingest is set in config, as the locations are already in their instants
+    :type after_batch: function
+
+    :return: the number of zipcodes collected
+    :type: int
+    '''
+    if direct_ingest:
+        after_batch = None
+    metrics.reset()
+    scheduler = KeyScheduler(ledger=QuotaLedger(client) if shared_quota else None)
+    geocodes = load_geocodes()
+    city_ids = load_geocodes(ids_filename)
+    versions = load_versions()
+    cell_forecasts = {}
+    health = LocationHealth()
+    progress = load_checkpoint(10800*(int(time.time())//10800 + 1), run_key(codes, database))
+    codes = health.active(codes)
+    if progress['done']:
+        print(f'resuming run {progress["run_id"]}: {len(progress["done"])} zipcodes already collected for instant '
+              f'{progress["instant"]}')
+        finished = set(progress['done'])
+        codes = [code for code in codes if code not in finished]
+
+    def run(codes):
+        ''' Collect and load the zipcodes and return the ones that were loaded. '''
+        failures = []
+        saved = 0   # the number of loader.done already in the checkpoint
+
+        def save():
+            nonlocal saved
+            # the fetches keep adding to these from the event loop while the loader thread is in here
+            pending = failures[:]
+            del failures[:len(pending)]
+            if pending:
+                dead_letter(client, database, pending)
+            save_geocodes(dict(geocodes))
+            save_geocodes(dict(city_ids), ids_filename)
+            save_versions(dict(versions))
+            health.save()
+            done = loader.done[saved:]
+            saved += len(done)
+            update(progress, done, [code for code, endpoint, e in pending])
+            save_checkpoint(progress)
+
+        def checkpoint():
+            save()
+            if after_batch:
+                after_batch()
+
+        loader = Loader(client, database, checkpoint=checkpoint, versions=versions)
+        try:
+            with loader:
+                collect(codes, scheduler=scheduler, geocodes=geocodes, versions=versions, failures=failures,
+                        cell_forecasts=cell_forecasts, loader=loader, health=health, city_ids=city_ids)
+        finally:
+            save()
+        if after_batch:
+            after_batch()
+        return loader.done
+
+    if work_queue:
+        i = work(codes, run, client, database)
+        metrics.write()
+        return i
+    if prioritize:
+        i = by_priority(codes, run, Prioritizer(client, database, keys=len(scheduler.keys)))
+    else:
+        i = len(run(codes)) # i for counting zipcodes processed
+
+    # catch up on the locations that ran out of retries, if their instant has not closed yet
+    instant = 10800*(int(time.time())//10800 + 1)
+    done = catch_up(run, scheduler, client, database, instant)
+    clear_dead_letters(client, database, instant, done)
+    i += len(done)
+    print(f'circuit breakers at the end of the run: {scheduler.breakers.states()}')
+    metrics.write()
+    return i
+
+def catch_up(run, scheduler, client, database, instant):
+    ''' Collect the dead letters for the instant again. They mostly failed because the breakers for their endpoint
+    were open, so the breakers are waited out first, as long as they close before the instant does. The letters for an
+    endpoint whose breakers will still be open then are left for the next run rather than failing straight away again.
+
+    :param run: collects and loads a list of zipcodes and returns the ones loaded
+    :type run: function
+    :param scheduler: the run's KeyScheduler, with its circuit breakers
+    :type scheduler: ratelimit.KeyScheduler
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+    :param instant: the instant being collected
+    :type instant: int
+
+    :return: the zipcodes collected
+    :type: list
+    '''
+    retries, wait = [], 0
+    for endpoint in ('weather', 'forecast'):
+        letters = dead_letters(client, database, instant, endpoint)
+        if not letters:
+            continue
+        reopens = scheduler.reopens_in(endpoint)
+        if time.time() + reopens >= instant:
+            print(f'the {endpoint} breakers are open until after the instant closes; leaving {len(letters)} dead '
+                  f'lettered zipcodes for the next run')
+            continue
+        retries += letters
+        wait = max(wait, reopens)
+    if not retries:
+        return []
+    if wait:
+        print(f'waiting {wait:.0f} seconds for the circuit breakers to close')
+        time.sleep(wait)
+    print(f'catching up on {len(retries)} dead lettered zipcodes before the instant closes')
+    return run(retries)
+
+def work(codes, run, client, database, batch=60):
+    ''' Collect the zipcodes as one of the workers on the work queue. Batches are claimed and collected until there
+    are none left for the instant, waiting out the leases of other workers in case one of them has died.
+
+    :param codes: a list of zipcodes to add to the queue
+    :type codes: list of five-digit valid strings of US zip codes
+    :param run: collects and loads a list of zipcodes and returns the ones loaded
+    :type run: function
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+    :param batch: the number of tasks claimed at a time
+    :type batch: int
+
+    :return: the number of zipcodes this worker collected
+    :type: int
+    '''
+    queue = WorkQueue(client, database)
+    queue.enqueue(codes)
+    i = 0
+    while True:
+        claimed = queue.claim(batch)
+        if not claimed:
+            wait = queue.held_elsewhere()
+            if wait is None:
+                break
+            time.sleep(min(wait + 1, queue.lease))
+            continue
+        with queue.heartbeat(claimed):
+            done = run(claimed)
+        queue.complete(done)
+        queue.release(set(claimed) - set(done))
+        clear_dead_letters(client, database, queue.instant, done)
+        i += len(done)
+    print(f'worker {queue.worker} collected {i} zipcodes for instant {queue.instant}')
+    return i
@@ -0,0 +1,54 @@
+''' A persistent zipcode to coordinates cache. The five day forecast is requested by coordinates, which used to come from
+the current weather response, so the two calls for a zipcode had to be made one after the other. With the coordinates
+cached in resources/geocodes.json both calls can go out together; zipcodes that are not cached yet get their
+coordinates recorded from the current weather the first time they are collected. The OWM city id of each zipcode is
+kept the same way in resources/city_ids.json, for the grouped current weather calls. '''
+
+import os
+import json
+
+
+filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'geocodes.json')
+ids_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'city_ids.json')
+
+
+def load_geocodes(filename=filename):
+    ''' Read the cached coordinates from the file. A missing file is just an empty cache.
+
+    :param filename: the path to the geocode cache
+    :type filename: string
+
+    :return: the coordinates for each cached zipcode, ie {'27006': {'lon': -80.44, 'lat': 35.99}}
+    :type: dict
+    '''
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_geocodes(geocodes, filename=filename):
+    ''' Write the cached coordinates to the file. The file is written to a temporary name and then moved over the old one
+    so an interrupted run cannot leave a half written cache behind.
+
+    :param geocodes: the coordinates for each zipcode
+    :type geocodes: dict
+    :param filename: the path to the geocode cache
+    :type filename: string
+    '''
+    temp = f'{filename}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(geocodes, f, indent=0, sort_keys=True)
+    os.replace(temp, filename)
+
+def record(geocodes, current):
+    ''' Add the coordinates from a current weather document to the cache.
+
+    :param geocodes: the coordinates for each zipcode
+    :type geocodes: dict
+    :param current: the current weather as returned by get_current_weather()
+    :type current: dict
+    '''
+    code = current['Weather'].get('zipcode')
+    if code:
+        geocodes[code] = current['coordinates']
@@ -6,6 +6,10 @@ from pymongo import MongoClient
 
 from request_and_load import get_current_weather, five_day, load_weather, read_list_from_file
 from make_instants import make_instants
+from fetch import collect_and_load
+from indexes import ensure_indexes
+import pool
+import db_pool
 
 from config import OWM_API_key_loohoo as loohoo_key, OWM_API_key_masta as masta_key
 from config import port, host, user, password, socket_path
@@ -21,39 +25,7 @@ def get_and_make(codes):
     # Begin a timer for the process and run the request and load process.
     start_start = time.time()
     print(f'task began at {start_start}')
-    i, n = 0, 0 # i for counting zipcodes processed and n for counting API calls made; API calls limited to a maximum of 60/minute/apikey.
-    start_time = time.time()
-    for code in codes:
-        try:
-            current = get_current_weather(code)
-        except AttributeError:
-            print(f'got AttributeError while collecting current weather for {code}. Continuing to next code.')
-            continue
-        n+=1
-        coords = current['coordinates']         
-        try:
-            forecasts = five_day(coords, code=code)
-        except AttributeError:
-            print(f'got AttributeError while collecting forecasts for {code}. Continuing to next code.')
-            continue
-        n+=1
-        load_weather(current, client, 'test', 'obs_temp')
-        load_weather(forecasts, client, 'test', 'cast_temp')
-        
-        # if the api request rate is greater than 60 just keep going. Otherwise check how many requests have been made
-        # and if it's more than 120 start make_instants.
-        if n/2 / (time.time()-start_time) <= 1:
-            i+=1
-            continue
-        else:
-            i+=1
-            if n>=120:
-                make_instants(client)
-                if time.time() - start_time < 60:
-                    print(f'Waiting {start_time+60 - time.time()} seconds before resuming API calls.')
-                    time.sleep(start_time - time.time() + 60)
-                    start_time = time.time()
-                n = 0
+    i = collect_and_load(codes, client, 'test', after_batch=lambda: make_instants(client)) # zipcodes processed
 
     # sort the last of the documents in temp collections
     try:
@@ -73,6 +45,8 @@ if __name__ == '__main__':
         directory = os.path.join(os.environ['HOME'], 'data', 'forecast-forecast')
         filename = os.path.join(directory, 'ETL', 'Extract', 'resources', 'success_zipsNC.csv')
         codes = read_list_from_file(filename)
-    client = MongoClient(host=host, port=port)
+    client = db_pool.client_for('local')
+    ensure_indexes(client, 'test')
     get_and_make(codes)
-    client.close()
\ No newline at end of file
+    db_pool.close()
+    pool.close() # close the keep-alive sessions to the weather API
\ No newline at end of file
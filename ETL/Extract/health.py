@@ -0,0 +1,145 @@
+''' Health tracking for the zipcodes. A zipcode that OWM does not know raises NotFoundError (or comes back empty and
+raises AttributeError) in get_current_weather() on every run, and every run spends a call on it. Here each zipcode's
+failures are kept in resources/zip_health.json; after quarantine_after failures in a row it is quarantined and left out
+of the runs, and the quarantined zipcodes are written to resources/fail_zips.csv. A quarantined zipcode is probed again
+after reprobe_after seconds, twice as long after each probe that fails, and a probe that succeeds puts it back in the
+active set. The zipcodes already listed in fail_zips.csv are taken as quarantined when the health file is loaded, so
+the list is kept rather than written over. '''
+
+import os
+import json
+import time
+import threading
+
+from request_and_load import read_list_from_file
+
+try:
+    from config import quarantine_after     # failures in a row before a zipcode is quarantined
+except ImportError:
+    quarantine_after = 3
+try:
+    from config import reprobe_after    # seconds before a quarantined zipcode is first tried again
+except ImportError:
+    reprobe_after = 7*86400
+
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+filename = os.path.join(directory, 'zip_health.json')
+fail_zips = os.path.join(directory, 'fail_zips.csv')
+
+
+def write_list_to_file(codes, filename):
+    ''' Write a list of zipcodes to a csv file in the form read_list_from_file() reads. '''
+
+    temp = f'{filename}.tmp'
+    with open(temp, 'w') as f:
+        f.write(','.join(codes))
+    os.replace(temp, filename)
+
+
+class LocationHealth:
+    ''' The failure history of each zipcode that has failed. '''
+
+    def __init__(self, filename=filename, fail_zips=fail_zips, after=quarantine_after, reprobe=reprobe_after):
+        '''
+        :param filename: the path to the health file
+        :type filename: string
+        :param fail_zips: the path to the csv the quarantined zipcodes are written to
+        :type fail_zips: string
+        :param after: failures in a row before a zipcode is quarantined
+        :type after: int
+        :param reprobe: seconds before a quarantined zipcode is first tried again
+        :type reprobe: float
+        '''
+
+        self.filename = filename
+        self.fail_zips = fail_zips
+        self.after = after
+        self.reprobe = reprobe
+        self.lock = threading.Lock()
+        try:
+            with open(filename, 'r') as f:
+                self.zips = json.load(f)
+        except FileNotFoundError:
+            self.zips = {}
+        try:
+            self.seed([code for code in read_list_from_file(fail_zips) if code])
+        except FileNotFoundError:
+            pass    # nothing has been quarantined yet
+
+    def seed(self, codes, now=None):
+        ''' Quarantine the zipcodes that have no health yet, ie the ones listed in fail_zips.csv before it was kept
+        by this class. They are probed again reprobe seconds from now, like any newly quarantined zipcode.
+
+        :param codes: a list of zipcodes
+        :type codes: list
+        '''
+        now = int(now or time.time())
+        for code in codes:
+            if code not in self.zips:
+                self.zips[code] = {'failures': self.after, 'quarantined': now, 'probes': 0,
+                                   'last_error': 'listed in fail_zips.csv', 'last_failed': now}
+
+    def failed(self, code, error):
+        ''' Record a failure for the zipcode, quarantining it if it has failed too many times in a row.
+
+        :param code: the zipcode
+        :type code: string
+        :param error: the error raised
+        :type error: Exception
+        '''
+        now = int(time.time())
+        with self.lock:
+            health = self.zips.setdefault(code, {'failures': 0, 'quarantined': None, 'probes': 0})
+            health['failures'] += 1
+            health['last_error'] = f'{type(error).__name__}: {error}'
+            health['last_failed'] = now
+            if health['quarantined']:
+                health['probes'] += 1
+                health['quarantined'] = now
+            elif health['failures'] >= self.after:
+                print(f'quarantining {code} after {health["failures"]} failures in a row')
+                health['quarantined'] = now
+
+    def succeeded(self, code):
+        ''' Clear the zipcode's failures, taking it out of quarantine if it was in. '''
+
+        with self.lock:
+            health = self.zips.pop(code, None)
+        if health and health['quarantined']:
+            print(f'{code} answered its probe; back in the active set')
+
+    def due(self, code, now):
+        ''' Whether the quarantined zipcode is due to be probed again. '''
+
+        health = self.zips[code]
+        return now >= health['quarantined'] + self.reprobe * 2**health['probes']
+
+    def active(self, codes, now=None):
+        ''' The zipcodes to collect: those that are not quarantined, and the quarantined ones due for a probe.
+
+        :param codes: a list of zipcodes
+        :type codes: list
+
+        :return: the zipcodes
+        :type: list
+        '''
+        now = now or time.time()
+        with self.lock:
+            quarantined = {code for code, health in self.zips.items() if health['quarantined']}
+            probes = {code for code in quarantined if self.due(code, now)}
+        left_out = sum(code in quarantined and code not in probes for code in codes)
+        if left_out or probes:
+            print(f'leaving out {left_out} quarantined zipcodes and probing {len(probes & set(codes))} again')
+        return [code for code in codes if code not in quarantined or code in probes]
+
+    def save(self):
+        ''' Write the health file and fail_zips.csv. '''
+
+        with self.lock:
+            zips = json.loads(json.dumps(self.zips))
+        temp = f'{self.filename}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(zips, f, indent=0, sort_keys=True)
+        os.replace(temp, self.filename)
+        write_list_to_file(sorted(code for code, health in zips.items() if health['quarantined']), self.fail_zips)
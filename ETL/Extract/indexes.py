@@ -0,0 +1,175 @@
+''' The indexes of every collection, declared in one place and made once when a process starts. make_instants() used to
+create its index on instant_temp on every pass, and nothing else had one. Now every index the queries need is declared
+below, and ensure_indexes() reconciles the database with them at the start of a run: a missing index is made, one
+whose keys or options have changed is dropped and made again, and an index that is not declared is reported but left
+alone. The collections that are only ever read whole or by _id (cast_temp, obs_temp and the archives) are not given
+any other index, so their inserts stay cheap. The quota ledger's indexes are made wherever quota.py keeps the ledger,
+which can be another database or server. After reconciling, the hot-path queries are explained and any that would
+still scan the whole collection is reported. To reconcile and check a database by hand
+
+    python indexes.py [database]
+'''
+
+import sys
+
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from quota import ledger_collection
+
+try:
+    from config import index_check  # explain the hot-path queries once the indexes are made
+except ImportError:
+    index_check = True
+
+instant_indexes = [
+    IndexModel([('instant', DESCENDING)]),     # make_instants(), sweep()
+    IndexModel([('zipcode', ASCENDING), ('instant', ASCENDING)], name='zipcode_instant', unique=True),
+    # the last observation of each zipcode, for the Prioritizer
+    IndexModel([('zipcode', ASCENDING), ('instant', DESCENDING)], name='observed',
+               partialFilterExpression={'weather': {'$exists': True}}),
+]
+
+indexes = {
+    'instant_temp': instant_indexes,
+    'legit_inst': instant_indexes[:2],
+    'work_queue': [
+        IndexModel([('instant', ASCENDING), ('state', ASCENDING), ('lease_until', ASCENDING)]),  # claims and leases
+        IndexModel([('instant', ASCENDING), ('zipcode', ASCENDING)]),  # completing and releasing a worker's tasks
+    ],
+    'dead_letters': [IndexModel([('instant', ASCENDING), ('zipcode', ASCENDING)])],
+    'quota_ledger': [IndexModel([('expires', ASCENDING)], expireAfterSeconds=0)],   # old minutes are cleared by MongoDB
+}
+
+# the queries on the path of every run, as the collection, what makes it, the filter and the sort
+hot_paths = [
+    ('instant_temp', 'sweep()', {'instant': {'$lt': 0}}, None),
+    ('instant_temp', 'two-field upserts', {'zipcode': '27006', 'instant': 0}, None),
+    ('instant_temp', 'Prioritizer pending instants', {'zipcode': {'$in': ['27006']}, 'instant': {'$gt': 0}}, None),
+    ('instant_temp', 'Prioritizer last observations', {'zipcode': {'$in': ['27006']}, 'weather': {'$exists': True}},
+     None),
+    ('legit_inst', 'instants by zipcode', {'zipcode': '27006', 'instant': {'$gt': 0}}, None),
+    ('work_queue', 'WorkQueue.claim()', {'instant': 0, 'claims': {'$lt': 3},
+                                         '$or': [{'state': 'pending'}, {'state': 'leased', 'lease_until': {'$lt': 0}}]},
+     None),
+    ('work_queue', 'WorkQueue.reap()', {'instant': 0, 'state': 'leased', 'claims': {'$gte': 3},
+                                        'lease_until': {'$lt': 0}}, None),
+    ('work_queue', 'WorkQueue.complete()', {'instant': 0, 'zipcode': {'$in': ['27006']}, 'owner': ''}, None),
+    ('work_queue', 'WorkQueue.held_elsewhere()', {'instant': 0, 'state': 'leased', 'claims': {'$lt': 3}},
+     {'lease_until': 1}),
+    ('dead_letters', 'dead_letters()', {'instant': 0}, None),
+    ('dead_letters', 'clear_dead_letters()', {'instant': 0, 'zipcode': {'$in': ['27006']}}, None),
+]
+
+options = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds')
+
+
+def same_index(existing, spec):
+    ''' Whether an index in the database, as given by index_information(), is the one declared.
+
+    :param existing: the index in the database
+    :type existing: dict
+    :param spec: the declared index, as IndexModel.document
+    :type spec: dict
+
+    :return: whether the keys and options match
+    :type: bool
+    '''
+    if [(field, int(direction)) for field, direction in existing['key']] != list(spec['key'].items()):
+        return False
+    return all(existing.get(option) == spec.get(option) for option in options)
+
+def collection_for(client, database, collection):
+    ''' The collection to make the declared indexes on. The quota ledger is kept where quota.py says. '''
+
+    if collection == 'quota_ledger':
+        return ledger_collection(client)
+    return client[database][collection]
+
+def ensure_indexes(client, database='test', check=index_check):
+    ''' Reconcile the indexes of the database with the ones declared, ie at the start of a run.
+
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+    :param check: report the hot-path queries that would scan a whole collection
+    :type check: bool
+
+    :return: the collection and name of each index made
+    :type: list of 2-tuples
+    '''
+    made = []
+    for collection, models in indexes.items():
+        col = collection_for(client, database, collection)
+        existing = col.index_information()
+        for model in models:
+            spec = model.document
+            name = spec['name']
+            if name in existing:
+                if same_index(existing[name], spec):
+                    continue
+                print(f'the index {name} on {col.full_name} has changed; making it again')
+                col.drop_index(name)
+            try:
+                col.create_indexes([model])
+            except OperationFailure as e:
+                # ie duplicate documents under a new unique index, see instant_key.py
+                print(f'could not make the index {name} on {col.full_name}: {e}')
+                continue
+            made.append((collection, name))
+        declared = {model.document['name'] for model in models} | {'_id_'}
+        for name in set(existing) - declared:
+            print(f'{col.full_name} has the index {name}, which is not declared in indexes.py')
+    if made:
+        print(f'made {len(made)} indexes: {", ".join(f"{collection}.{name}" for collection, name in made)}')
+    if check:
+        check_hot_paths(client, database)
+    return made
+
+def stages(plan):
+    ''' All the stages of a query plan, from the top down. '''
+
+    found = [plan['stage']]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            found += stages(child)
+    return found
+
+def check_hot_paths(client, database='test'):
+    ''' Explain each hot-path query and report the ones the query planner would answer with a COLLSCAN. Only the plan
+    is asked for, so nothing is read from the collections.
+
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+
+    :return: the collection and name of each query that would scan its collection
+    :type: list of 2-tuples
+    '''
+    db = client[database]
+    scans = []
+    for collection, name, filters, sort in hot_paths:
+        find = {'find': collection, 'filter': filters}
+        if sort:
+            find['sort'] = sort
+        try:
+            plan = db.command('explain', find, verbosity='queryPlanner')['queryPlanner']['winningPlan']
+        except (OperationFailure, NotImplementedError, KeyError) as e:
+            print(f'could not explain {name} on {collection}: {e}')
+            continue
+        if 'COLLSCAN' in stages(plan):
+            scans.append((collection, name))
+            print(f'{name} scans all of {database}.{collection}: {" <- ".join(stages(plan))}')
+    return scans
+
+
+if __name__ == '__main__':
+    import db_pool
+
+    client = db_pool.client_for('local')
+    try:
+        ensure_indexes(client, sys.argv[1] if len(sys.argv) > 1 else 'test', check=True)
+    finally:
+        db_pool.close()
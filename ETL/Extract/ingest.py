@@ -0,0 +1,94 @@
+''' Direct ingest of the collected locations into instant_temp. Normally each forecast is inserted to cast_temp, read
+back by make_instants(), unwound into an upsert for each of its 40 casts, copied to cast_archive and deleted from
+cast_temp, and each observation goes the same way through obs_temp. With direct_ingest = True in config the Loader
+turns the forecast and observation straight into the upserts into instant_temp and writes them in bulk, so nothing is
+staged in the temp collections and make_instants() has nothing left to do for them. The documents still go to
+cast_archive and obs_archive as they did, but from a background Archiver thread, off the path of the loading. '''
+
+import queue
+import threading
+
+from bulk import BulkLoader, bulk_size
+
+try:
+    from config import direct_ingest    # load straight into instant_temp rather than through cast_temp and obs_temp
+except ImportError:
+    direct_ingest = False
+
+STOP = object()     # put on the archive queue once the loading is done
+
+
+def ingest(bulk, current=None, forecasts=None, collection='instant_temp'):
+    ''' Buffer the upserts of a location's observation and forecasts into their instants.
+
+    :param bulk: the bulk loader for the database
+    :type bulk: bulk.BulkLoader
+    :param current: the current weather as returned by get_current_weather()
+    :type current: dict
+    :param forecasts: the forecasts as returned by five_day()
+    :type forecasts: dict
+    :param collection: the instant collection
+    :type collection: str
+    '''
+    # the upserts take the zipcode and instant out of what they are given, so they are given copies
+    if current:
+        bulk.add(dict(current, Weather=dict(current['Weather'])), collection)
+    if forecasts:
+        for cast in forecasts['weathers']:
+            bulk.add(dict(cast), collection)
+
+
+class Archiver:
+    ''' Writes the collected documents to obs_archive and cast_archive from a background thread. Use it as a context
+    manager: leaving the block waits for what is queued to be written.
+    '''
+
+    def __init__(self, client, database='test', size=bulk_size):
+        '''
+        :param client: a MongoClient instance
+        :type client: pymongo.MongoClient
+        :param database: the database to be used
+        :type database: str
+        :param size: documents written to an archive in one go
+        :type size: int
+        '''
+
+        self.bulk = BulkLoader(client, database, size=size)
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.drain, name='archiver', daemon=True)
+
+    def put(self, current=None, forecasts=None):
+        ''' Queue a location's documents to be archived. '''
+
+        self.queue.put((current, forecasts))
+
+    def drain(self):
+        while True:
+            item = self.queue.get()
+            if item is STOP:
+                break
+            if self.error:
+                continue
+            current, forecasts = item
+            try:
+                if current:
+                    self.bulk.add(current, 'obs_archive')
+                if forecasts:
+                    self.bulk.add(forecasts, 'cast_archive')
+            except Exception as e:
+                print(f'got {type(e).__name__} archiving; the rest of the documents are not archived')
+                self.error = e
+        try:
+            self.bulk.close()
+        except Exception as e:
+            print(f'got {type(e).__name__} archiving the last documents')
+            self.error = self.error or e
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.queue.put(STOP)
+        self.thread.join()
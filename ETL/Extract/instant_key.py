@@ -0,0 +1,124 @@
+''' The canonical key of an instant document. The instant documents used to be found by a {'zipcode', 'instant'} filter
+on an index of the instant alone, so every upsert scanned all the zipcodes of its instant, and two writers upserting
+the same new instant at once could both insert it. Now the _id of an instant document is made from its location and
+its instant, the same way everywhere it is written, so every upsert is a lookup on _id and two writers of a new instant
+collide on the _id instead of making two documents. A unique index on zipcode and instant keeps it that way for any
+writer still filtering on the two fields. The location and instant are joined with a '-', since neither has a fixed
+width. Instants made before the _id was canonical, including the ones already copied to legit_inst, are rekeyed with
+
+    python instant_key.py [--remote] [database] [collection ...]
+
+which rekeys every instant collection in the database if no collection is given, on the remote server with --remote.
+'''
+
+import sys
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+instant_collections = ('instant', 'test_instants', 'instant_temp', 'legit_inst')   # the collections of instant documents
+
+
+def slot(reference_time):
+    ''' The instant an observation taken at the reference time belongs to: the end of its 3 hour window. '''
+
+    return 10800*(int(reference_time)//10800 + 1)
+
+def instant_id(location, instant):
+    ''' The _id of the instant document for a location and instant.
+
+    :param location: the zipcode, or whatever else the location is known by
+    :type location: string
+    :param instant: the instant, ie 1593201600
+    :type instant: int
+
+    :return: the _id, ie '27006-1593201600'
+    :type: string
+    '''
+    return f'{location}-{int(instant)}'
+
+def upsert_for(filters, updates):
+    ''' Turn the {'zipcode', 'instant'} filter of an upsert into an instant document into the filter on its _id, with
+    the zipcode and instant set on the document if the upsert inserts it. Filters on anything else are left as they are.
+
+    :param filters: the filter of the upsert
+    :type filters: dict
+    :param updates: the update of the upsert
+    :type updates: dict
+
+    :return: the filter and the update
+    :type: 2-tuple of dicts
+    '''
+    if set(filters) != {'zipcode', 'instant'}:
+        return filters, updates
+    updates = dict(updates)
+    updates['$setOnInsert'] = dict(updates.get('$setOnInsert', {}), **filters)
+    return {'_id': instant_id(filters['zipcode'], filters['instant'])}, updates
+
+def unique_index(col):
+    ''' Make sure of the unique index on zipcode and instant. The index cannot be made while the collection still has
+    two documents for the same zipcode and instant; they are merged by rekey() first.
+
+    :param col: an instant collection
+    :type col: pymongo.collection.Collection
+
+    :return: whether the index is there
+    :type: bool
+    '''
+    try:
+        col.create_index([('zipcode', 1), ('instant', 1)], unique=True, name='zipcode_instant')
+    except OperationFailure as e:
+        print(f'could not make the unique index on {col.name}: {e}. Run instant_key.py to rekey the instants.')
+        return False
+    return True
+
+def rekey(col):
+    ''' Move every instant document whose _id is not the canonical one to the canonical _id, merging the documents for
+    the same zipcode and instant. The canonical document is written before the old one is deleted, so a rekey that
+    stops partway never loses a document. If the unique index is already there the old document holds the zipcode and
+    instant, so the canonical one is written without them and given them once the old one is gone.
+
+    :param col: an instant collection
+    :type col: pymongo.collection.Collection
+
+    :return: the number of documents moved
+    :type: int
+    '''
+    n = 0
+    for doc in col.find({'zipcode': {'$exists': True}, 'instant': {'$exists': True}}):
+        _id = instant_id(doc['zipcode'], doc['instant'])
+        if doc['_id'] == _id:
+            continue
+        updates = {'$setOnInsert': {'zipcode': doc['zipcode'], 'instant': doc['instant']}}
+        if doc.get('forecasts'):
+            updates['$push'] = {'forecasts': {'$each': doc['forecasts']}}
+        if 'weather' in doc:
+            updates['$set'] = {'weather': doc['weather']}
+        try:
+            col.update_one({'_id': _id}, updates, upsert=True)
+        except DuplicateKeyError:
+            updates['$setOnInsert'] = {'rekeyed_from': doc['_id']}
+            col.update_one({'_id': _id}, updates, upsert=True)
+            col.delete_one({'_id': doc['_id']})
+            col.update_one({'_id': _id}, {'$set': {'zipcode': doc['zipcode'], 'instant': doc['instant']},
+                                          '$unset': {'rekeyed_from': ''}})
+        else:
+            col.delete_one({'_id': doc['_id']})
+        n += 1
+    return n
+
+
+if __name__ == '__main__':
+    import db_pool
+
+    args = sys.argv[1:]
+    target = 'remote' if '--remote' in args else 'local'    # legit_inst is on the remote server in production
+    args = [arg for arg in args if arg != '--remote']
+    database = args[0] if args else 'test'
+    client = db_pool.client_for(target)
+    collections = args[1:] or [collection for collection in client[database].list_collection_names()
+                               if collection in instant_collections]
+    for collection in collections:
+        col = client[database][collection]
+        print(f'rekeyed {rekey(col)} documents in {database}.{collection}')
+        unique_index(col)
+    db_pool.close()
@@ -15,6 +15,9 @@ from urllib.parse import quote
 
 from config import user, password, socket_path
 
+from instant_key import upsert_for
+from db_pool import client_for
+
 
 # use the local host and port for all the primary operations
 port = 27017
@@ -26,39 +29,18 @@ print(f'from Extract.config {uri}')
 
 
 def Client(host=None, port=None, uri=None):
-    ''' Create and return a pymongo MongoClient object. Connect with the given parameters if possible, switch to local if the
-    remote connection is not possible, using the default host and port.
+    ''' Get the process's pooled MongoClient (see db_pool.py): the local one if a host and port are given, otherwise the
+    remote one, which is the local one again if the remote server cannot be resolved. The client is shared, and
+    connects on its first operation.
     
-    :param host: the local host to be used. defaults within to localhost
+    :param host: the local host to be used. the one in config is used
     :type host: sting
-    :param port: the local port to be used. defaults within to 27017
+    :param port: the local port to be used. the one in config is used
     :type port: int
-    :param uri: the remote server URI. must be uri encoded
+    :param uri: the remote server URI. the one in config is used
     type uri: uri encoded sting'''
     
-    if host and port:
-        try:
-            client = MongoClient(host=host, port=port)
-            return client
-        except ConnectionFailure:
-            # connect to the remote server if a valid uri is given
-            if uri:
-                print('caught ConnectionFailure on local server. Trying to make it with remote')
-                client = MongoClient(uri)
-                print(f'established remote MongoClient on URI={uri}')
-                return client
-            print('caught ConnectionFailure on local server. Returning None')
-            return None
-    elif uri:
-        # verify that the connection with the remote server is active and switch to the local server if it's not
-        try:
-            client = MongoClient(uri)
-            return client
-        except ConfigurationError:
-            print(f'Caught configurationError in client() for URI={uri}. It was likely triggered by a DNS timeout.')
-            client = MongoClient(host=host, port=port)
-            print('connection made with local server, even though you asked for the remote server')
-            return client
+    return client_for('local' if host and port else 'remote')
 
 def dbncol(client, collection, database='test'):
     ''' Make a connection to the database and collection given in the arguments.
@@ -98,7 +80,7 @@ def find_data(client, database, collection, filters={}):
     col = Collection(db, collection)
     return col.find(filters).batch_size(100)
 
-def load_weather(data, client, database, collection):
+def load_weather(data, client, database, collection, loader=None):
     ''' Load data to specified database collection. This determines the appropriate way to process the load depending on the
     collection to which it should be loaded. Data is expected to be a weather-type dictionary. When the collection is "instants"
     the data is appended the specified object's forecasts array in the instants collection; when the collection is either
@@ -113,7 +95,11 @@ def load_weather(data, client, database, collection):
     :type database: str
     :param collection: the database collection to be used
     :type collection: str
+    :param loader: buffer the write in the bulk loader rather than making it now (see bulk.py)
+    :type loader: bulk.BulkLoader
     ''' 
+    if loader is not None:
+        return loader.add(data, collection)
     col = dbncol(client, collection, database=database)
     # decide how to handle the loading process depending on where the document will be loaded.
     if collection == 'instant' or collection == 'test_instants':
@@ -124,7 +110,7 @@ def load_weather(data, client, database, collection):
             updates = {'$push': {'forecasts': data}} # append the forecast object to the forecasts list
         try:
             filters = {'zipcode': data.pop('zipcode'), 'instant': data.pop('instant')}
-            col.find_one_and_update(filters, updates,  upsert=True)
+            col.find_one_and_update(*upsert_for(filters, updates),  upsert=True)
         except DuplicateKeyError:
             return(f'DuplicateKeyError, could not insert data into {collection}.')
         except KeyError:
@@ -172,7 +158,7 @@ def update_command_for(data):
     else:
         filters = {'zipcode': data.pop('zipcode'), 'instant': data.pop('instant')}
         updates = {'$push': {'forecasts': data}} # append the forecast object to the forecasts list
-    return UpdateOne(filters, updates,  upsert=True)
+    return UpdateOne(*upsert_for(filters, updates),  upsert=True)
 
 def delete_command_for(data):
     ''' the 'delete command' is the MongoDB command that is used to update data should be a weather type object. it will have its filter and update set according to the entry content. It
@@ -277,7 +263,7 @@ def copy_docs(col, destination_db, destination_col, filters={}, delete=False):
     :type filters: dict
     '''
 
-    client = Client(host=host, port=port)
+    client = client_for('local')
     copy = []
     n=0
     original = col.find(filters)
@@ -300,7 +286,6 @@ def make_instants(client):
     inst_col = dbncol(client, "instant_temp", database=database)
     forecasts = cast_col.find({})
     observations = obs_col.find({})
-    inst_col.create_index([('instant', pymongo.DESCENDING)])
     inst_col.bulk_write(make_load_list_from_cursor(forecasts))
     inst_col.bulk_write(make_load_list_from_cursor(observations))
 
@@ -308,5 +293,11 @@ def make_instants(client):
     copy_docs(obs_col, database, 'obs_archive', delete=True)
 
 
-client = Client(host=host, port=port)
-remote_client = Client(uri)
\ No newline at end of file
+def __getattr__(name):
+    ''' The module's client and remote_client, from the pool on first use rather than made on import. '''
+
+    if name == 'client':
+        return client_for('local')
+    if name == 'remote_client':
+        return client_for('remote')
+    raise AttributeError(f'module {__name__} has no attribute {name}')
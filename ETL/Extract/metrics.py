@@ -0,0 +1,220 @@
+''' Instrumentation for the weather API calls. Every call the fetch engine makes is timed and counted by endpoint, API
+key and outcome: 'ok', or the name of the error it raised, ie APICallTimeoutError for timeouts and
+APIInvalidSSLCertificateError for SSL and connection errors. The time each call waited for its key and a free slot,
+the retries and the bytes received are counted too. At the end of a run the counts are written to resources/metrics as
+JSON, or in the Prometheus text format for the node exporter's textfile collector, so it can be seen where the
+collection time goes. Set metrics_format in config to 'json', 'prometheus' or None for no snapshots. Only the latest
+metrics_keep JSON snapshots are kept; the Prometheus file is overwritten by each run. '''
+
+import os
+import glob
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+
+from quota import key_id
+
+try:
+    from config import metrics_format   # 'json', 'prometheus' or None
+except ImportError:
+    metrics_format = 'json'
+try:
+    from config import metrics_dir
+except ImportError:
+    metrics_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'metrics')
+try:
+    from config import metrics_keep     # the number of JSON snapshots kept
+except ImportError:
+    metrics_keep = 56   # a week of runs every 3 hours
+
+buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)     # upper bounds of the latency histogram, in seconds
+
+
+class Histogram:
+    ''' Counts of observations under each bucket bound, with their sum. '''
+
+    def __init__(self, bounds=buckets):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds) + 1)    # the last one is for everything over the last bound
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        ''' The number of observations at or under each bound, and under +Inf. '''
+
+        total, counts = 0, []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return dict(zip([str(bound) for bound in self.bounds] + ['+Inf'], counts))
+
+
+class Metrics:
+    ''' The call metrics for one run. Safe to use from the executor threads and the event loop at once. '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        ''' Clear the metrics, ie at the start of a run. '''
+
+        with self.lock:
+            self.started = time.time()
+            self.latency = {}   # a histogram for each (endpoint, key, outcome)
+            self.waiting = {}   # a histogram of the time waited for a key and a slot, for each endpoint
+            self.retries = {}   # the number of retries for each endpoint
+            self.received = {}  # the bytes received for each (endpoint, key)
+
+    def call(self, endpoint, key, outcome, seconds):
+        ''' Record a finished API call.
+
+        :param endpoint: 'weather' or 'forecast'
+        :type endpoint: string
+        :param key: the API key the call was made with
+        :type key: string
+        :param outcome: 'ok' or the name of the error raised
+        :type outcome: string
+        :param seconds: the time the call took
+        :type seconds: float
+        '''
+        labels = (endpoint, key_id(key), outcome)
+        with self.lock:
+            if labels not in self.latency:
+                self.latency[labels] = Histogram()
+            self.latency[labels].observe(seconds)
+
+    def wait(self, endpoint, seconds):
+        ''' Record the time a call waited for its API key and a slot on it. '''
+
+        with self.lock:
+            if endpoint not in self.waiting:
+                self.waiting[endpoint] = Histogram()
+            self.waiting[endpoint].observe(seconds)
+
+    def retry(self, endpoint):
+        ''' Count a retry of a failed call. '''
+
+        with self.lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+    def response(self, resp, *args, **kwargs):
+        ''' Count the bytes of an HTTP response. Used as a requests response hook on the API sessions. '''
+
+        url = urlparse(resp.url)
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        key = parse_qs(url.query).get('APPID', [''])[0]
+        labels = (endpoint, key_id(key))
+        with self.lock:
+            self.received[labels] = self.received.get(labels, 0) + len(resp.content)
+
+    def snapshot(self):
+        ''' The metrics as a JSON-able dict. '''
+
+        with self.lock:
+            return {'started': self.started,
+                    'finished': time.time(),
+                    'calls': [{'endpoint': endpoint, 'key': key, 'outcome': outcome, 'count': h.count,
+                               'seconds': round(h.sum, 3), 'buckets': h.cumulative()}
+                              for (endpoint, key, outcome), h in sorted(self.latency.items())],
+                    'waiting': [{'endpoint': endpoint, 'count': h.count, 'seconds': round(h.sum, 3),
+                                 'buckets': h.cumulative()}
+                                for endpoint, h in sorted(self.waiting.items())],
+                    'retries': [{'endpoint': endpoint, 'count': n} for endpoint, n in sorted(self.retries.items())],
+                    'received': [{'endpoint': endpoint, 'key': key, 'bytes': n}
+                                 for (endpoint, key), n in sorted(self.received.items())]}
+
+    def prometheus(self):
+        ''' The metrics in the Prometheus text exposition format. '''
+
+        snapshot = self.snapshot()
+        lines = ['# HELP owm_request_seconds Time taken by the weather API calls.',
+                 '# TYPE owm_request_seconds histogram']
+        for call in snapshot['calls']:
+            labels = f'endpoint="{call["endpoint"]}",key="{call["key"]}",outcome="{call["outcome"]}"'
+            lines += [f'owm_request_seconds_bucket{{{labels},le="{bound}"}} {n}' for bound, n in call['buckets'].items()]
+            lines += [f'owm_request_seconds_sum{{{labels}}} {call["seconds"]}',
+                      f'owm_request_seconds_count{{{labels}}} {call["count"]}']
+        lines += ['# HELP owm_request_wait_seconds Time the calls waited for an API key and a slot on it.',
+                  '# TYPE owm_request_wait_seconds histogram']
+        for wait in snapshot['waiting']:
+            labels = f'endpoint="{wait["endpoint"]}"'
+            lines += [f'owm_request_wait_seconds_bucket{{{labels},le="{bound}"}} {n}'
+                      for bound, n in wait['buckets'].items()]
+            lines += [f'owm_request_wait_seconds_sum{{{labels}}} {wait["seconds"]}',
+                      f'owm_request_wait_seconds_count{{{labels}}} {wait["count"]}']
+        lines += ['# HELP owm_request_retries_total Retries of failed weather API calls.',
+                  '# TYPE owm_request_retries_total counter']
+        lines += [f'owm_request_retries_total{{endpoint="{retry["endpoint"]}"}} {retry["count"]}'
+                  for retry in snapshot['retries']]
+        lines += ['# HELP owm_response_bytes_total Bytes received from the weather API.',
+                  '# TYPE owm_response_bytes_total counter']
+        lines += [f'owm_response_bytes_total{{endpoint="{received["endpoint"]}",key="{received["key"]}"}} '
+                  f'{received["bytes"]}'
+                  for received in snapshot['received']]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory=metrics_dir, format=metrics_format):
+        ''' Write a snapshot of the metrics for the run.
+
+        :param directory: the directory to write it to
+        :type directory: string
+        :param format: 'json' or 'prometheus'. Nothing is written if it is None
+        :type format: string
+
+        :return: the path written to, or None
+        :type: string
+        '''
+        if not format:
+            return
+        os.makedirs(directory, exist_ok=True)
+        if format == 'prometheus':
+            data, filename = self.prometheus(), 'owm.prom'     # the textfile collector reads the latest one
+        else:
+            data, filename = json.dumps(self.snapshot(), indent=1), f'run-{int(self.started)}.json'
+        path = os.path.join(directory, filename)
+        temp = f'{path}.tmp'
+        with open(temp, 'w') as f:
+            f.write(data)
+        os.replace(temp, path)
+        print(f'metrics for the run written to {path}')
+        if format != 'prometheus':
+            prune(directory)
+        return path
+
+
+def prune(directory=metrics_dir, keep=metrics_keep):
+    ''' Remove all but the latest JSON snapshots.
+
+    :param directory: the directory the snapshots are in
+    :type directory: string
+    :param keep: the number of snapshots to keep
+    :type keep: int
+
+    :return: the number removed
+    :type: int
+    '''
+    def started(filename):
+        return os.path.basename(filename)[len('run-'):-len('.json')]
+
+    snapshots = sorted((filename for filename in glob.glob(os.path.join(directory, 'run-*.json'))
+                        if started(filename).isdigit()), key=lambda filename: int(started(filename)))
+    old = snapshots[:max(0, len(snapshots) - keep)]
+    for filename in old:
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass    # another run pruned it first
+    return len(old)
+
+
+metrics = Metrics()     # the metrics every FetchRun and API session in the process records to
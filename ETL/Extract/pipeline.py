@@ -0,0 +1,224 @@
+''' The load side of the extract pipeline. The fetch engine puts each location's current weather and forecasts on a
+bounded queue as soon as they come in, and a Loader thread drains the queue in batches and writes each batch to obs_temp
+and cast_temp in one bulk write per collection (see bulk.py), so the API calls and the database writes overlap instead
+of taking turns. The queue pushes back both ways: the loader waits when the queue is empty, and the fetches wait when it
+is full, which keeps a slow database from piling up the whole run in memory. Each stage counts what it did and how
+long it spent waiting on the other. With direct_ingest set in config the batches go straight into instant_temp instead
+(see ingest.py). '''
+
+import time
+import queue
+import asyncio
+import threading
+
+from request_and_load import load_weather
+from bulk import BulkLoader
+from ingest import ingest, Archiver, direct_ingest
+from versions import record_version
+
+try:
+    from config import queue_size   # the most locations waiting to be loaded
+except ImportError:
+    queue_size = 120
+try:
+    from config import load_batch   # the most locations loaded in one go
+except ImportError:
+    load_batch = 20
+
+STOP = object()     # put on the queue once the fetching is done
+
+
+class Stage:
+    ''' Throughput counters for one stage of the pipeline. '''
+
+    def __init__(self, name):
+        '''
+        :param name: the name of the stage for the printout, ie 'fetch'
+        :type name: string
+        '''
+
+        self.name = name
+        self.items = 0
+        self.docs = 0
+        self.waiting = 0    # seconds spent waiting on the queue
+        self.waiters = 0    # the fetches waiting on the queue right now
+        self.waiting_since = None
+        self.started = time.monotonic()
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def add(self, items, docs=0):
+        ''' Count locations (and the documents in them) that went through the stage. '''
+
+        self.items += items
+        self.docs += docs
+
+    def wait(self):
+        ''' Start waiting on the queue. Any number of fetches can be waiting at once, and the stage counts as waiting
+        while at least one of them is.
+        '''
+
+        with self.lock:
+            if not self.waiters:
+                self.waiting_since = time.monotonic()
+            self.waiters += 1
+
+    def resume(self):
+        ''' Stop waiting on the queue. '''
+
+        with self.lock:
+            self.waiters -= 1
+            if not self.waiters:
+                self.waiting += time.monotonic() - self.waiting_since
+
+    @property
+    def busy(self):
+        ''' Seconds the stage spent working rather than waiting on the queue. '''
+
+        return (self.finished or time.monotonic()) - self.started - self.waiting
+
+    def __str__(self):
+        rate = self.items / self.busy if self.busy > 0 else 0
+        docs = f' ({self.docs} documents)' if self.docs else ''
+        return (f'{self.name}: {self.items} locations{docs}, {self.busy:.1f}s busy, {self.waiting:.1f}s waiting on the '
+                f'queue, {rate:.1f} locations/s')
+
+
+class Loader:
+    ''' Loads the (current, forecasts) pairs put on its queue from a background thread. Use it as a context manager
+    around the fetching: leaving the block waits for the queue to be drained.
+    '''
+
+    def __init__(self, client, database='test', checkpoint=None, every=60, queue_size=queue_size,
+                 batch_size=load_batch, direct=direct_ingest, versions=None):
+        '''
+        :param client: a MongoClient instance
+        :type client: pymongo.MongoClient
+        :param database: the database to be used
+        :type database: str
+        :param checkpoint: called from the loader thread after every so many locations are loaded, ie to save the
+        caches and make instants
+        :type checkpoint: function
+        :param every: the number of locations loaded between checkpoints
+        :type every: int
+        :param queue_size: the most locations waiting to be loaded
+        :type queue_size: int
+        :param batch_size: the most locations taken off the queue at once
+        :type batch_size: int
+        :param direct: load the locations straight into instant_temp and archive them in the background
+        :type direct: bool
+        :param versions: the forecast versions to record the version of each location's forecast in once it is
+        written (see versions.py). A location that is never written leaves its version unrecorded
+        :type versions: dict
+        '''
+
+        self.client = client
+        self.database = database
+        self.checkpoint = checkpoint
+        self.every = every
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.fetched = Stage('fetch')
+        self.loaded = Stage('load')
+        self.bulk = BulkLoader(client, database)
+        self.archiver = Archiver(client, database) if direct else None
+        self.versions = versions
+        self.done = []  # the zipcodes loaded
+        self.error = None
+        self.thread = threading.Thread(target=self.drain, name='loader', daemon=True)
+
+    def __enter__(self):
+        if self.archiver:
+            self.archiver.__enter__()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.fetched.finished = time.monotonic()
+        self.queue.put(STOP)
+        self.thread.join()
+        if self.archiver:
+            self.archiver.__exit__(*exc)
+        print(self.fetched)
+        print(self.loaded)
+        if self.error and not exc[0]:
+            raise self.error
+
+    def put(self, result):
+        ''' Put a location on the queue from a thread, waiting while the queue is full. '''
+
+        self.fetched.wait()
+        self.queue.put(result)
+        self.fetched.resume()
+        self.fetched.add(1)
+
+    async def put_async(self, result):
+        ''' Put a location on the queue from the event loop, without holding up the loop while the queue is full. '''
+
+        try:
+            self.queue.put_nowait(result)
+            self.fetched.add(1)
+        except queue.Full:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.put, result)
+
+    def take(self):
+        ''' Wait for the next batch of locations on the queue.
+
+        :return: the batch, and whether the fetching is done
+        :type: 2-tuple
+        '''
+        self.loaded.wait()
+        batch = [self.queue.get()]
+        self.loaded.resume()
+        while len(batch) < self.batch_size and batch[-1] is not STOP:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch[-1] is STOP:
+            return batch[:-1], True
+        return batch, False
+
+    def load(self, batch):
+        ''' Load a batch of locations to obs_temp and cast_temp, with one bulk write to each, or to instant_temp when
+        loading directly. Either half of a location can be None, ie when only forecasts are being collected. Each
+        location may also carry the location and version of its forecast, which is recorded once the batch is written.
+        '''
+        for current, forecasts, *version in batch:
+            if self.archiver:
+                ingest(self.bulk, current, forecasts)
+                self.archiver.put(current, forecasts)
+                continue
+            if current:
+                load_weather(current, self.client, self.database, 'obs_temp', loader=self.bulk)
+            if forecasts:
+                load_weather(forecasts, self.client, self.database, 'cast_temp', loader=self.bulk)
+        self.bulk.flush()
+        for current, forecasts, *version in batch:
+            self.done.append(current['Weather']['zipcode'] if current else forecasts['zipcode'])
+            self.loaded.add(1, bool(current) + bool(forecasts))
+            if self.versions is not None and version and version[0]:
+                record_version(self.versions, *version[0])
+
+    def drain(self):
+        ''' The loader thread. If loading fails the rest of the queue is still drained, so the fetches are not left
+        waiting on a full queue, and the error is raised when the block is left.
+        '''
+        since = 0   # locations loaded since the last checkpoint
+        stop = False
+        while not stop:
+            batch, stop = self.take()
+            if self.error:
+                continue
+            try:
+                self.load(batch)
+                since += len(batch)
+                if self.checkpoint and since >= self.every:
+                    self.checkpoint()
+                    since = 0
+            except Exception as e:
+                print(f'got {type(e).__name__} loading {len(batch)} locations; dropping the rest of the queue')
+                self.error = e
+        self.loaded.finished = time.monotonic()
+        self.bulk.close()
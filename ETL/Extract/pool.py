@@ -0,0 +1,118 @@
+''' Long-lived weather API clients, one per API key. pyowm's HttpClient calls requests.get() for every request, so each
+call used to open a new connection and do a fresh TLS handshake, and get_current_weather() made a new OWM object on
+every call as well. Here each key gets a single requests.Session with a pool of keep-alive connections, and the OWM
+and RawOWM clients for the key are made once and share that session. '''
+
+import re
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pyowm import OWM
+from pyowm.commons.http_client import HttpClient
+from pyowm.exceptions import api_call_error, parse_response_error
+
+from raw import RawOWM, api_url, owm_url
+from metrics import metrics
+
+try:
+    from config import pool_connections    # keep-alive connections kept open per API key
+except ImportError:
+    pool_connections = 10
+
+
+sessions = {}   # the requests.Session for each API key
+clients = {}    # the OWM or RawOWM client for each (API key, raw) pair
+lock = threading.Lock()
+
+
+class PooledHttpClient(HttpClient):
+    ''' pyowm's HttpClient with its GET requests made on a pooled session rather than with requests.get(), and sent to
+    the api_url in config rather than the OWM url pyowm has built in.
+    '''
+
+    def __init__(self, session, url=api_url, **kwargs):
+        '''
+        :param session: the session for the API key
+        :type session: requests.Session
+        :param url: the root url of the API
+        :type url: string
+        '''
+
+        super().__init__(**kwargs)
+        self.session = session
+        self.url = url
+
+    def get_json(self, uri, params=None, headers=None):
+        ''' The same as HttpClient.get_json(), over the session. '''
+
+        if self.url != owm_url:
+            uri = re.sub(r'^https?://[^/]+/data/2\.5', self.url, uri)
+        try:
+            resp = self.session.get(uri, params=params, headers=headers,
+                                    timeout=self.timeout, verify=self.verify_ssl_certs)
+        except requests.exceptions.SSLError as e:
+            raise api_call_error.APIInvalidSSLCertificateError(str(e))
+        except requests.exceptions.ConnectionError as e:
+            raise api_call_error.APIInvalidSSLCertificateError(str(e))
+        except requests.exceptions.Timeout:
+            raise api_call_error.APICallTimeoutError('API call timeouted')
+        HttpClient.check_status_code(resp.status_code, resp.text)
+        try:
+            return resp.status_code, resp.json()
+        except ValueError:
+            raise parse_response_error.ParseResponseError('Impossible to parse API response data')
+
+
+def session_for(key, connections=pool_connections):
+    ''' Get the session for the API key, making it the first time the key is used.
+
+    :param key: the API key
+    :type key: string
+    :param connections: the number of keep-alive connections to keep open for the key
+    :type connections: int
+
+    :return: the session
+    :type: requests.Session
+    '''
+    with lock:
+        if key not in sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.hooks['response'].append(metrics.response)  # count the bytes received
+            sessions[key] = session
+        return sessions[key]
+
+def client_for(key, raw=False):
+    ''' Get the weather API client for the API key, making it the first time it is asked for.
+
+    :param key: the API key
+    :type key: string
+    :param raw: get the RawOWM client rather than the pyowm.OWM one
+    :type raw: bool
+
+    :return: the client
+    :type: pyowm.OWM or raw.RawOWM
+    '''
+    session = session_for(key)
+    with lock:
+        if (key, raw) not in clients:
+            if raw:
+                clients[key, raw] = RawOWM(key, session=session)
+            else:
+                owm = OWM(key)
+                owm._wapi = PooledHttpClient(session, cache=owm._wapi.cache)
+                clients[key, raw] = owm
+        return clients[key, raw]
+
+def close():
+    ''' Close all the sessions, ie at the end of a run. '''
+
+    with lock:
+        for session in sessions.values():
+            session.close()
+        sessions.clear()
+        clients.clear()
@@ -0,0 +1,149 @@
+''' Priorities for when the zip list is longer than the quota allows in one window. Rather than collecting in file order
+until the instant closes, the locations are ordered by what collecting them is worth: an instant is only complete with
+all 40 of its forecasts, so a location whose coming instants have every forecast so far is worth more the closer those
+instants are to 40, and a location that has not been observed for a while is worth more the longer it has been. The
+run then goes through them in that order in chunks, and after each chunk the throughput so far is used to work out how
+many of the rest can still be collected before the instant; the lowest valued ones that cannot are shed. '''
+
+import math
+import time
+
+from request_and_load import dbncol
+from ratelimit import calls_per_minute
+
+try:
+    from config import priority_chunk   # locations collected between estimates of the throughput
+except ImportError:
+    priority_chunk = 240
+try:
+    from config import staleness_weight     # the value of a location not observed for a day, next to a whole instant
+except ImportError:
+    staleness_weight = 1
+
+
+def expected_casts(instant, now):
+    ''' The number of forecasts an instant should have by now if none of its windows were missed.
+
+    :param instant: the instant
+    :type instant: int
+    :param now: the unix time
+    :type now: int
+
+    :return: the number of forecasts
+    :type: int
+    '''
+    return max(0, 40 - math.ceil((instant - now) / 10800))
+
+def instant_value(casts, instant, now):
+    ''' What the next forecast is worth to an instant: the share of 40 it brings the instant up to, or nothing if the
+    instant has already missed a forecast and can no longer be complete.
+    '''
+    if casts < expected_casts(instant, now):
+        return 0
+    return min(casts + 1, 40) / 40
+
+
+class Prioritizer:
+    ''' Orders the locations by value and keeps track of how many can still be collected before the deadline. '''
+
+    def __init__(self, client, database='test', keys=2, rate=calls_per_minute, now=None):
+        '''
+        :param client: a MongoClient instance
+        :type client: pymongo.MongoClient
+        :param database: the database the instants are in
+        :type database: str
+        :param keys: the number of API keys
+        :type keys: int
+        :param rate: the API quota for each key
+        :type rate: int
+        :param now: the unix time the run starts. defaults to now
+        :type now: int
+        '''
+
+        self.col = dbncol(client, 'instant_temp', database=database)
+        self.now = now or int(time.time())
+        self.deadline = 10800*(self.now//10800 + 1)    # observations after this belong to the next instant
+        self.rate = keys*rate/60 / 2  # locations per second, at two calls each, until there is a measured rate
+        self.collected = 0
+        self.elapsed = 0
+
+    def scores(self, codes):
+        ''' The value of collecting each of the zipcodes now.
+
+        :param codes: a list of zipcodes
+        :type codes: list
+
+        :return: the score for each zipcode
+        :type: dict
+        '''
+        scores = dict.fromkeys(codes, 0)
+        pending = self.col.aggregate([
+            {'$match': {'zipcode': {'$in': list(codes)}, 'instant': {'$gt': self.now}}},
+            {'$project': {'zipcode': 1, 'instant': 1, 'casts': {'$size': {'$ifNull': ['$forecasts', []]}}}}])
+        for doc in pending:
+            scores[doc['zipcode']] += instant_value(doc['casts'], doc['instant'], self.now)
+        observed = self.col.aggregate([
+            {'$match': {'zipcode': {'$in': list(codes)}, 'weather': {'$exists': True}}},
+            {'$group': {'_id': '$zipcode', 'last': {'$max': '$instant'}}}])
+        last = {doc['_id']: doc['last'] for doc in observed}
+        for code in codes:
+            days = (self.now - last[code]) / 86400 if code in last else 7    # never observed counts as a week
+            scores[code] += staleness_weight * min(days, 7)
+        return scores
+
+    def order(self, codes):
+        ''' The zipcodes from the most to the least valuable. Ties keep their order in the list. '''
+
+        scores = self.scores(codes)
+        return sorted(codes, key=lambda code: -scores[code])
+
+    def record(self, n, seconds):
+        ''' Add a chunk to the measured throughput.
+
+        :param n: the number of locations collected
+        :type n: int
+        :param seconds: the time it took
+        :type seconds: float
+        '''
+        self.collected += n
+        self.elapsed += seconds
+        if self.collected and self.elapsed > 0:
+            self.rate = self.collected / self.elapsed
+
+    def capacity(self, now=None):
+        ''' The number of locations that can still be collected before the deadline at the current throughput. '''
+
+        return max(0, int((self.deadline - (now or time.time())) * self.rate))
+
+
+def by_priority(codes, run, prioritizer, chunk=priority_chunk):
+    ''' Collect the zipcodes from the most valuable down, shedding the least valuable ones that there is no time for.
+
+    :param codes: a list of zipcodes
+    :type codes: list of five-digit valid strings of US zip codes
+    :param run: collects and loads a list of zipcodes and returns the ones loaded
+    :type run: function
+    :param prioritizer: the prioritizer for the run
+    :type prioritizer: Prioritizer
+    :param chunk: the number of locations collected between estimates of the throughput
+    :type chunk: int
+
+    :return: the number of zipcodes collected
+    :type: int
+    '''
+    queue = prioritizer.order(codes)
+    i = 0
+    while queue:
+        fits = prioritizer.capacity()
+        if fits < len(queue):
+            print(f'{len(queue)} locations left and time for about {fits}; shedding the {len(queue) - fits} least '
+                  f'valuable')
+            queue = queue[:fits]
+            if not queue:
+                break
+        start = time.time()
+        done = run(queue[:chunk])
+        prioritizer.record(len(queue[:chunk]), time.time() - start)
+        queue = queue[chunk:]
+        i += len(done)
+    return i
@@ -0,0 +1,230 @@
+''' Rate limiting for the weather API keys. Each key gets a token bucket that refills continuously at the key's quota, and
+the KeyScheduler hands each request to whichever key has the most tokens, so the calls are paced smoothly across all
+the keys at the quota ceiling instead of bursting and then sleeping to the next minute. Keys whose circuit breaker is
+open for the endpoint being called are passed over (see breaker.py), and with a QuotaLedger every call is also
+reserved against the quota shared with the other collecting processes (see quota.py). '''
+
+import asyncio
+import threading
+import time
+
+from config import OWM_API_key_loohoo as loohoo_key, OWM_API_key_masta as masta_key
+
+from breaker import Breakers, CircuitOpenError
+
+try:
+    from config import OWM_API_keys as extra_keys   # any API keys beyond loohoo and masta
+except ImportError:
+    extra_keys = []
+try:
+    from config import calls_per_minute     # the API quota for each key
+except ImportError:
+    calls_per_minute = 60
+try:
+    from config import burst    # the most calls a key can make back to back after sitting idle
+except ImportError:
+    burst = 5
+
+
+class TokenBucket:
+    ''' A token bucket for a single API key. Tokens are added at rate per second up to capacity, and each API call takes
+    one token.
+    '''
+
+    def __init__(self, rate, capacity):
+        '''
+        :param rate: the number of tokens added per second
+        :type rate: float
+        :param capacity: the most tokens the bucket can hold
+        :type capacity: int
+        '''
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        ''' Add the tokens earned since the last refill. '''
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def available(self):
+        ''' The number of tokens in the bucket right now. '''
+
+        with self.lock:
+            self.refill()
+            return self.tokens
+
+    def try_take(self):
+        ''' Take a token if there is one.
+
+        :return: True if a token was taken, False if the bucket is empty
+        '''
+
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def wait_time(self):
+        ''' The number of seconds until the next token is available. '''
+
+        with self.lock:
+            self.refill()
+            return max(0, (1 - self.tokens) / self.rate)
+
+
+class KeyScheduler:
+    ''' Hands out the API keys according to the token buckets: each request goes to the key with the most tokens, and
+    when every bucket is empty it waits for the first one to refill. Only keys whose breaker for the endpoint lets
+    calls through are considered.
+    '''
+
+    def __init__(self, keys=None, calls_per_minute=calls_per_minute, burst=burst, breakers=None, ledger=None):
+        '''
+        :param keys: the API keys to be scheduled. defaults to loohoo, masta and any extra keys in config
+        :type keys: list of strings
+        :param calls_per_minute: the API quota for each key
+        :type calls_per_minute: int
+        :param burst: the most calls a key can make back to back
+        :type burst: int
+        :param breakers: the circuit breakers for the keys. defaults to a new set of breakers
+        :type breakers: breaker.Breakers
+        :param ledger: the quota ledger shared with other processes. None to only pace this process
+        :type ledger: quota.QuotaLedger
+        '''
+
+        if keys is None:
+            keys = [loohoo_key, masta_key] + list(extra_keys)
+        self.buckets = {key: TokenBucket(calls_per_minute/60, burst) for key in keys}
+        self.breakers = breakers if breakers is not None else Breakers()
+        self.ledger = ledger
+        self.blocked = {}   # the time each key's quota in the ledger is used up until
+
+    @property
+    def keys(self):
+        ''' The API keys being scheduled. '''
+
+        return list(self.buckets)
+
+    def healthy(self, endpoint=None):
+        ''' The keys whose breaker lets calls through to the endpoint.
+
+        :param endpoint: 'weather' or 'forecast'. when None every key is healthy
+        :type endpoint: string
+
+        :return: the API keys
+        :type: list
+        '''
+
+        if endpoint is None:
+            return self.keys
+        keys = [key for key in self.buckets if self.breakers.get(key, endpoint).available]
+        if not keys:
+            raise CircuitOpenError(endpoint)
+        return keys
+
+    def take(self, endpoint=None):
+        ''' Take a token from the healthy key with the most capacity, without reserving it in the ledger.
+
+        :param endpoint: the endpoint the call is for
+        :type endpoint: string
+
+        :return: the API key, or None if every healthy bucket is empty or out of quota
+        '''
+
+        now = time.monotonic()
+        keys = [key for key in self.healthy(endpoint) if self.blocked.get(key, 0) <= now]
+        if not keys:
+            return
+        key = max(keys, key=lambda k: self.buckets[k].available)
+        if self.buckets[key].try_take():
+            return key
+
+    def settle(self, key, endpoint, reserved):
+        ''' Finish taking a token once it has been reserved in the ledger, or not.
+
+        :param key: the API key the token was taken from
+        :type key: string
+        :param endpoint: the endpoint the call is for
+        :type endpoint: string
+        :param reserved: whether the ledger had quota left for the call
+        :type reserved: bool
+
+        :return: the API key to make the call with, or None if it cannot be used after all
+        '''
+
+        if not reserved:
+            # other processes have used up the key for this minute. the token is lost, which only errs on the slow side
+            self.blocked[key] = time.monotonic() + self.ledger.wait_time()
+            return
+        if endpoint is not None:
+            breaker = self.breakers.get(key, endpoint)
+            if not breaker.available:   # tripped, or its probe taken, while the ledger was being asked
+                return
+            breaker.claim()
+        return key
+
+    def try_acquire(self, endpoint=None):
+        ''' Take a token from the healthy key with the most capacity, reserving it in the ledger.
+
+        :param endpoint: the endpoint the call is for
+        :type endpoint: string
+
+        :return: the API key to make the call with, or None if every healthy bucket is empty or out of quota
+        '''
+
+        key = self.take(endpoint)
+        if key is None:
+            return
+        return self.settle(key, endpoint, not self.ledger or self.ledger.reserve(key))
+
+    def reopens_in(self, endpoint):
+        ''' The number of seconds until the breaker of any key lets calls through to the endpoint again, 0 if one
+        already does. '''
+
+        return min(self.breakers.get(key, endpoint).wait_time() for key in self.buckets)
+
+    def next_token(self, endpoint=None):
+        ''' The number of seconds until any of the healthy keys has a token and quota left. '''
+
+        now = time.monotonic()
+        return min(max(self.buckets[key].wait_time(), self.blocked.get(key, 0) - now) for key in self.healthy(endpoint))
+
+    async def acquire(self, endpoint=None):
+        ''' Wait for a token on any of the healthy keys and take it. The ledger is a round trip to MongoDB, so the
+        reservation is made on a worker thread rather than holding up every other call on the event loop.
+
+        :param endpoint: the endpoint the call is for
+        :type endpoint: string
+
+        :return: the API key to make the call with
+        :type: string
+        '''
+
+        loop = asyncio.get_running_loop()
+        while True:
+            key = self.take(endpoint)
+            if key is not None:
+                reserved = not self.ledger or await loop.run_in_executor(None, self.ledger.reserve, key)
+                key = self.settle(key, endpoint, reserved)
+                if key is not None:
+                    return key
+                continue
+            await asyncio.sleep(self.next_token(endpoint))
+
+    def acquire_blocking(self, endpoint=None):
+        ''' The same as acquire() for code that is not running in an event loop. '''
+
+        key = self.try_acquire(endpoint)
+        while key is None:
+            time.sleep(self.next_token(endpoint))
+            key = self.try_acquire(endpoint)
+        return key
@@ -0,0 +1,217 @@
+''' A raw JSON client for the weather API. The pyowm path parses every response into pyowm's object model, dumps that
+back out with to_JSON() and parses it again with json.loads() before get_current_weather() and five_day() reshape it.
+RawOWM has the same methods the extract code calls on pyowm.OWM, but it parses the API body once, straight into the
+dict that to_JSON() would have produced. The parsing follows pyowm 2.10's weather_from_dictionary(), so documents come
+out the same either way. Turn it on with raw_mode = True in config. With raw_archive set in config to a directory, every
+successful response is also appended to a daily archive there, one JSON record per line, which backfill.py can load
+again. '''
+
+import os
+import json
+import time
+import threading
+
+import requests
+
+from pyowm.exceptions.api_call_error import APICallError, APICallTimeoutError, APIInvalidSSLCertificateError
+from pyowm.exceptions.api_response_error import NotFoundError, UnauthorizedError
+
+try:
+    from config import raw_mode    # use RawOWM rather than pyowm.OWM for the API calls
+except ImportError:
+    raw_mode = False
+owm_url = 'https://api.openweathermap.org/data/2.5'
+try:
+    from config import api_url     # the root url of the API, ie the replay server (see replay.py)
+except ImportError:
+    api_url = owm_url
+try:
+    from config import api_timeout     # seconds to wait on an API response
+except ImportError:
+    api_timeout = 10
+try:
+    from config import raw_archive     # the directory to archive the raw responses in, ie for backfill.py
+except ImportError:
+    raw_archive = None
+
+archive_lock = threading.Lock()  # the calls come from many threads, and their lines must not interleave
+
+
+def coords_name(lat, lon):
+    ''' The name a forecast is recorded under, ie '35.99,-80.44'. '''
+
+    return f'{round(float(lat), 4)},{round(float(lon), 4)}'
+
+def archive(endpoint, params, body, directory=raw_archive):
+    ''' Append a response to the day's archive, in the record format backfill.py reads.
+
+    :param endpoint: the API endpoint, ie 'weather' or 'forecast'
+    :type endpoint: string
+    :param params: the parameters of the call
+    :type params: dict
+    :param body: the parsed body of the response
+    :type body: dict
+    :param directory: the archive directory
+    :type directory: string
+    '''
+    if 'zip' in params:
+        name = params['zip'].split(',')[0]
+    elif 'lat' in params:
+        name = coords_name(params['lat'], params['lon'])
+    else:
+        name = None     # a group call, matched by the coordinates of each item
+    now = int(time.time())
+    line = json.dumps({'endpoint': endpoint, 'name': name, 'recorded_at': now, 'status': 200, 'body': body})
+    filename = os.path.join(directory, f'{time.strftime("%Y-%m-%d", time.gmtime(now))}.jsonl')
+    with archive_lock:
+        os.makedirs(directory, exist_ok=True)
+        with open(filename, 'a') as f:
+            f.write(line + '\n')
+
+
+def weather_from_raw(d):
+    ''' Make the weather dict pyowm's Weather.to_JSON() would give for one weather in an API response.
+
+    :param d: a single weather from the API, ie the body of a current weather response or an item of a forecast's list
+    :type d: dict
+
+    :return: the weather
+    :type: dict
+    '''
+    main = d.get('main', {})
+    sys = d.get('sys', {})
+    status = d['weather'][0] if d.get('weather') else {}
+    rain, snow = d.get('rain'), d.get('snow')
+    return {'reference_time': d['dt'],
+            'sunset_time': sys.get('sunset', 0),
+            'sunrise_time': sys.get('sunrise', 0),
+            'clouds': d.get('clouds', {}).get('all', 0),
+            'rain': {'all': rain} if isinstance(rain, (int, float)) else dict(rain or {}),
+            'snow': {'all': snow} if isinstance(snow, (int, float)) else dict(snow or {}),
+            'wind': dict(d.get('wind') or {}),
+            'humidity': main.get('humidity', 0),
+            'pressure': {'press': main.get('pressure'), 'sea_level': main.get('sea_level')},
+            'temperature': {'temp': main.get('temp'), 'temp_kf': main.get('temp_kf'),
+                            'temp_max': main.get('temp_max'), 'temp_min': main.get('temp_min')},
+            'status': status.get('main'),
+            'detailed_status': status.get('description'),
+            'weather_code': status.get('id'),
+            'weather_icon_name': status.get('icon'),
+            'visibility_distance': d.get('visibility'),
+            'dewpoint': d.get('dew_point'),
+            'humidex': d.get('humidex'),
+            'heat_index': d.get('heat_index')}
+
+def location_from_raw(d):
+    ''' Make the location dict pyowm's Location.to_JSON() would give.
+
+    :param d: the body of a current weather response, or the 'city' of a forecast response
+    :type d: dict
+
+    :return: the location
+    :type: dict
+    '''
+    country = d['country'] if 'country' in d else d.get('sys', {}).get('country')
+    return {'name': d.get('name'),
+            'coordinates': {'lon': d['coord']['lon'], 'lat': d['coord']['lat']},
+            'ID': d.get('id'),
+            'country': country}
+
+def observation_from_raw(payload, reception_time=None):
+    ''' Make the dict pyowm's Observation.to_JSON() would give for a current weather response.
+
+    :param payload: the parsed body of the response
+    :type payload: dict
+    :param reception_time: the unix time the response came in. defaults to now
+    :type reception_time: int
+
+    :return: the observation
+    :type: dict
+    '''
+    return {'reception_time': reception_time or int(time.time()),
+            'Location': location_from_raw(payload),
+            'Weather': weather_from_raw(payload)}
+
+def forecast_from_raw(payload, reception_time=None):
+    ''' Make the dict pyowm's Forecast.to_JSON() would give for a 3-hourly forecast response.
+
+    :param payload: the parsed body of the response
+    :type payload: dict
+    :param reception_time: the unix time the response came in. defaults to now
+    :type reception_time: int
+
+    :return: the forecast
+    :type: dict
+    '''
+    return {'interval': '3h',
+            'reception_time': reception_time or int(time.time()),
+            'Location': location_from_raw(payload['city']),
+            'weathers': [weather_from_raw(item) for item in payload['list']]}
+
+
+class RawOWM:
+    ''' A stand-in for pyowm.OWM for the calls the extract code makes. Its methods return the to_JSON() dicts rather
+    than pyowm objects.
+    '''
+
+    def __init__(self, API_key, url=api_url, timeout=api_timeout, session=None):
+        '''
+        :param API_key: the OWM API key
+        :type API_key: string
+        :param url: the root url of the API
+        :type url: string
+        :param timeout: seconds to wait on a response
+        :type timeout: int
+        :param session: the session to make the calls on. see pool.session_for()
+        :type session: requests.Session
+        '''
+
+        self.API_key = API_key
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def get(self, endpoint, **params):
+        ''' Make a call to the API and parse the body of the response. Errors are raised as the pyowm exceptions so the
+        retry handling in get_data_from_weather_api() works the same for both clients.
+
+        :param endpoint: the API endpoint, ie 'weather' or 'forecast'
+        :type endpoint: string
+
+        :return: the parsed body of the response
+        :type: dict
+        '''
+        params['APPID'] = self.API_key
+        try:
+            response = self.session.get(f'{self.url}/{endpoint}', params=params, timeout=self.timeout)
+        except requests.exceptions.SSLError as e:
+            raise APIInvalidSSLCertificateError(str(e), e)
+        except requests.exceptions.ConnectionError as e:
+            raise APIInvalidSSLCertificateError(str(e), e)   # pyowm raises this for connection errors too
+        except requests.exceptions.Timeout as e:
+            raise APICallTimeoutError(str(e), e)
+        if response.status_code == 404:
+            raise NotFoundError(f'{endpoint} {params.get("zip") or ""} not found')
+        if response.status_code == 401:
+            raise UnauthorizedError('invalid API key')
+        if response.status_code != 200:
+            raise APICallError(f'{response.status_code} from {endpoint}: {response.text}')
+        body = response.json()
+        if raw_archive:
+            archive(endpoint, {k: v for k, v in params.items() if k != 'APPID'}, body)
+        return body
+
+    def weather_at_zip_code(self, zipcode, country):
+        ''' Get the current weather at the zipcode. '''
+
+        return observation_from_raw(self.get('weather', zip=f'{zipcode},{country}'))
+
+    def weather_at_ids(self, ids):
+        ''' Get the current weather at each of the OWM city ids, in a single call. '''
+
+        return [observation_from_raw(item) for item in self.get('group', id=','.join(map(str, ids)))['list']]
+
+    def three_hours_forecast_at_coords(self, lat, lon, **kwargs):
+        ''' Get the 3-hourly forecast at the coordinates. '''
+
+        return forecast_from_raw(self.get('forecast', lat=lat, lon=lon))
@@ -0,0 +1,312 @@
+''' Offline stand-in for the weather API. record() captures real current weather and 3-hourly forecast responses to
+resources/replay, and ReplayServer serves them back over HTTP on localhost with a configurable latency, error rate and
+per-key rate limit, so extraction runs can be benchmarked and load tested without spending quota. Set api_url in config
+to the server's url, ie 'http://127.0.0.1:8025/data/2.5', and both the pyowm and the RawOWM clients call it instead of
+OWM.
+
+Replays are deterministic: a zipcode or pair of coordinates that was recorded always gets its own response, and one
+that was not gets one of the recorded responses picked by a hash of the request, with the forecast relabelled to the
+coordinates asked for. The times in each response are moved forward by whole 3 hour instants so an old recording
+still looks current.
+
+    python replay.py record [csv file of zipcodes]
+    python replay.py serve [--port 8025] [--latency 0.05] [--jitter 0.02] [--error-rate 0.01] [--calls-per-minute 60]
+'''
+
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from pyowm.exceptions.api_response_error import NotFoundError
+
+from config import OWM_API_key_loohoo as loohoo_key
+
+from raw import RawOWM, owm_url, coords_name
+from ratelimit import KeyScheduler, TokenBucket
+from request_and_load import read_list_from_file
+
+try:
+    from config import replay_dir   # where the recorded responses are kept
+except ImportError:
+    replay_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'replay')
+try:
+    from config import replay_port
+except ImportError:
+    replay_port = 8025
+
+
+def save(directory, endpoint, name, status, body):
+    ''' Write a recorded response to the replay directory.
+
+    :param directory: the replay directory
+    :type directory: string
+    :param endpoint: 'weather' or 'forecast'
+    :type endpoint: string
+    :param name: the zipcode or coordinates the response is for
+    :type name: string
+    :param status: the HTTP status of the response
+    :type status: int
+    :param body: the parsed body of the response
+    :type body: dict
+    '''
+    os.makedirs(os.path.join(directory, endpoint), exist_ok=True)
+    with open(os.path.join(directory, endpoint, f'{name}.json'), 'w') as f:
+        json.dump({'recorded_at': int(time.time()), 'status': status, 'body': body}, f)
+
+def record(codes, directory=replay_dir, key=loohoo_key):
+    ''' Record the current weather for each zipcode and the forecast at its coordinates, at the API quota for the key.
+
+    :param codes: a list of zipcodes
+    :type codes: list of five-digit valid strings of US zip codes
+    :param directory: the replay directory
+    :type directory: string
+    :param key: the API key to record with
+    :type key: string
+    '''
+    owm = RawOWM(key, url=owm_url)
+    scheduler = KeyScheduler(keys=[key])
+    for code in codes:
+        scheduler.acquire_blocking()
+        try:
+            current = owm.get('weather', zip=f'{code},us')
+        except NotFoundError:
+            save(directory, 'weather', code, 404, {'cod': '404', 'message': 'city not found'})
+            continue
+        save(directory, 'weather', code, 200, current)
+        lat, lon = current['coord']['lat'], current['coord']['lon']
+        scheduler.acquire_blocking()
+        save(directory, 'forecast', coords_name(lat, lon), 200, owm.get('forecast', lat=lat, lon=lon))
+        print(f'recorded {code}')
+
+
+class Recording:
+    ''' The recorded responses in a replay directory. '''
+
+    def __init__(self, directory=replay_dir):
+        '''
+        :param directory: the replay directory
+        :type directory: string
+        '''
+
+        self.responses = {}
+        for endpoint in ('weather', 'forecast'):
+            folder = os.path.join(directory, endpoint)
+            names = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+            self.responses[endpoint] = {}
+            for filename in names:
+                with open(os.path.join(folder, filename)) as f:
+                    self.responses[endpoint][filename[:-len('.json')]] = json.load(f)
+        self.found = {endpoint: sorted(name for name, response in responses.items() if response['status'] == 200)
+                      for endpoint, responses in self.responses.items()}
+        self.ids = {str(self.responses['weather'][name]['body'].get('id')): name for name in self.found['weather']}
+
+    def group(self, ids, now=None):
+        ''' Get the response to replay for a grouped current weather call. A city id that was recorded gets the current
+        weather it was recorded with, and one that was not gets one of the recorded ones under its own id.
+
+        :param ids: the city ids
+        :type ids: list of strings
+        :param now: the unix time to move the responses' times up to. defaults to now
+        :type now: int
+
+        :return: the HTTP status and body, or None if nothing is recorded for the current weather
+        :type: 2-tuple
+        '''
+        if not self.found['weather']:
+            return
+        observations = []
+        for id in ids:
+            status, body = self.response('weather', self.ids.get(id, f'id{id}'), now)
+            body['id'] = int(id)
+            observations.append(body)
+        return 200, {'cnt': len(observations), 'list': observations}
+
+    def response(self, endpoint, name, now=None):
+        ''' Get the response to replay for a zipcode or pair of coordinates.
+
+        :param endpoint: 'weather' or 'forecast'
+        :type endpoint: string
+        :param name: the zipcode, or the coordinates from coords_name()
+        :type name: string
+        :param now: the unix time to move the response's times up to. defaults to now
+        :type now: int
+
+        :return: the HTTP status and body, or None if nothing is recorded for the endpoint
+        :type: 2-tuple
+        '''
+        if name in self.responses[endpoint]:
+            response = self.responses[endpoint][name]
+        elif self.found[endpoint]:
+            found = self.found[endpoint]
+            response = self.responses[endpoint][found[zlib.crc32(name.encode()) % len(found)]]
+        else:
+            return
+        body = json.loads(json.dumps(response['body']))  # a copy to move the times on
+        if response['status'] != 200:
+            return response['status'], body
+        offset = 10800*(int(now or time.time())//10800 - response['recorded_at']//10800)
+        if endpoint == 'weather':
+            body['dt'] += offset
+            for field in ('sunrise', 'sunset'):
+                if field in body.get('sys', {}):
+                    body['sys'][field] += offset
+        else:
+            for item in body['list']:
+                item['dt'] += offset
+            lat, lon = name.split(',')
+            body['city']['coord'] = {'lat': float(lat), 'lon': float(lon)}
+        return 200, body
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    ''' Answers the API calls from the server's recording. '''
+
+    protocol_version = 'HTTP/1.1'   # keep-alive, as the pooled sessions expect
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        status, body = self.server.respond(url.path.rstrip('/').rsplit('/', 1)[-1], params)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass    # one line per request drowns out the run's own printout
+
+
+class ReplayServer(ThreadingHTTPServer):
+    ''' A local HTTP server standing in for the weather API. '''
+
+    daemon_threads = True
+
+    def __init__(self, recording=None, port=replay_port, latency=0.05, jitter=0.0, error_rate=0.0,
+                 calls_per_minute=None, burst=5, seed=0):
+        '''
+        :param recording: the responses to replay. defaults to the ones in replay_dir
+        :type recording: Recording
+        :param port: the port to listen on. 0 picks a free one
+        :type port: int
+        :param latency: seconds to wait before answering each call
+        :type latency: float
+        :param jitter: up to this many seconds more are added to the latency at random
+        :type jitter: float
+        :param error_rate: the share of calls answered with a 503
+        :type error_rate: float
+        :param calls_per_minute: the quota for each API key, beyond which calls are answered with a 429. None for no
+        limit
+        :type calls_per_minute: int
+        :param burst: the most calls a key can make back to back
+        :type burst: int
+        :param seed: the seed for the latency jitter and the errors
+        :type seed: int
+        '''
+
+        super().__init__(('127.0.0.1', port), ReplayHandler)
+        self.recording = recording or Recording()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls_per_minute = calls_per_minute
+        self.burst = burst
+        self.random = random.Random(seed)
+        self.buckets = {}   # the TokenBucket for each API key
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        ''' The root url to set api_url to. '''
+
+        return f'http://127.0.0.1:{self.server_address[1]}/data/2.5'
+
+    def respond(self, endpoint, params):
+        ''' Make the response to an API call.
+
+        :param endpoint: the last part of the path, ie 'weather', 'group' or 'forecast'
+        :type endpoint: string
+        :param params: the query parameters
+        :type params: dict
+
+        :return: the HTTP status and body
+        :type: 2-tuple
+        '''
+        key = params.get('APPID')
+        if not key:
+            return 401, {'cod': 401, 'message': 'Invalid API key.'}
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            error = self.random.random() < self.error_rate
+            if self.calls_per_minute and key not in self.buckets:
+                self.buckets[key] = TokenBucket(self.calls_per_minute/60, self.burst)
+        time.sleep(delay)
+        if self.calls_per_minute and not self.buckets[key].try_take():
+            return 429, {'cod': 429, 'message': 'Your account is temporary blocked due to exceeding of requests '
+                                                'limitation of your subscription type.'}
+        if error:
+            return 503, {'cod': 503, 'message': 'Service unavailable.'}
+        if endpoint == 'weather' and 'zip' in params:
+            name = params['zip'].split(',')[0]
+        elif endpoint == 'forecast' and 'lat' in params and 'lon' in params:
+            name = coords_name(params['lat'], params['lon'])
+        elif endpoint == 'group' and 'id' in params:
+            name = None
+        else:
+            return 400, {'cod': '400', 'message': f'{endpoint} is not replayed'}
+        if name is None:
+            response = self.recording.group(params['id'].split(','))
+        else:
+            response = self.recording.response(endpoint, name)
+        if response is None:
+            return 404, {'cod': '404', 'message': f'nothing recorded for {endpoint}'}
+        return response
+
+    def start(self):
+        ''' Serve in a background thread, ie from a benchmark in the same process.
+
+        :return: the server
+        :type: ReplayServer
+        '''
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        ''' Stop serving and close the socket. '''
+
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='record weather API responses or replay them on localhost')
+    commands = parser.add_subparsers(dest='command', required=True)
+    recorder = commands.add_parser('record')
+    recorder.add_argument('filename', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                     'resources', 'success_zipsNC.csv'))
+    server = commands.add_parser('serve')
+    server.add_argument('--port', type=int, default=replay_port)
+    server.add_argument('--latency', type=float, default=0.05)
+    server.add_argument('--jitter', type=float, default=0.0)
+    server.add_argument('--error-rate', type=float, default=0.0)
+    server.add_argument('--calls-per-minute', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(read_list_from_file(args.filename))
+        sys.exit()
+    replay = ReplayServer(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          calls_per_minute=args.calls_per_minute)
+    print(f'replaying {replay_dir} at {replay.url}')
+    try:
+        replay.serve_forever()
+    except KeyboardInterrupt:
+        replay.server_close()
@@ -17,6 +17,13 @@ from pymongo.errors import ConnectionFailure, InvalidDocument, DuplicateKeyError
 from config import OWM_API_key_loohoo as loohoo_key, OWM_API_key_masta as masta_key
 from config import port, host, user, password, socket_path
 
+from raw import RawOWM, raw_mode
+from instant_key import upsert_for, slot
+from indexes import ensure_indexes
+import pool
+import db_pool
+from pool import client_for
+
 
 def read_list_from_file(filename):
     """ Read the zip codes list from the csv file.
@@ -27,18 +34,25 @@ def read_list_from_file(filename):
     with open(filename, "r") as z_list:
         return z_list.read().strip().split(',')
 
-def get_data_from_weather_api(owm, zipcode=None, coords=None):
+def get_data_from_weather_api(owm, zipcode=None, coords=None, retry=True):
     ''' Makes api calls for observations and forecasts and handles the API call errors.
 
     :param owm: the OWM API object
-    :type owm: pyowm.OWM
+    :type owm: pyowm.OWM or raw.RawOWM
     :param zipcode: the zipcode reference for the API call
     :type zipcode: string
     :param coords: the latitude and longitude coordinates reference for the API call
     :type coords: 2-tuple 
+    :param retry: retry the call up to 3 times here. When False a single call is made and its errors are raised, for
+    the caller to retry, ie with retry.retrying()
+    :type retry: bool
 
     returns: the API data
     '''
+    if not retry:
+        if coords:
+            return owm.three_hours_forecast_at_coords(**coords, allow_raw=True)
+        return owm.weather_at_zip_code(zipcode, 'us')
     result = None
     tries = 1
     while result is None and tries < 4:
@@ -51,60 +65,123 @@ def get_data_from_weather_api(owm, zipcode=None, coords=None):
             loc = zipcode or 'lat: {}, lon: {}'.format(coords['lat'], coords['lon'])
             print(f'SSL error with {loc} on attempt {tries} ...trying again')
             if coords:
-                owm_loohoo = OWM(loohoo_key)
+                owm_loohoo = client_for(loohoo_key, raw=isinstance(owm, RawOWM))
                 owm = owm_loohoo
             elif zipcode:
-                owm_masta = OWM(masta_key)
+                owm_masta = client_for(masta_key, raw=isinstance(owm, RawOWM))
                 owm = owm_masta
         except APICallTimeoutError:
             loc = zipcode or 'lat: {}, lon: {}'.format(coords['lat'], coords['lon'])
             print(f'Timeout error with {loc} on attempt {tries}... waiting 1 second then trying again')
             time.sleep(1)
         tries += 1
-    if tries == 4:
+    if result is None:
         print('tried 3 times without response; moving to the next step!')
         return
     return result
 
-def get_current_weather(code=None, coords=None):
+def get_current_weather(code=None, coords=None, key=loohoo_key, raw=raw_mode, retry=True):
     ''' Get the current weather for the given zipcode or coordinates.
 
     :param code: the zip code to find weather data about
     :type code: string
     :param coords: the coordinates for the data you want
     :type coords: 2-tuple
+    :param key: the API key to make the call with
+    :type key: string
+    :param raw: make the call with RawOWM rather than pyowm.OWM
+    :type raw: bool
+    :param retry: let get_data_from_weather_api() retry the call
+    :type retry: bool
 
     :return: the raw weather object
     :type: json
     '''
-    owm = OWM(loohoo_key)
+    owm = client_for(key, raw=raw)
 
-    try:
-        result = get_data_from_weather_api(owm, zipcode=code)
-    except APICallTimeoutError:
-        owm = OWM(loohoo_key)
-    current = json.loads(result.to_JSON()) # the current weather for the given zipcode
+    result = get_data_from_weather_api(owm, zipcode=code, retry=retry)
+    if raw and result is None:
+        raise AttributeError(f'no current weather returned for {code}') # the same error the pyowm path gives
+    return shape_current(result if raw else json.loads(result.to_JSON()), code)
+
+def shape_current(current, code=None):
+    ''' Reshape the to_JSON() dict of a current weather observation into the obs_temp document.
+
+    :param current: the current weather for the given zipcode
+    :type current: dict
+    :param code: the zip code of the observation
+    :type code: string
+
+    :return: the current weather document
+    :type: dict
+    '''
     if code:
         current['Weather']['zipcode'] = code
     current['coordinates'] = current['Location']['coordinates']
-    current['Weather']['instant'] = 10800*(current['Weather']['reference_time']//10800 + 1)
+    current['city_id'] = current['Location']['ID']
+    current['Weather']['instant'] = slot(current['Weather']['reference_time'])
     current['Weather']['time_to_instant'] = current['Weather']['instant'] - current['Weather'].pop('reference_time')
     current.pop('Location')
     return current
 
-def five_day(coords, code=None):
+def current_weather_at_ids(ids, key=loohoo_key, raw=raw_mode, retry=False):
+    ''' Get the current weather at up to 20 OWM city ids in a single call. Errors are raised for the caller to retry.
+
+    :param ids: the city ids
+    :type ids: list of ints
+    :param key: the API key to make the call with
+    :type key: string
+    :param raw: make the call with RawOWM rather than pyowm.OWM
+    :type raw: bool
+    :param retry: not used; the grouped call is always made once
+    :type retry: bool
+
+    :return: the to_JSON() dict of the observation at each city id, to be shaped with shape_current()
+    :type: dict
+    '''
+    owm = client_for(key, raw=raw)
+
+    observations = owm.weather_at_ids(list(ids))
+    if not raw:
+        observations = [json.loads(observation.to_JSON()) for observation in observations]
+    return {observation['Location']['ID']: observation for observation in observations}
+
+def five_day(coords, code=None, key=masta_key, raw=raw_mode, retry=True):
     ''' Get each weather forecast for the corrosponding coordinates
     
     :param coords: the latitude and longitude for which that that weather is being forecasted
     :type coords: tuple containing the latitude and logitude for the forecast
+    :param key: the API key to make the call with
+    :type key: string
+    :param raw: make the call with RawOWM rather than pyowm.OWM
+    :type raw: bool
+    :param retry: let get_data_from_weather_api() retry the call
+    :type retry: bool
 
     :return five_day: the five day, every three hours, forecast for the zip code
     :type five_day: dict
     '''
-    owm = OWM(masta_key)
+    owm = client_for(key, raw=raw)
+
+    result = get_data_from_weather_api(owm, coords=coords, retry=retry)
+    if raw and result is None:
+        raise AttributeError(f'no forecast returned for {code}') # the same error the pyowm path gives
+    forecast = result if raw else json.loads(result.get_forecast().to_JSON())
+    return shape_forecast(forecast, coords, code)
 
-    Forecast = get_data_from_weather_api(owm, coords=coords).get_forecast()
-    forecast = json.loads(Forecast.to_JSON())
+def shape_forecast(forecast, coords, code=None):
+    ''' Reshape the to_JSON() dict of a 3-hourly forecast into the cast_temp document.
+
+    :param forecast: the forecast for the given coordinates
+    :type forecast: dict
+    :param coords: the latitude and longitude for which that that weather is being forecasted
+    :type coords: dict
+    :param code: the zip code of the forecast
+    :type code: string
+
+    :return: the five day forecast document
+    :type: dict
+    '''
     if code:
         forecast['zipcode'] = code
     if coords:
@@ -169,7 +246,7 @@ def load_og(data, client, database, collection):
         except DuplicateKeyError:
             return(f'DuplicateKeyError, could not insert data into {collection}.')
 
-def load_weather(data, client, database, collection):
+def load_weather(data, client, database, collection, loader=None):
     ''' Load data to specified database collection. This determines the appropriate way to process the load depending on the
     collection to which it should be loaded. Data is expected to be a weather-type dictionary. When the collection is "instants"
     the data is appended the specified object's forecasts array in the instants collection; when the collection is either
@@ -184,7 +261,11 @@ def load_weather(data, client, database, collection):
     :type database: str
     :param collection: the database collection to be used
     :type collection: str
+    :param loader: buffer the write in the bulk loader rather than making it now (see bulk.py)
+    :type loader: bulk.BulkLoader
     ''' 
+    if loader is not None:
+        return loader.add(data, collection)
     col = dbncol(client, collection, database=database)
     # decide how to handle the loading process depending on where the document will be loaded.
     if collection == 'instant' or collection == 'test_instants':
@@ -195,7 +276,7 @@ def load_weather(data, client, database, collection):
             updates = {'$push': {'forecasts': data}} # append the forecast object to the forecasts list
         try:
             filters = {'zipcode':data.pop('zipcode'), 'instant':data.pop('instant')}
-            col.find_one_and_update(filters, updates,  upsert=True)
+            col.find_one_and_update(*upsert_for(filters, updates),  upsert=True)
         except DuplicateKeyError:
             return(f'DuplicateKeyError, could not insert data into {collection}.')
     elif collection == 'observed' or collection == 'forecasted' or collection == 'obs_temp' or collection == 'cast_temp':
@@ -210,44 +291,17 @@ def request_and_load(codes):
     :param codes: a list of zipcodes
     :type codes: list of five-digit valid strings of US zip codes
     '''
+    from fetch import collect_and_load
+
     # Begin a timer for the process and run the request and load process.
     start_start = time.time()
     print(f'task began at {start_start}')
-    i, n = 0, 0 # i for counting zipcodes processed and n for counting API calls made; API calls limited to a maximum of 60/minute/apikey.
-    start_time = time.time()
-    for code in codes:
-        try:
-            current = get_current_weather(code)
-        except AttributeError:
-            print(f'got AttributeError while collecting current weather for {code}. Continuing to next code.')
-            continue
-        n+=1
-        coords = current['coordinates']         
-        try:
-            forecasts = five_day(coords, code=code)
-        except AttributeError:
-            print(f'got AttributeError while collecting forecasts for {code}. Continuing to next code.')
-            continue
-        n+=1
-        load_weather(current, local_client, 'test', 'obs_temp')
-        load_weather(forecasts, local_client, 'test', 'cast_temp')
-        
-        # if the api request rate is greater than 60 just keep going. Otherwise check how many requests have been made
-        # and if it's more than 120 start make_instants.
-        if n/2 / (time.time()-start_time) <= 1:
-            print('n/2 / time.time()-start_time <= 1')
-            i+=1
-            continue
-        else:
-            print('n/2 / time.time()-start_time > 1')
-            i+=1
-            if n>20:
-                print('about to start making instants')
-                import make_instants # run the file that creates instants from the documents just loaded
-                if time.time() - start_time < 60:
-                    print(f'Waiting {start_time+60 - time.time()} seconds before resuming API calls.')
-                    time.sleep(start_time - time.time() + 60)
-                    start_time = time.time()
+
+    def make_instants():
+        print('about to start making instants')
+        import make_instants # run the file that creates instants from the documents just loaded
+
+    i = collect_and_load(codes, local_client, 'test', after_batch=make_instants) # i for counting zipcodes processed
     print(f'task took {time.time() -  start_start} seconds and processed {i} zipcodes')
 
 
@@ -261,6 +315,8 @@ if __name__ == '__main__':
         directory = os.path.join(os.environ['HOME'], 'data', 'forecast-forecast')
         filename = os.path.join(directory, 'ETL', 'Extract', 'resources', 'success_zipsNC.csv')
         codes = read_list_from_file(filename)
-    local_client = MongoClient(host=host, port=port)
+    local_client = db_pool.client_for('local')
+    ensure_indexes(local_client, 'test')
     request_and_load(codes[:220])
-    local_client.close()
+    db_pool.close()
+    pool.close() # close the keep-alive sessions to the weather API
@@ -0,0 +1,136 @@
+''' Retries for the weather API calls. Rather than retrying inline with a fixed time.sleep(), a failed call waits out an
+exponential backoff with full jitter on the event loop, so the other locations keep going while it waits. A location
+that is still failing after max_attempts goes to the dead_letters collection, and the catch-up pass at the end of a run
+tries the dead letters for the current instant again before the instant closes. '''
+
+import time
+import random
+import asyncio
+
+from pyowm.exceptions.api_call_error import APICallError
+
+from request_and_load import dbncol
+from metrics import metrics
+from instant_key import instant_id, slot
+
+try:
+    from config import max_attempts     # API call attempts per location before it is dead lettered
+except ImportError:
+    max_attempts = 4
+try:
+    from config import backoff_base, backoff_cap    # seconds
+except ImportError:
+    backoff_base, backoff_cap = 1, 60
+
+
+class RetriesExhausted(Exception):
+    ''' Raised when an API call has failed max_attempts times. '''
+
+    def __init__(self, attempts, error):
+        '''
+        :param attempts: the number of attempts made
+        :type attempts: int
+        :param error: the error from the last attempt
+        :type error: Exception
+        '''
+
+        super().__init__(f'gave up after {attempts} attempts: {error!r}')
+        self.attempts = attempts
+        self.error = error
+
+
+def backoff(attempt, base=backoff_base, cap=backoff_cap):
+    ''' The time to wait before the next attempt, chosen at random between 0 and the exponential backoff so that
+    locations that failed together do not all come back at the same moment.
+
+    :param attempt: the number of attempts made so far
+    :type attempt: int
+
+    :return: seconds to wait
+    :type: float
+    '''
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+async def retrying(call, label, attempts=max_attempts, endpoint=None):
+    ''' Await the API call, retrying it with backoff when it fails with an APICallError (timeouts, SSL and connection
+    errors). Any other error, ie NotFoundError, is not retried.
+
+    :param call: makes a new awaitable for the API call each time it is called
+    :type call: function
+    :param label: what the call is for, ie 'current weather for 27006', for the printout
+    :type label: string
+    :param attempts: the most attempts to make
+    :type attempts: int
+    :param endpoint: the endpoint to count the retries against in the metrics. They are not counted without it
+    :type endpoint: string
+
+    :return: the result of the call
+    '''
+    for attempt in range(1, attempts + 1):
+        try:
+            return await call()
+        except APICallError as e:
+            error = e
+            if attempt < attempts:
+                wait = backoff(attempt)
+                print(f'{type(e).__name__} on {label}, attempt {attempt}; trying again in {wait:.1f} seconds')
+                if endpoint:
+                    metrics.retry(endpoint)
+                await asyncio.sleep(wait)
+    raise RetriesExhausted(attempts, error)
+
+def dead_letter(client, database, failures):
+    ''' Record the locations that ran out of retries in the dead_letters collection.
+
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+    :param failures: the zipcode, endpoint and RetriesExhausted of each failure
+    :type failures: list of 3-tuples
+    '''
+    col = dbncol(client, 'dead_letters', database=database)
+    now = int(time.time())
+    instant = slot(now)
+    for code, endpoint, e in failures:
+        col.update_one({'_id': instant_id(code, instant)},
+                       {'$set': {'zipcode': code, 'instant': instant, 'endpoint': endpoint, 'error': repr(e.error),
+                                 'attempts': e.attempts, 'failed_at': now},
+                        '$inc': {'runs': 1}},
+                       upsert=True)
+
+def dead_letters(client, database, instant, endpoint=None):
+    ''' Get the zipcodes that are dead lettered for the instant.
+
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+    :param instant: the instant the locations were being collected for
+    :type instant: int
+    :param endpoint: only the zipcodes whose last failure was on this endpoint, 'weather' or 'forecast'
+    :type endpoint: string
+
+    :return: the zipcodes
+    :type: list
+    '''
+    col = dbncol(client, 'dead_letters', database=database)
+    filters = {'instant': instant}
+    if endpoint:
+        filters['endpoint'] = endpoint
+    return [doc['zipcode'] for doc in col.find(filters, {'zipcode': 1})]
+
+def clear_dead_letters(client, database, instant, codes):
+    ''' Remove the zipcodes that have now been collected from the dead letters for the instant.
+
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+    :param database: the database to be used
+    :type database: str
+    :param instant: the instant the locations were being collected for
+    :type instant: int
+    :param codes: the zipcodes
+    :type codes: list
+    '''
+    col = dbncol(client, 'dead_letters', database=database)
+    col.delete_many({'instant': instant, 'zipcode': {'$in': list(codes)}})
@@ -0,0 +1,115 @@
+''' Track the version of the five day forecast last collected for each location. OWM only issues a new 3-hourly forecast
+every so often, so fetching more often than that just gets the same weathers array again, which then gets pushed into
+instant_temp as a duplicate forecast. Each location's entry in resources/forecast_versions.json remembers the reception
+time and a hash of the content of its last forecast: a forecast received in the current refresh window is not fetched
+again, and one whose content hash has not changed is not loaded. A new version is only recorded once its forecast has
+been loaded. '''
+
+import os
+import json
+import time
+import hashlib
+
+try:
+    from config import forecast_refresh    # seconds between OWM forecast updates
+except ImportError:
+    forecast_refresh = 10800
+
+
+filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'forecast_versions.json')
+
+
+def load_versions(filename=filename):
+    ''' Read the forecast versions from the file. A missing file means no versions are known.
+
+    :param filename: the path to the forecast versions file
+    :type filename: string
+
+    :return: the reception_time and hash of the last forecast for each location
+    :type: dict
+    '''
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_versions(versions, filename=filename):
+    ''' Write the forecast versions to the file, by way of a temporary file so it is never left half written.
+
+    :param versions: the reception_time and hash of the last forecast for each location
+    :type versions: dict
+    :param filename: the path to the forecast versions file
+    :type filename: string
+    '''
+    temp = f'{filename}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(versions, f, indent=0, sort_keys=True)
+    os.replace(temp, filename)
+
+def content_hash(forecast):
+    ''' Hash the forecast's weathers array. The time_to_instant fields are left out because they change with the
+    reception time even when the forecast itself has not changed, and the zipcode because it is not part of the
+    forecast, so the same forecast fanned out to the members of a cell hashes the same.
+
+    :param forecast: the forecast as returned by five_day()
+    :type forecast: dict
+
+    :return: the hex digest of the forecast content
+    :type: string
+    '''
+    casts = [{k: v for k, v in cast.items() if k not in ('time_to_instant', 'zipcode')} for cast in forecast['weathers']]
+    return hashlib.sha1(json.dumps(casts, sort_keys=True).encode()).hexdigest()
+
+def is_fresh(versions, location, refresh=forecast_refresh, now=None):
+    ''' Check whether the last forecast collected for the location was received in the current refresh window, so
+    OWM will not have issued a new one yet. The windows are aligned like the instants, ie 0000, 0300, ... UTC, rather
+    than counted from the reception time: a run on the cadence receives its forecasts a little later each time, and
+    counting from the last reception would find them fresh and skip every other run.
+
+    :param versions: the reception_time and hash of the last forecast for each location
+    :type versions: dict
+    :param location: the zipcode or other location id
+    :type location: string
+    :param refresh: the number of seconds between OWM forecast updates
+    :type refresh: int
+    :param now: the time to check at, defaults to now
+    :type now: int
+
+    :return: True if the forecast does not need to be fetched again
+    '''
+    version = versions.get(location)
+    if not version:
+        return False
+    now = time.time() if now is None else now
+    return int(version['reception_time'])//refresh == int(now)//refresh
+
+def new_version(versions, location, forecast):
+    ''' Check the forecast against the last version collected for the location. The version is not recorded here: a
+    new forecast is only recorded once it has been loaded (see record_version() and pipeline.py), so a forecast that is
+    dropped on the way is fetched again in the same window.
+
+    :param versions: the reception_time and hash of the last forecast for each location
+    :type versions: dict
+    :param location: the zipcode or other location id
+    :type location: string
+    :param forecast: the forecast as returned by five_day()
+    :type forecast: dict
+
+    :return: the forecast's version, and whether its content differs from the last version and should be loaded
+    :type: 2-tuple
+    '''
+    version = {'reception_time': forecast['reception_time'], 'hash': content_hash(forecast)}
+    return version, version['hash'] != versions.get(location, {}).get('hash')
+
+def record_version(versions, location, version):
+    ''' Record the version of the forecast last collected for the location.
+
+    :param versions: the reception_time and hash of the last forecast for each location
+    :type versions: dict
+    :param location: the zipcode or other location id
+    :type location: string
+    :param version: the version from new_version()
+    :type version: dict
+    '''
+    versions[location] = version
@@ -0,0 +1,186 @@
+''' A MongoDB work queue for collecting on more than one host. Every run puts a task for each zipcode and instant in the
+work_queue collection; putting the same one again does nothing, so the cron box and the gcloud VM can both fill the
+queue from their zip lists. Workers then claim tasks in batches under a lease, which a heartbeat thread renews while the
+batch is being collected. A task is marked done once its location is loaded, so no two workers fetch the same one, and
+if a worker dies its lease runs out and the task is claimed again by another worker, so no location is lost. A task
+whose last allowed claim runs out of lease is given up on and dead lettered, like a location that runs out of
+retries. Turn it on with work_queue = True in config. '''
+
+import os
+import time
+import socket
+import threading
+
+from pymongo import ReturnDocument, UpdateOne
+
+from request_and_load import dbncol
+from instant_key import instant_id, slot
+from retry import RetriesExhausted, dead_letter
+
+try:
+    from config import lease_time   # seconds a claimed task is held before another worker can claim it
+except ImportError:
+    lease_time = 120
+try:
+    from config import max_claims   # claims of a task before it is given up on
+except ImportError:
+    max_claims = 3
+
+
+class WorkQueue:
+    ''' The tasks for one instant, as seen by one worker. '''
+
+    def __init__(self, client, database='test', instant=None, worker=None, lease=lease_time, claims=max_claims):
+        '''
+        :param client: a MongoClient instance
+        :type client: pymongo.MongoClient
+        :param database: the database to be used
+        :type database: str
+        :param instant: the instant the tasks are for. defaults to the next instant
+        :type instant: int
+        :param worker: the name of the worker. defaults to the host name and process id
+        :type worker: string
+        :param lease: seconds a claim lasts without a heartbeat
+        :type lease: float
+        :param claims: the most times a task is claimed before it is left as failed
+        :type claims: int
+        '''
+
+        self.client = client
+        self.database = database
+        self.col = dbncol(client, 'work_queue', database=database)
+        self.instant = instant or slot(time.time())
+        self.worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+        self.lease = lease
+        self.claims = claims
+
+    def enqueue(self, codes):
+        ''' Add a task for each zipcode. Tasks already in the queue are left as they are.
+
+        :param codes: a list of zipcodes
+        :type codes: list of five-digit valid strings of US zip codes
+        '''
+        tasks = [UpdateOne({'_id': instant_id(code, self.instant)},
+                           {'$setOnInsert': {'zipcode': code, 'instant': self.instant, 'state': 'pending', 'claims': 0,
+                                             'lease_until': 0}},
+                           upsert=True)
+                 for code in codes]
+        if tasks:
+            self.col.bulk_write(tasks, ordered=False)
+
+    def claim(self, n):
+        ''' Claim up to n tasks that are pending or whose lease has run out, after reaping the ones that cannot be
+        claimed again.
+
+        :param n: the most tasks to claim
+        :type n: int
+
+        :return: the zipcodes claimed
+        :type: list
+        '''
+        self.reap()
+        codes = []
+        while len(codes) < n:
+            now = time.time()
+            task = self.col.find_one_and_update(
+                {'instant': self.instant, 'claims': {'$lt': self.claims},
+                 '$or': [{'state': 'pending'}, {'state': 'leased', 'lease_until': {'$lt': now}}]},
+                {'$set': {'state': 'leased', 'owner': self.worker, 'lease_until': now + self.lease},
+                 '$inc': {'claims': 1}},
+                return_document=ReturnDocument.AFTER)
+            if task is None:
+                break
+            codes.append(task['zipcode'])
+        return codes
+
+    def reap(self):
+        ''' Give up on the tasks that were claimed as many times as they can be and whose last lease has run out, ie
+        the worker holding them died. Nothing would claim them again, so they would stay leased for good; they are
+        marked failed and dead lettered instead.
+
+        :return: the zipcodes given up on
+        :type: list
+        '''
+        filters = {'instant': self.instant, 'state': 'leased', 'claims': {'$gte': self.claims},
+                   'lease_until': {'$lt': time.time()}}
+        tasks = list(self.col.find(filters, {'zipcode': 1, 'claims': 1, 'owner': 1}))
+        if not tasks:
+            return []
+        codes = [task['zipcode'] for task in tasks]
+        self.col.update_many(dict(filters, zipcode={'$in': codes}), {'$set': {'state': 'failed'}})
+        dead_letter(self.client, self.database,
+                    [(task['zipcode'], 'lease', RetriesExhausted(task['claims'], TimeoutError(f'lease ran out on '
+                                                                                              f'{task.get("owner")}')))
+                     for task in tasks])
+        print(f'gave up on {len(codes)} tasks whose last lease ran out')
+        return codes
+
+    def renew(self, codes):
+        ''' Extend the lease on the tasks this worker still holds. '''
+
+        self.col.update_many({'instant': self.instant, 'zipcode': {'$in': list(codes)}, 'owner': self.worker,
+                              'state': 'leased'},
+                             {'$set': {'lease_until': time.time() + self.lease}})
+
+    def complete(self, codes):
+        ''' Mark the tasks done. '''
+
+        self.col.update_many({'instant': self.instant, 'zipcode': {'$in': list(codes)}, 'owner': self.worker},
+                             {'$set': {'state': 'done', 'finished': time.time()}})
+
+    def release(self, codes):
+        ''' Hand the tasks back to the queue for any worker to claim again, ie after they failed. Tasks that have been
+        claimed too many times are left as failed instead.
+        '''
+        codes = list(codes)
+        self.col.update_many({'instant': self.instant, 'zipcode': {'$in': codes}, 'owner': self.worker,
+                              'claims': {'$gte': self.claims}},
+                             {'$set': {'state': 'failed'}})
+        self.col.update_many({'instant': self.instant, 'zipcode': {'$in': codes}, 'owner': self.worker,
+                              'state': 'leased'},
+                             {'$set': {'state': 'pending', 'lease_until': 0}})
+
+    def held_elsewhere(self):
+        ''' The number of seconds until the next lease held by another worker runs out, or None if there are none. '''
+
+        task = self.col.find_one({'instant': self.instant, 'state': 'leased', 'claims': {'$lt': self.claims}},
+                                 sort=[('lease_until', 1)])
+        if task is not None:
+            return max(0, task['lease_until'] - time.time())
+
+    def heartbeat(self, codes):
+        ''' Keep the lease on the tasks for as long as the block lasts. '''
+
+        return Heartbeat(self, codes)
+
+
+class Heartbeat:
+    ''' Renews the lease on a batch of tasks from a background thread. '''
+
+    def __init__(self, queue, codes):
+        '''
+        :param queue: the work queue the tasks were claimed from
+        :type queue: WorkQueue
+        :param codes: the zipcodes claimed
+        :type codes: list
+        '''
+
+        self.queue = queue
+        self.codes = codes
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name='heartbeat', daemon=True)
+
+    def beat(self):
+        while not self.stopped.wait(self.queue.lease / 3):
+            try:
+                self.queue.renew(self.codes)
+            except Exception as e:
+                print(f'got {type(e).__name__} renewing the lease on {len(self.codes)} tasks')
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
@@ -1,47 +1,27 @@
-from pymongo import MongoClient
 from pymongo.database import Database
 from pymongo.collection import Collection
 from pymongo.errors import ConnectionFailure, InvalidDocument, DuplicateKeyError, OperationFailure, ConfigurationError
 from urllib.parse import quote
 
 from config import user, password, socket_path, host, port
+from db_pool import client_for
 
 ''' Useful functions for forecast-forecast specific operations '''
 
 def Client(host=None, port=None, uri=None):
-    ''' Create and return a pymongo MongoClient object. Connect with the given parameters if possible, switch to local if the
-    remote connection is not possible, using the default host and port.
+    ''' Get the process's pooled MongoClient (see db_pool.py): the local one if
+    a host and port are given, otherwise the remote one, which is the local one
+    again if the remote server cannot be resolved. The client is shared, and
+    connects on its first operation.
     
-    :param host: the local host to be used. defaults within to localhost
+    :param host: the local host to be used. the one in config is used
     :type host: sting
-    :param port: the local port to be used. defaults within to 27017
+    :param port: the local port to be used. the one in config is used
     :type port: int
-    :param uri: the remote server URI. must be uri encoded
+    :param uri: the remote server URI. the one in config is used
     type uri: uri encoded sting'''
     
-    if host and port:
-        try:
-            client = MongoClient(host=host, port=port)
-            return client
-        except ConnectionFailure:
-            # connect to the remote server if a valid uri is given
-            if uri:
-                print('caught ConnectionFailure on local server. Trying to make it with remote')
-                client = MongoClient(uri)
-                print(f'established remote MongoClient on URI={uri}')
-                return client
-            print('caught ConnectionFailure on local server. Returning None')
-            return None
-    elif uri:
-        # verify that the connection with the remote server is active and switch to the local server if it's not
-        try:
-            client = MongoClient(uri)
-            return client
-        except ConfigurationError:
-            print(f'Caught configurationError in client() for URI={uri}. It was likely triggered by a DNS timeout.')
-            client = MongoClient(host=host, port=port)
-            print('connection made with local server, even though you asked for the remote server')
-            return client
+    return client_for('local' if host and port else 'remote')
 
 def dbncol(client, collection='test', database='test'):
     ''' Make a connection to the database and collection given in the arguments.
@@ -1,47 +1,27 @@
 ''' modify as needed to perform update operations '''
 
-from pymongo import MongoClient
 from pymongo.database import Database
 from pymongo.collection import Collection, ReturnDocument
 from pymongo.errors import ConnectionFailure, InvalidDocument, DuplicateKeyError, OperationFailure, ConfigurationError
 from urllib.parse import quote
 
 from config import user, password, socket_path, host, port
+from db_pool import client_for, close
 
 def Client(host=None, port=None, uri=None):
-    ''' Create and return a pymongo MongoClient object. Connect with the given parameters if possible, switch to local if the
-    remote connection is not possible, using the default host and port.
+    ''' Get the process's pooled MongoClient (see db_pool.py): the local one if
+    a host and port are given, otherwise the remote one, which is the local one
+    again if the remote server cannot be resolved. The client is shared, and
+    connects on its first operation.
     
-    :param host: the local host to be used. defaults within to localhost
+    :param host: the local host to be used. the one in config is used
     :type host: sting
-    :param port: the local port to be used. defaults within to 27017
+    :param port: the local port to be used. the one in config is used
     :type port: int
-    :param uri: the remote server URI. must be uri encoded
+    :param uri: the remote server URI. the one in config is used
     type uri: uri encoded sting'''
     
-    if host and port:
-        try:
-            client = MongoClient(host=host, port=port)
-            return client
-        except ConnectionFailure:
-            # connect to the remote server if a valid uri is given
-            if uri:
-                print('caught ConnectionFailure on local server. Trying to make it with remote')
-                client = MongoClient(uri)
-                print(f'established remote MongoClient on URI={uri}')
-                return client
-            print('caught ConnectionFailure on local server. Returning None')
-            return None
-    elif uri:
-        # verify that the connection with the remote server is active and switch to the local server if it's not
-        try:
-            client = MongoClient(uri)
-            return client
-        except ConfigurationError:
-            print(f'Caught configurationError in client() for URI={uri}. It was likely triggered by a DNS timeout.')
-            client = MongoClient(host=host, port=port)
-            print('connection made with local server, even though you asked for the remote server')
-            return client
+    return client_for('local' if host and port else 'remote')
 
 def dbncol(client, collection, database='test'):
     ''' Make a connection to the database and collection given in the arguments.
@@ -61,23 +41,24 @@ def dbncol(client, collection, database='test'):
     col = Collection(db, collection)
     return col
 
-client = Client(host=host, port=port)
-# find the doc with 'weathers' field, change that field to 'forecasts', and update each doc
-col = dbncol(client, 'forecasted')
-filters = {'weathers': {'$exists': True}}
-results = col.find(filters).batch_size(1000)
-forecasted_inserts = []
-for doc in results:
-    doc.pop('weathers')
-    col.replace_one({'_id': doc['_id']}, doc) # forecasted_inserts.append(doc)
+if __name__ == '__main__':
+    client = Client(host=host, port=port)
+    # find the doc with 'weathers' field, change that field to 'forecasts', and update each doc
+    col = dbncol(client, 'forecasted')
+    filters = {'weathers': {'$exists': True}}
+    results = col.find(filters).batch_size(1000)
+    forecasted_inserts = []
+    for doc in results:
+        doc.pop('weathers')
+        col.replace_one({'_id': doc['_id']}, doc) # forecasted_inserts.append(doc)
 
-col = dbncol(client, 'observed')
-filters = {'Location': {'$exists': True}}
-results = col.find(filters).batch_size(1000)
-observeded_inserts = []
-for doc in results:
-    doc['coordinates'] = doc.pop('Location')['coordinates']
-    col.replace_one({'_id': doc['_id']}, doc)
-print('done with observed updates')
+    col = dbncol(client, 'observed')
+    filters = {'Location': {'$exists': True}}
+    results = col.find(filters).batch_size(1000)
+    observeded_inserts = []
+    for doc in results:
+        doc['coordinates'] = doc.pop('Location')['coordinates']
+        col.replace_one({'_id': doc['_id']}, doc)
+    print('done with observed updates')
 
-client.close()
\ No newline at end of file
+    close()
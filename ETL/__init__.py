@@ -4,7 +4,7 @@ from urllib.parse import quote
 
 # import forecastforecast as ff
 # from ff.ETL import db_ops
-from db_ops import Client
+from Extract.db_pool import client_for
 from ETL.config import OWM_API_key_masta as masta, OWM_API_key_loohoo as loohoo
 from ETL.config import port, host, user, password, socket_path
 
@@ -12,5 +12,13 @@ from ETL.config import port, host, user, password, socket_path
 password = quote(password)
 uri = "mongodb+srv://%s:%s@%s" % (user, password, socket_path)
 print(f'from Transform.__init__() {uri}')
-client = Client(host, port)  # sets a global pymongo MongoClient object 
-remote_client = Client(uri)
+
+
+def __getattr__(name):
+    ''' The global pymongo MongoClient objects, from the pool on first use rather than made on import. '''
+
+    if name == 'client':
+        return client_for('local')
+    if name == 'remote_client':
+        return client_for('remote')
+    raise AttributeError(f'module {__name__} has no attribute {name}')
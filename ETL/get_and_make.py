@@ -40,6 +40,10 @@ if __name__ == '__main__':
     import time
     
     from Extract.request_and_load import read_list_from_file
+    from Extract.quota import open_ledger
+    from config import client
+
+    open_ledger(client)
     
     print(dir())
     # Get the list of locations from the resources directory
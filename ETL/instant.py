@@ -1,5 +1,9 @@
 ''' Defines the Instant class and some useful functions. '''
 
+from Extract.instant_key import instant_id
+
+sweep_age = 453000  # seconds past its instant before one is swept: about 5 days
+
 
 class Instant:
 
@@ -106,17 +110,17 @@ def sweep(instants):
     # cursor over the database.
     if type(instants) == dict:
         for key, doc in instants:
-            if key['instant'] < time.time()-453000:  # 453000sec: about 5 days
+            if key['instant'] < time.time()-sweep_age:
                 col.delete_one(doc)
                 n += 1
     elif type(instants) == list:
         for doc in instants:
-            if doc['instant'] < time.time()-453000:
+            if doc['instant'] < time.time()-sweep_age:
                 col.delete_one(doc)
                 n += 1
     elif type(instants) == pymongo.cursor.Cursor:
         for doc in instants:
-            if doc['instant'] < time.time()-453000:
+            if doc['instant'] < time.time()-sweep_age:
                 col.delete_one(doc)
                 n += 1
     else:
@@ -221,7 +225,7 @@ def doc_to_inst(doc):
     :type doc: dictionary
     '''
     
-    _id = f"{doc['instant']}{doc['zipcode']}"
+    _id = instant_id(doc['zipcode'], doc['instant'])
     forecasts = doc['forecasts']
     observations = doc['weather']
     return Instant(_id, forecasts, observations)
@@ -244,6 +248,6 @@ if __name__ == '__main__':
     collection = 'instant_temp'
     col = db_ops.dbncol(config.client, collection, database=config.database)
     cast_count_all(col.find({}))
-    sweep(col.find({}))
+    sweep(col.find({'instant': {'$lt': time.time()-sweep_age}}))
 
     print(f'Total op time for instant.py was {time.time()-start_time} seconds')
\ No newline at end of file
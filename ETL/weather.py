@@ -12,6 +12,8 @@ from pyowm.exceptions.api_call_error import APIInvalidSSLCertificateError
 from config import OWM_API_key_loohoo as loohoo_key
 from config import OWM_API_key_masta as masta_key
 from instant import Instant
+from Extract.quota import reserve
+from Extract.instant_key import instant_id, slot
 # from config import client
 
 # from Extract.make_instants import find_data
@@ -36,9 +38,9 @@ class Weather:
         self.weather = data
         # make the _id for each weather according to its reference time
         if _type == 'forecast' and 'reference_time' in data:
-            self._id = f'{str(location)}{str(data["reference_time"])}'
+            self._id = instant_id(location, data['reference_time'])
         elif _type == 'observation': #and 'Weather' in data:
-            self._id = f'{str(location)}{str(10800 * (data["reference_time"]//10800 + 1))}' #["Weather"]["reference_time"]//10800 + 1))}'
+            self._id = instant_id(location, slot(data['reference_time']))
         self.as_dict = {'_id': self._id,
                        '_type': self.type,
                         'weather': self.weather
@@ -89,6 +91,7 @@ def get_data_from_weather_api(owm, location, current=False):
     while result is None and tries < 4:
         try:
             if type(location) == dict:
+                reserve(owm.get_API_key())  # once per call, on the key making it
                 if current:
                     result = owm.weather_at_coords(**location)
                     return result
@@ -96,6 +99,7 @@ def get_data_from_weather_api(owm, location, current=False):
                     result = owm.three_hours_forecast_at_coords(**location)
                     return result
             elif type(location) == str:
+                reserve(owm.get_API_key())  # once per call, on the key making it
                 result = owm.weather_at_zip_code(location, 'us')
                 return result
         except APIInvalidSSLCertificateError as e:
@@ -8,5 +8,14 @@ import overalls
 from config import host, port, uri
 from ETL.db_ops import Client
 
-client = Client(host, port)
-remote_client = Client(uri)
+
+
+def __getattr__(name):
+    ''' The clients, from the pool on first use rather than made on import. '''
+
+    if name == 'client':
+        return Client(host, port)
+    if name == 'remote_client':
+        return Client(uri=uri)
+    raise AttributeError(f'module {__name__} has no attribute {name}')
+
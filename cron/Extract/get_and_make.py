@@ -5,7 +5,11 @@ import json
 from pymongo import MongoClient
 
 from request_and_load import get_current_weather, five_day, load_weather, read_list_from_file
+from bulk import BulkLoader
 from make_instants import make_instants
+from quota import open_ledger
+import db_pool
+from indexes import ensure_indexes
 
 from config import OWM_API_key_loohoo as loohoo_key, OWM_API_key_masta as masta_key
 from config import port, host, user, password, socket_path
@@ -23,6 +27,7 @@ def get_and_make(codes):
     print(f'task began at {start_start}')
     i, n = 0, 0 # i for counting zipcodes processed and n for counting API calls made; API calls limited to a maximum of 60/minute/apikey.
     start_time = time.time()
+    loader = BulkLoader(client, 'test') # the documents are written in bulk
     for code in codes:
         try:
             current = get_current_weather(code)
@@ -37,8 +42,8 @@ def get_and_make(codes):
             print(f'got AttributeError while collecting forecasts for {code}. Continuing to next code.')
             continue
         n+=1
-        load_weather(current, client, 'test', 'obs_temp')
-        load_weather(forecasts, client, 'test', 'cast_temp')
+        load_weather(current, client, 'test', 'obs_temp', loader=loader)
+        load_weather(forecasts, client, 'test', 'cast_temp', loader=loader)
         
         # if the api request rate is greater than 60 just keep going. Otherwise check how many requests have been made
         # and if it's more than 120 start make_instants.
@@ -48,6 +53,7 @@ def get_and_make(codes):
         else:
             i+=1
             if n>=120:
+                loader.flush()
                 make_instants(client)
                 if time.time() - start_time < 60:
                     print(f'Waiting {start_time+60 - time.time()} seconds before resuming API calls.')
@@ -55,6 +61,7 @@ def get_and_make(codes):
                     start_time = time.time()
                 n = 0
 
+    loader.close()
     # sort the last of the documents in temp collections
     try:
         make_instants(client)
@@ -73,6 +80,8 @@ if __name__ == '__main__':
         directory = os.path.join(os.environ['HOME'], 'data', 'forecast-forecast')
         filename = os.path.join(directory, 'ETL', 'Extract', 'resources', 'success_zipsNC.csv')
         codes = read_list_from_file(filename)
-    client = MongoClient(host=host, port=port)
+    client = db_pool.client_for('local')
+    open_ledger(client)
+    ensure_indexes(client, 'test')
     get_and_make(codes)
-    client.close()
\ No newline at end of file
+    db_pool.close()
\ No newline at end of file
@@ -17,7 +17,8 @@ from pymongo.errors import DuplicateKeyError, ConfigurationError
 from urllib.parse import quote
 
 from config import user, password, socket_path
-from ETL.db_ops import Client
+from instant_key import upsert_for
+from db_pool import client_for
 
 
 # use the local host and port for all the primary operations
@@ -74,7 +75,7 @@ def find_data(client, database, collection, filters={}):
     col = Collection(db, collection)
     return col.find(filters).batch_size(100)
 
-def load_weather(data, client, database, collection):
+def load_weather(data, client, database, collection, loader=None):
     ''' Load data to specified database collection. This determines the
     appropriate way to process the load depending on the
     collection to which it should be loaded. Data is expected to be a weather
@@ -94,7 +95,12 @@ def load_weather(data, client, database, collection):
     :type database: str
     :param collection: the database collection to be used
     :type collection: str
+    :param loader: buffer the write in the bulk loader rather than making it
+    now (see bulk.py)
+    :type loader: bulk.BulkLoader
     ''' 
+    if loader is not None:
+        return loader.add(data, collection)
     col = dbncol(client, collection, database=database)
     # decide how to handle the loading process depending on where the document
     # will be loaded.
@@ -108,6 +114,7 @@ def load_weather(data, client, database, collection):
         try:
             filters = {'zipcode': data.pop('zipcode'),\
                        'instant': data.pop('instant')}
+            filters, updates = upsert_for(filters, updates)
             col.find_one_and_update(filters, updates,  upsert=True)
         except DuplicateKeyError:
             return(f'DuplicateKeyError, could not insert data.')
@@ -164,6 +171,7 @@ def update_command_for(data):
         filters = {'zipcode': data.pop('zipcode'), \
                    'instant': data.pop('instant')}
         updates = {'$push': {'forecasts': data}}  # $push appends to list
+    filters, updates = upsert_for(filters, updates)
     return UpdateOne(filters, updates,  upsert=True)
 
 def delete_command_for(data):
@@ -280,7 +288,7 @@ def copy_docs(col, destination_db, destination_col, filters={}, delete=False):
     :type filters: dict
     '''
 
-    client = Client(host=host, port=port)
+    client = client_for('local')
     copy = []
     n=0
     original = col.find(filters)
@@ -306,7 +314,6 @@ def make_instants(client):
     inst_col = dbncol(client, "instant_temp", database=database)
     forecasts = cast_col.find({})
     observations = obs_col.find({})
-    inst_col.create_index([('instant', pymongo.DESCENDING)])
     inst_col.bulk_write(make_load_list_from_cursor(forecasts))
     inst_col.bulk_write(make_load_list_from_cursor(observations))
 
@@ -314,5 +321,12 @@ def make_instants(client):
     copy_docs(obs_col, database, 'obs_archive', delete=True)
 
 
-client = MongoClient(host=host, port=port)
-remote_client = Client(uri)
\ No newline at end of file
+def __getattr__(name):
+    ''' The module's client and remote_client, from the pool on first use
+    rather than made on import. '''
+
+    if name == 'client':
+        return client_for('local')
+    if name == 'remote_client':
+        return client_for('remote')
+    raise AttributeError(f'module {__name__} has no attribute {name}')
@@ -0,0 +1,127 @@
+''' A buffered bulk loader. load_weather() makes a round trip to the database for every document, one insert_one() or
+find_one_and_update() at a time. A BulkLoader instead keeps the documents for each collection in a buffer and writes
+the buffer in one unordered insert_many(), or bulk_write() of upserts for the instant collections, once it holds
+bulk_size documents or its oldest document has waited bulk_interval seconds. The documents that fail in a batch are
+reported with their error, and the rest of the batch is still written. Everything still buffered is written when the
+loader is flushed, closed or left as a context manager, and at the latest when the process exits. Pass the loader to
+load_weather() to use it in place of the single writes. '''
+
+import time
+import atexit
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from instant_key import upsert_for, instant_collections
+
+try:
+    from config import bulk_size    # documents buffered for a collection before they are written
+except ImportError:
+    bulk_size = 500
+try:
+    from config import bulk_interval    # the most seconds a document waits in the buffer
+except ImportError:
+    bulk_interval = 5
+
+
+def update_for(data):
+    ''' Make the upsert of a weather document into its instant, the way load_weather() does it for the instant
+    collections.
+
+    :param data: the dictionary created from the api calls
+    :type data: dict
+
+    :return: the upsert
+    :type: pymongo.UpdateOne
+    '''
+    if 'Weather' in data:
+        filters = {'zipcode': data['Weather'].pop('zipcode'), 'instant': data['Weather'].pop('instant')}
+        updates = {'$set': {'weather': data['Weather']}}   # add the weather to the instant document
+    else:
+        filters = {'zipcode': data.pop('zipcode'), 'instant': data.pop('instant')}
+        updates = {'$push': {'forecasts': data}}    # append the forecast object to the forecasts list
+    return UpdateOne(*upsert_for(filters, updates), upsert=True)
+
+
+class BulkLoader:
+    ''' Buffers the writes for each collection of a database and writes them in bulk. '''
+
+    def __init__(self, client, database='test', size=bulk_size, interval=bulk_interval):
+        '''
+        :param client: a MongoClient instance
+        :type client: pymongo.MongoClient
+        :param database: the database to be used
+        :type database: str
+        :param size: documents buffered for a collection before they are written
+        :type size: int
+        :param interval: the most seconds a document waits in the buffer before it is written with the next one added
+        :type interval: float
+        '''
+
+        self.client = client
+        self.database = database
+        self.size = size
+        self.interval = interval
+        self.buffers = {}   # the upserts, or the documents to insert, waiting for each collection
+        self.since = {}     # the time the oldest write in each buffer was added
+        self.written = 0
+        self.batches = 0
+        self.errors = []    # the collection, index, code and message of each write that failed
+        atexit.register(self.flush)
+
+    def add(self, data, collection):
+        ''' Buffer a document for the collection, writing the buffer if it is full or has waited long enough.
+
+        :param data: the dictionary created from the api calls
+        :type data: dict
+        :param collection: the database collection to be used
+        :type collection: str
+        '''
+        buffer = self.buffers.setdefault(collection, [])
+        if not buffer:
+            self.since[collection] = time.monotonic()
+        buffer.append(update_for(data) if collection in instant_collections else data)
+        if len(buffer) >= self.size or time.monotonic() - self.since[collection] >= self.interval:
+            self.write(collection)
+
+    def write(self, collection):
+        ''' Write the buffer for the collection in one call. '''
+
+        commands = self.buffers.pop(collection, [])
+        if not commands:
+            return
+        col = self.client[self.database][collection]
+        try:
+            if collection in instant_collections:
+                result = col.bulk_write(commands, ordered=False)
+                self.written += result.upserted_count + result.modified_count
+            else:
+                result = col.insert_many(commands, ordered=False)
+                self.written += len(result.inserted_ids)
+        except BulkWriteError as e:
+            details = e.details
+            self.written += sum(details.get(n, 0) for n in ('nInserted', 'nUpserted', 'nModified'))
+            errors = [(collection, error['index'], error['code'], error['errmsg']) for error in details['writeErrors']]
+            self.errors += errors
+            duplicates = sum(code == 11000 for collection, index, code, message in errors)
+            print(f'{len(errors)} of {len(commands)} writes to {collection} failed ({duplicates} duplicate keys); '
+                  f'first error: {errors[0][3] if errors else details.get("writeConcernErrors")}')
+        self.batches += 1
+
+    def flush(self):
+        ''' Write everything still buffered, ie before the documents are read back by make_instants(). '''
+
+        for collection in list(self.buffers):
+            self.write(collection)
+
+    def close(self):
+        ''' Flush the buffers. The loader is not needed at exit after this. '''
+
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
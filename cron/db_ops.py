@@ -9,6 +9,9 @@ from pymongo.errors import ConnectionFailure, DuplicateKeyError
 from pymongo.errors import InvalidDocument, OperationFailure, ConfigurationError
 from urllib.parse import quote
 
+from instant_key import upsert_for
+from db_pool import client_for
+
 
 database = 'test'
 
@@ -44,38 +47,17 @@ def check_db_access(client):
     return
 
 def Client(uri):
-    ''' Create and return a pymongo MongoClient object. If the uri is given but
-    for whatever reason the MongoClient cannot be made, then revert to the local
-    instance of a MongoDB server.
-    
-    *** This function is most appropriately used for the remote client
-    connection using a proper uri; for local connections you should just use the
-    pymongo MongoClient() as is.
-    ***
+    ''' Get the process's pooled MongoClient (see db_pool.py): the remote one if
+    a uri is given, which is the local one again if the remote server cannot be
+    resolved, otherwise the local one. The client is shared, and connects on
+    its first operation.
 
-    :param uri: the remote server URI. must be uri encoded
+    :param uri: the remote server URI. the one in config is used
     type uri: uri encoded sting
     '''
     
-    if uri:
-        try:
-            client = MongoClient(uri)
-            return client
-        except:
-            # Regardless of the error, print the error message and connect to the
-            # local MongoDB instance.
-            host = 'localhost'
-            port = 27017
-            client = MongoClient(host=host, port=port)
-            return client
-    else:
-        try:
-            client = MongoClient(host=host, port=port)
-            return client
-        except ConnectionFailure:
-            print('caught ConnectionFailure on local server. Returning -1 flag')
-            return -1
-    
+    return client_for('remote' if uri else 'local')
+
 def dbncol(client, collection, database=database):
     ''' Make a connection to the database and collection given in the arguments.
 
@@ -129,6 +111,7 @@ def load(data, client, database, collection):
         try:
             # check to see if there is a document that fits the parameters. If
             # there is, update it, if there isn't, upsert it.
+            filters, updates = upsert_for(filters, updates)
             return col.find_one_and_update(filters, updates,  upsert=True)
         except DuplicateKeyError:
             return(f'DuplicateKeyError, could not insert data to {collection}')
@@ -160,7 +143,7 @@ def copy_docs(col, destination_db, destination_col, filters={}, delete=False):
     By default all collection docs will be copied
     :type filters: dict
     '''
-    client = Client(host=host, port=port)
+    client = client_for('local')
     original = col.find(filters).batch_size(1000)
     copy = []
     for item in original:
@@ -1,5 +1,7 @@
 ''' Defines the Instant class and some useful functions. '''
 
+sweep_age = 453000  # seconds past its instant before one is swept: about 5 days
+
 
 class Instant:
 
@@ -97,17 +99,17 @@ def sweep(instants):
     # cursor over the database.
     if type(instants) == dict:
         for key, doc in instants:
-            if key['instant'] < time.time()-453000:  # 453000sec: about 5 days
+            if key['instant'] < time.time()-sweep_age:
                 col.delete_one(doc)
                 n += 1
     elif type(instants) == list:
         for doc in instants:
-            if doc['instant'] < time.time()-453000:
+            if doc['instant'] < time.time()-sweep_age:
                 col.delete_one(doc)
                 n += 1
     elif type(instants) == pymongo.cursor.Cursor:
         for doc in instants:
-            if doc['instant'] < time.time()-453000:
+            if doc['instant'] < time.time()-sweep_age:
                 col.delete_one(doc)
                 n += 1
     else:
@@ -178,5 +180,5 @@ if __name__ == '__main__':
     collection = 'instant_temp'
     col = db_ops.dbncol(config.client, collection, database=config.database)
     cast_count_all(col.find({}))
-    sweep(col.find({}))
+    sweep(col.find({'instant': {'$lt': time.time()-sweep_age}}))
     print(f'Total op time for instant.py was {time.time()-start_time} seconds')
\ No newline at end of file
@@ -0,0 +1,128 @@
+''' A shared API quota ledger in MongoDB. Each collecting process used to keep its own count of the calls it made, so two
+runs that overlapped (a cron job still going when the next one starts, or the cron box and the gcloud VM at once) went
+over the per-minute quota between them. Here every call first reserves its place in a per-key, per-minute counter
+document in the ledger collection. The reservation is a single conditional upsert, so any number of processes on any
+number of hosts can share it: once a key's count for the minute reaches the quota the upsert fails with a
+DuplicateKeyError and the caller waits for the next minute. Point ledger_uri in config at the same MongoDB on every host
+to share the budget between hosts; by default each run's own client is used. The ledger's TTL index, which clears out
+the old minutes, is declared in indexes.py and made by ensure_indexes() with the rest. '''
+
+import time
+import hashlib
+import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+import db_pool
+
+try:
+    from config import calls_per_minute     # the API quota for each key
+except ImportError:
+    calls_per_minute = 60
+try:
+    from config import ledger_uri   # the MongoDB every collecting host shares the ledger on
+except ImportError:
+    ledger_uri = None
+try:
+    from config import ledger_database
+except ImportError:
+    ledger_database = 'owmap'
+
+
+def key_id(key):
+    ''' A name for the API key that does not give the key away, for the ledger documents. '''
+
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+def ledger_collection(client=None, database=ledger_database):
+    ''' The collection the ledger is kept in: on the server at ledger_uri if one is set in config, else on the client's.
+
+    :param client: a MongoClient instance. Not used when ledger_uri is set in config
+    :type client: pymongo.MongoClient
+    :param database: the database the ledger is kept in
+    :type database: str
+
+    :return: the ledger collection
+    :type: pymongo.collection.Collection
+    '''
+    if ledger_uri:
+        client = db_pool.client_for('ledger')
+    return client[database]['quota_ledger']
+
+
+class QuotaLedger:
+    ''' The per-minute call counts for the API keys, shared by every process using the same collection. '''
+
+    def __init__(self, client=None, database=ledger_database, calls_per_minute=calls_per_minute):
+        '''
+        :param client: a MongoClient instance. Not used when ledger_uri is set in config
+        :type client: pymongo.MongoClient
+        :param database: the database the ledger is kept in
+        :type database: str
+        :param calls_per_minute: the API quota for each key
+        :type calls_per_minute: int
+        '''
+
+        self.col = ledger_collection(client, database)
+        self.limit = calls_per_minute
+
+    @staticmethod
+    def minute(now=None):
+        ''' The number of the minute, counted from the epoch. '''
+
+        return int((now or time.time())//60)
+
+    def reserve(self, key, calls=1):
+        ''' Reserve calls on the key for this minute.
+
+        :param key: the API key
+        :type key: string
+        :param calls: the number of calls to reserve
+        :type calls: int
+
+        :return: True if the calls were reserved, False if the key's quota for this minute is used up
+        :type: bool
+        '''
+        minute = self.minute()
+        try:
+            self.col.update_one({'_id': f'{key_id(key)}-{minute}', 'calls': {'$lte': self.limit - calls}},
+                                {'$inc': {'calls': calls},
+                                 '$setOnInsert': {'expires': datetime.datetime.utcfromtimestamp(60*(minute + 2))}},
+                                upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def wait_time(self):
+        ''' The number of seconds until the next minute starts. '''
+
+        return 60*(self.minute() + 1) - time.time()
+
+    def reserve_blocking(self, key):
+        ''' Reserve a call on the key, waiting for the next minute as long as the quota is used up. '''
+
+        while not self.reserve(key):
+            time.sleep(self.wait_time())
+
+
+ledger = None   # the ledger reserve() uses, set by open_ledger()
+
+
+def open_ledger(client=None):
+    ''' Set up the ledger for reserve(), ie at the start of a run.
+
+    :param client: a MongoClient instance
+    :type client: pymongo.MongoClient
+
+    :return: the ledger
+    :type: QuotaLedger
+    '''
+    global ledger
+    ledger = QuotaLedger(client)
+    return ledger
+
+def reserve(key):
+    ''' Wait for a call on the API key in the ledger, if one has been opened. '''
+
+    if ledger is not None:
+        ledger.reserve_blocking(key)
@@ -21,6 +21,12 @@ from config import OWM_API_key_loohoo as loohoo_key
 from config import OWM_API_key_masta as masta_key
 from config import port, host, user, password, socket_path
 
+from quota import reserve, open_ledger
+from indexes import ensure_indexes
+from bulk import BulkLoader
+import db_pool
+from instant_key import upsert_for
+
 
 def read_list_from_file(filename):
     """ Read the zip codes list from the csv file.
@@ -49,8 +55,10 @@ def get_data_from_weather_api(owm, zipcode=None, coords=None):
     while result is None and tries < 4:
         try:
             if coords:
+                reserve(owm.get_API_key())  # once per call, on the key making it
                 result = owm.three_hours_forecast_at_coords(**coords)
             elif zipcode:
+                reserve(owm.get_API_key())  # once per call, on the key making it
                 result = owm.weather_at_zip_code(zipcode, 'us')
         except APIInvalidSSLCertificateError:
             loc = zipcode or 'lat: {}, lon: {}'.format(coords['lat'], coords['lon'])
@@ -188,7 +196,7 @@ def load_og(data, client, database, collection):
         except DuplicateKeyError:
             return(f'DuplicateKeyError, could not insert data into {collection}.')
 
-def load_weather(data, client, database, collection):
+def load_weather(data, client, database, collection, loader=None):
     ''' Load data to specified database collection. This determines the
     appropriate way to process the load depending on the collection to which it
     should be loaded. Data is expected to be a weather-type dictionary. When
@@ -207,7 +215,12 @@ def load_weather(data, client, database, collection):
     :type database: str
     :param collection: the database collection to be used
     :type collection: str
+    :param loader: buffer the write in the bulk loader rather than making it
+    now (see bulk.py)
+    :type loader: bulk.BulkLoader
     ''' 
+    if loader is not None:
+        return loader.add(data, collection)
     col = dbncol(client, collection, database=database)
     # decide how to handle the loading process depending on where the document
     # will be loaded.
@@ -222,8 +235,7 @@ def load_weather(data, client, database, collection):
                         'instant':data.pop('instant')}
             updates = {'$push': {'forecasts': data}} # append to forecasts list
         try:
-            filters = {'zipcode':data.pop('zipcode'),
-                        'instant':data.pop('instant')}
+            filters, updates = upsert_for(filters, updates)
             col.find_one_and_update(filters, updates,  upsert=True)
         except DuplicateKeyError:
             return(f'DuplicateKeyError, could not insert data to {collection}')
@@ -249,6 +261,7 @@ def request_and_load(codes):
     i, n = 0, 0 # i for counting zipcodes processed and n for counting API
                 # calls made; API calls limited to maximum of 60/minute/apikey.
     start_time = time.time()
+    loader = BulkLoader(local_client, 'owmap') # writes in bulk
     for code in codes:
         try:
             current = get_current_weather(code)
@@ -263,8 +276,8 @@ def request_and_load(codes):
             print(f'got AttributeError for {code}. Continuing to next code.')
             continue
         n+=1
-        load_weather(current, local_client, 'owmap', 'obs_temp')
-        load_weather(forecasts, local_client, 'owmap', 'cast_temp')
+        load_weather(current, local_client, 'owmap', 'obs_temp', loader=loader)
+        load_weather(forecasts, local_client, 'owmap', 'cast_temp', loader=loader)
         
         # if the api request rate is greater than 60 just keep going. Otherwise
         # check how many requests have been made and if it's more than 120
@@ -278,12 +291,14 @@ def request_and_load(codes):
             i+=1
             if n>20:
                 print('about to start making instants')
+                loader.flush()
                 import make_instants    # run the file that creates instants
                                         # from the documents just loaded
                 if time.time() - start_time < 60:
                     print(f'Waiting {start_time+60 - time.time()} seconds.')
                     time.sleep(start_time - time.time() + 60)
                     start_time = time.time()
+    loader.close()
     print(f'task took {time.time() -  start_start}sec and processed {i} codes')
 
 
@@ -298,6 +313,8 @@ if __name__ == '__main__':
         directory = os.path.join(os.environ['HOME'], 'data', 'forecast-forecast')
         filename = os.path.join(directory, 'ETL', 'Extract', 'resources', 'success_zipsNC.csv')
         codes = read_list_from_file(filename)
-    local_client = MongoClient(host=host, port=port)
+    local_client = db_pool.client_for('local')
+    open_ledger(local_client)
+    ensure_indexes(local_client, 'owmap')
     request_and_load(codes)
-    local_client.close()
\ No newline at end of file
+    db_pool.close()
\ No newline at end of file
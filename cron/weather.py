@@ -12,6 +12,7 @@ from pyowm.exceptions.api_call_error import APIInvalidSSLCertificateError
 from config import OWM_API_key_loohoo as loohoo_key
 from config import OWM_API_key_masta as masta_key
 from instant import Instant
+from instant_key import instant_id, slot
 
 
 class Weather:
@@ -33,9 +34,10 @@ class Weather:
         self.weather = data
         # make the _id for each weather according to its reference time
         if _type == 'forecast' and 'reference_time' in data:
-            self._id = f'{str(location)}{str(data["reference_time"])}'
+            self._id = instant_id(location, data['reference_time'])
         elif _type == 'observation' and 'Weather' in data:
-            self._id = f'{str(location)}{str(10800 * (data["Weather"]["reference_time"]//10800 + 1))}'
+            self._id = instant_id(location,
+                                  slot(data['Weather']['reference_time']))
         self.as_dict = {'_id': self._id,
                        '_type': self.type,
                         'weather': self.weather
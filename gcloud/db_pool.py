@@ -0,0 +1,88 @@
+''' Process-wide MongoDB clients, one per target. Client() was defined in several modules and every call made a new
+MongoClient, with its own connection pool and monitor threads: make_instants.py made two at import, one of them for the
+remote server, and copy_docs() made another on every call. Here there is one MongoClient for the local server and one
+for the remote server (and one for the quota ledger's server, if it has its own, see quota.py), made the first time
+each is asked for and shared by everything in the process, the way pool.py shares a session per API key. The clients
+are made with connect=False, so nothing connects until the first operation, and with pool sizes and timeouts suited to
+a few loader threads rather than pymongo's defaults. Close them with close() when the process is done. '''
+
+import threading
+from urllib.parse import quote
+
+from pymongo import MongoClient
+from pymongo.errors import ConfigurationError
+
+from config import port, host
+
+try:
+    from config import uri  # the remote server
+except ImportError:
+    try:
+        from config import user, password, socket_path
+        uri = "mongodb+srv://%s:%s@%s" % (user, quote(password), socket_path)
+    except ImportError:
+        uri = None
+try:
+    from config import ledger_uri   # the server the quota ledger is shared on
+except ImportError:
+    ledger_uri = None
+try:
+    from config import db_pool_size     # the most connections each client opens to its server
+except ImportError:
+    db_pool_size = 10
+try:
+    from config import db_timeout   # seconds to find and connect to a server before an operation fails
+except ImportError:
+    db_timeout = 10
+
+clients = {}    # the MongoClient for each target, 'local', 'remote' or 'ledger'
+lock = threading.Lock()
+
+
+def options():
+    ''' The MongoClient options shared by every target. '''
+
+    return {'maxPoolSize': db_pool_size,
+            'minPoolSize': 1,   # keep a connection warm between batches
+            'maxIdleTimeMS': 300000,    # but let the rest go between daemon windows
+            'serverSelectionTimeoutMS': db_timeout*1000,
+            'connectTimeoutMS': db_timeout*1000,
+            'socketTimeoutMS': 300000,  # long enough for the bulk writes of make_instants()
+            'appname': 'forecast-forecast',
+            'connect': False}
+
+def connect(target):
+    ''' Make the client for the target. The remote server falls back to the local one if its uri cannot be
+    resolved, as Client() always did, and the ledger's server is the local one unless ledger_uri is set.
+    '''
+    if target == 'ledger' and ledger_uri:
+        return MongoClient(ledger_uri, **options())
+    if target == 'remote' and uri:
+        try:
+            return MongoClient(uri, **options())
+        except ConfigurationError as e:
+            print(f'could not make the remote client ({e}), likely a DNS timeout; using the local server')
+    return MongoClient(host=host, port=port, **options())
+
+def client_for(target='local'):
+    ''' Get the process's client for the target, making it the first time.
+
+    :param target: 'local' for the MongoDB in config's host and port, 'remote' for the one at its uri, 'ledger' for
+    the one at its ledger_uri
+    :type target: string
+
+    :return: the shared client
+    :type: pymongo.MongoClient
+    '''
+    with lock:
+        if target not in clients:
+            clients[target] = connect(target)
+        return clients[target]
+
+def close():
+    ''' Close every client, ie at the end of the process. '''
+
+    with lock:
+        for client in clients.values():
+            client.close()
+        clients.clear()
@@ -17,6 +17,11 @@ from pymongo.errors import ConnectionFailure, InvalidDocument, DuplicateKeyError
 from config import OWM_API_key_loohoo as loohoo_key, OWM_API_key_masta as masta_key
 from config import port, host, uri
 
+from quota import reserve, open_ledger
+from indexes import ensure_indexes
+from bulk import BulkLoader
+from instant_key import upsert_for
+
 
 def read_list_from_file(filename):
     """ Read the zip codes list from the csv file.
@@ -44,8 +49,10 @@ def get_data_from_weather_api(owm, zipcode=None, coords=None):
     while result is None and tries < 4:
         try:
             if coords:
+                reserve(owm.get_API_key())  # once per call, on the key making it
                 result = owm.three_hours_forecast_at_coords(**coords)
             elif zipcode:
+                reserve(owm.get_API_key())  # once per call, on the key making it
                 result = owm.weather_at_zip_code(zipcode, 'us')
         except APIInvalidSSLCertificateError:
             loc = zipcode or 'lat: {}, lon: {}'.format(coords['lat'], coords['lon'])
@@ -174,7 +181,7 @@ def load_og(data, client, database, collection):
         except DuplicateKeyError:
             return('DuplicateKeyError, could not insert data into {collection}.')
 
-def load_weather(data, client, database, collection):
+def load_weather(data, client, database, collection, loader=None):
     ''' Load data to specified database collection. This determines the appropriate way to process the load depending on the
     collection to which it should be loaded. Data is expected to be a weather-type dictionary. When the collection is "instants"
     the data is appended the specified object's forecasts array in the instants collection; when the collection is either
@@ -189,7 +196,11 @@ def load_weather(data, client, database, collection):
     :type database: str
     :param collection: the database collection to be used
     :type collection: str
+    :param loader: buffer the write in the bulk loader rather than making it now (see bulk.py)
+    :type loader: bulk.BulkLoader
     ''' 
+    if loader is not None:
+        return loader.add(data, collection)
     col = dbncol(client, collection, database=database)
     # decide how to handle the loading process depending on where the document will be loaded.
     if collection == 'instant' or collection == 'test_instants' or collection == 'instant_temp':
@@ -201,8 +212,7 @@ def load_weather(data, client, database, collection):
             filters = {'zipcode':data.pop('zipcode'), 'instant':data.pop('instant')}
             updates = {'$push': {'forecasts': data}} # append the forecast object to the forecasts list
         try:
-            filters = {'zipcode':data.pop('zipcode'), 'instant':data.pop('instant')}
-            col.find_one_and_update(filters, updates,  upsert=True)
+            col.find_one_and_update(*upsert_for(filters, updates),  upsert=True)
         except DuplicateKeyError:
             return('DuplicateKeyError, could not insert data into {collection}.')
     elif collection == 'observed' or collection == 'forecasted' or collection == 'obs_temp' or collection == 'cast_temp':
@@ -222,6 +232,7 @@ def request_and_load(codes):
     print('task began at {start_start}')
     i, n = 0, 0 # i for counting zipcodes processed and n for counting API calls made; API calls limited to a maximum of 60/minute/apikey.
     start_time = time.time()
+    loader = BulkLoader(local_client, 'owmap') # the documents are written in bulk
     for code in codes:
         try:
             current = get_current_weather(code)
@@ -236,8 +247,8 @@ def request_and_load(codes):
             print('got AttributeError while collecting forecasts for {code}. Continuing to next code.')
             continue
         n+=1
-        load_weather(current, local_client, 'owmap', 'obs_temp')
-        load_weather(forecasts, local_client, 'owmap', 'cast_temp')
+        load_weather(current, local_client, 'owmap', 'obs_temp', loader=loader)
+        load_weather(forecasts, local_client, 'owmap', 'cast_temp', loader=loader)
         
         # if the api request rate is greater than 60 just keep going. Otherwise check how many requests have been made
         # and if it's more than 120 start make_instants.
@@ -250,11 +261,13 @@ def request_and_load(codes):
             i+=1
             if n>20:
                 print('about to start making instants')
+                loader.flush()
                 import make_instants # run the file that creates instants from the documents just loaded
                 if time.time() - start_time < 60:
                     print('Waiting {start_time+60 - time.time()} seconds before resuming API calls.')
                     time.sleep(start_time - time.time() + 60)
                     start_time = time.time()
+    loader.close()
     print('task took {time.time() -  start_start} seconds and processed {i} zipcodes')
 
 
@@ -273,5 +286,7 @@ if __name__ == '__main__':
         # filename = os.path.join(directory, 'ETL', 'Extract', 'resources', 'success_zipsNC.csv')
         # codes = read_list_from_file(filename)
     client = Client(uri=uri)
+    open_ledger(client)
+    ensure_indexes(client, 'owmap')
     request_and_load(codes)
     client.close()
\ No newline at end of file
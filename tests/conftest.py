@@ -0,0 +1,63 @@
+''' Test setup for the modules in ETL/Extract. They import each other by name and read their settings from a config
+module that each deployment keeps to itself, so the tests put ETL/Extract on the path and give them a config with test
+values in place of the keys and servers. '''
+
+import os
+import sys
+import types
+
+import pytest
+import mongomock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ETL', 'Extract'))
+
+config = types.ModuleType('config')
+config.OWM_API_key_loohoo = 'loohoo'
+config.OWM_API_key_masta = 'masta'
+config.port = 27017
+config.host = 'localhost'
+config.user = 'user'
+config.password = 'password'
+config.socket_path = 'cluster.example.net'
+sys.modules.setdefault('config', config)
+
+
+class Clock:
+    ''' Stands in for the time module, moving on only when it is slept on or moved by hand. '''
+
+    def __init__(self, now=1593194400):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def client():
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    ''' Point dbncol(), and the modules that import it by name, at plain collection lookups, which mongomock supports
+    where Database() does not. '''
+
+    import importlib
+
+    def dbncol(client, collection, database='test'):
+        return client[database][collection]
+
+    for name in ('request_and_load', 'retry', 'workqueue', 'priority'):
+        monkeypatch.setattr(importlib.import_module(name), 'dbncol', dbncol)
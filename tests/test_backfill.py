@@ -0,0 +1,29 @@
+import json
+
+import backfill
+from backfill import Backfill
+
+instant = 1593205200
+
+
+def archived(path, *times):
+    ''' Write an archive of raw responses with a current weather observation for 27006 taken at each of the times. '''
+
+    path.mkdir()
+    with open(path / '2020-06-26.jsonl', 'w') as f:
+        for dt in times:
+            body = {'coord': {'lat': 35.99, 'lon': -80.44}, 'dt': dt, 'main': {'temp': 290.1}, 'id': 4460243}
+            f.write(json.dumps({'endpoint': 'weather', 'name': '27006', 'recorded_at': dt, 'status': 200,
+                                'body': body}) + '\n')
+    return str(path)
+
+def test_only_the_closest_observation_to_an_instant_is_kept_across_files(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, 'load_geocodes', lambda: {'27006': {'lat': 35.99, 'lon': -80.44}})
+    monkeypatch.setattr(backfill, 'dbncol', lambda client, collection, database='test': client[database][collection])
+    paths = [archived(tmp_path / 'first', instant - 9000, instant - 1800),
+             archived(tmp_path / 'second', instant - 600, instant - 5400)]
+    loaded = Backfill(client, 'test', workers=1).run(paths)
+    assert loaded['obs_temp'] == 1
+    [doc] = client['test']['obs_temp'].find()
+    assert (doc['Weather']['zipcode'], doc['Weather']['instant']) == ('27006', instant)
+    assert doc['Weather']['time_to_instant'] == 600
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import breaker
+from breaker import Breakers, CircuitBreaker, CircuitOpenError
+from fetch import FetchRun
+from ratelimit import KeyScheduler
+
+
+@pytest.fixture
+def tripped(monkeypatch, clock):
+    ''' A breaker that has just tripped on two failures out of its four calls. '''
+
+    monkeypatch.setattr(breaker, 'time', clock)
+    tripped = CircuitBreaker(window=4, min_calls=4, threshold=0.5, cooldown=30)
+    for success in (True, True, False, False):
+        tripped.record(success)
+    return tripped
+
+def test_a_breaker_trips_on_its_error_rate(monkeypatch, clock):
+    monkeypatch.setattr(breaker, 'time', clock)
+    closed = CircuitBreaker(window=4, min_calls=4, threshold=0.5, cooldown=30)
+    for success in (False, False, True):
+        closed.record(success)
+    assert closed.state == 'closed' and closed.available    # too few calls to trip on
+    closed.record(False)
+    assert closed.state == 'open' and not closed.available
+
+def test_an_open_breaker_waits_out_its_cooldown(tripped, clock):
+    assert tripped.wait_time() == 30
+    clock.now += 20
+    assert tripped.wait_time() == 10 and not tripped.available
+    clock.now += 10
+    assert tripped.wait_time() == 0 and tripped.available
+
+def test_a_successful_probe_closes_the_breaker(tripped, clock):
+    clock.now += 30
+    tripped.claim()
+    assert tripped.state == 'half_open'
+    tripped.record(True)
+    assert tripped.state == 'closed' and tripped.available
+    assert not tripped.results     # the failures from before the trip are forgotten
+
+def test_a_failed_probe_opens_the_breaker_for_another_cooldown(tripped, clock):
+    clock.now += 30
+    tripped.claim()
+    tripped.record(False)
+    assert tripped.state == 'open'
+    assert tripped.wait_time() == 30
+
+def test_only_one_probe_is_let_through(tripped, clock):
+    clock.now += 30
+    tripped.claim()
+    assert not tripped.available
+    assert tripped.wait_time() == 30    # at most another cooldown, if the probe fails
+
+def test_the_scheduler_claims_the_probe_for_a_single_call(monkeypatch, clock):
+    monkeypatch.setattr(breaker, 'time', clock)
+    breakers = Breakers(window=1, min_calls=1, cooldown=30)
+    breakers.get('a', 'weather').record(False)
+    scheduler = KeyScheduler(keys=['a'], breakers=breakers)
+    clock.now += 30
+    assert scheduler.try_acquire('weather') == 'a'
+    with pytest.raises(CircuitOpenError):
+        scheduler.try_acquire('weather')
+
+def test_call_api_fails_fast_when_every_breaker_is_open(monkeypatch, clock):
+    monkeypatch.setattr(breaker, 'time', clock)
+    breakers = Breakers(window=1, min_calls=1, cooldown=30)
+    for key in ('a', 'b'):
+        breakers.get(key, 'forecast').record(False)
+    run = FetchRun(scheduler=KeyScheduler(keys=['a', 'b'], breakers=breakers))
+    calls = []
+
+    async def call():
+        return await run.call_api(lambda **kwargs: calls.append(kwargs), endpoint='forecast')
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call())
+    assert not calls
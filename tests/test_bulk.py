@@ -0,0 +1,92 @@
+import bulk
+from bulk import BulkLoader
+from ingest import Archiver, ingest
+from pipeline import Loader
+
+instant = 1593205200
+
+
+def current(code):
+    return {'Weather': {'zipcode': code, 'instant': instant, 'temperature': {'temp': 290.1}}}
+
+def forecasts(code):
+    return {'zipcode': code, 'reception_time': instant - 3600,
+            'weathers': [{'zipcode': code, 'instant': instant + 10800*i, 'temperature': {'temp': 291.4}}
+                         for i in range(3)]}
+
+
+def test_a_buffer_is_written_once_it_holds_size_documents(client):
+    loader = BulkLoader(client, 'test', size=3, interval=60)
+    for i in range(2):
+        loader.add({'i': i}, 'obs_temp')
+    assert client['test']['obs_temp'].count_documents({}) == 0
+    loader.add({'i': 2}, 'obs_temp')
+    assert client['test']['obs_temp'].count_documents({}) == 3
+    assert (loader.written, loader.batches) == (3, 1)
+    loader.close()
+
+def test_a_buffer_is_written_once_it_has_waited_interval_seconds(client, clock, monkeypatch):
+    monkeypatch.setattr(bulk, 'time', clock)
+    loader = BulkLoader(client, 'test', size=100, interval=5)
+    loader.add({'i': 0}, 'obs_temp')
+    clock.now += 5
+    loader.add({'i': 1}, 'obs_temp')
+    assert client['test']['obs_temp'].count_documents({}) == 2
+    loader.close()
+
+def test_the_rest_of_a_batch_is_written_past_a_failed_write(client):
+    client['test']['obs_temp'].insert_one({'_id': 1})
+    loader = BulkLoader(client, 'test', size=3, interval=60)
+    for _id in range(3):
+        loader.add({'_id': _id}, 'obs_temp')
+    assert client['test']['obs_temp'].count_documents({}) == 3
+    assert loader.written == 2
+    assert [(collection, index, code) for collection, index, code, message in loader.errors] == [('obs_temp', 1, 11000)]
+    loader.close()
+
+def test_closing_writes_what_is_buffered_and_drops_the_exit_hook(client, monkeypatch):
+    hooks = []
+    monkeypatch.setattr(bulk.atexit, 'register', hooks.append)
+    monkeypatch.setattr(bulk.atexit, 'unregister', hooks.remove)
+    with BulkLoader(client, 'test', size=100, interval=60) as loader:
+        assert hooks == [loader.flush]   # written at the latest when the process exits
+        loader.add({'i': 0}, 'obs_temp')
+        loader.add(current('27006'), 'instant_temp')
+    assert client['test']['obs_temp'].count_documents({}) == 1
+    assert client['test']['instant_temp'].count_documents({}) == 1
+    assert hooks == []
+
+def test_ingest_upserts_each_location_into_its_instants(client):
+    with BulkLoader(client, 'test', size=100, interval=60) as loader:
+        ingest(loader, current('27006'), forecasts('27006'))
+        ingest(loader, None, forecasts('27006'))   # a second forecast for the same instants
+    col = client['test']['instant_temp']
+    assert col.count_documents({}) == 3
+    doc = col.find_one({'_id': f'27006-{instant}'})
+    assert (doc['zipcode'], doc['instant']) == ('27006', instant)
+    assert doc['weather'] == {'temperature': {'temp': 290.1}}
+    assert len(doc['forecasts']) == 2
+    assert col.find_one({'_id': f'27006-{instant + 10800}'}).get('weather') is None
+
+def test_ingest_leaves_what_it_is_given_alone(client):
+    location = current('27006'), forecasts('27006')
+    with BulkLoader(client, 'test') as loader:
+        ingest(loader, *location)
+    assert location == (current('27006'), forecasts('27006'))
+
+def test_the_archiver_writes_the_documents_to_the_archives(client):
+    with Archiver(client, 'test', size=2) as archiver:
+        for code in ('27006', '27007', '27008'):
+            archiver.put(current(code), forecasts(code))
+    assert client['test']['obs_archive'].count_documents({}) == 3
+    assert client['test']['cast_archive'].count_documents({}) == 3
+    assert archiver.error is None
+
+def test_a_direct_loader_ingests_and_archives(client):
+    with Loader(client, 'test', direct=True) as loader:
+        loader.put((current('27006'), forecasts('27006')))
+    assert loader.done == ['27006']
+    assert client['test']['instant_temp'].count_documents({}) == 3
+    assert client['test']['obs_archive'].count_documents({}) == 1
+    assert client['test']['cast_archive'].count_documents({}) == 1
+    assert client['test']['obs_temp'].count_documents({}) == client['test']['cast_temp'].count_documents({}) == 0
@@ -0,0 +1,33 @@
+import time
+
+from breaker import Breakers
+from fetch import catch_up
+from ratelimit import KeyScheduler
+from retry import RetriesExhausted, dead_letter
+
+
+def letters(client, *failures):
+    dead_letter(client, 'test', [(code, endpoint, RetriesExhausted(3, KeyError('nope'))) for code, endpoint in failures])
+
+
+def test_letters_behind_an_open_breaker_are_left_for_the_next_run(client, collections, monkeypatch):
+    letters(client, ('27006', 'weather'), ('27007', 'forecast'))
+    scheduler = KeyScheduler(keys=['a'], breakers=Breakers(cooldown=30))
+    scheduler.breakers.get('a', 'forecast').trip()
+    instant = 10800*(int(time.time())//10800 + 1)
+    monkeypatch.setattr(time, 'time', lambda: instant - 10)
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    assert catch_up(lambda codes: codes, scheduler, client, 'test', instant) == ['27006']
+    assert sleeps == []
+
+def test_the_breakers_are_waited_out_when_they_close_in_time(client, collections, monkeypatch):
+    letters(client, ('27006', 'forecast'))
+    scheduler = KeyScheduler(keys=['a'], breakers=Breakers(cooldown=30))
+    scheduler.breakers.get('a', 'forecast').trip()
+    instant = 10800*(int(time.time())//10800 + 1)
+    monkeypatch.setattr(time, 'time', lambda: instant - 600)
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    assert catch_up(lambda codes: codes, scheduler, client, 'test', instant) == ['27006']
+    assert len(sleeps) == 1 and 0 < sleeps[0] <= 30
@@ -0,0 +1,15 @@
+import cells
+from cells import cell_for, fan_out
+
+
+def test_cells_are_off_by_default():
+    assert cells.cell_size == 0
+
+def test_fan_out_gives_each_member_its_own_coordinates():
+    cell, center = cell_for({'lat': 35.99, 'lon': -80.44}, 0.1)
+    forecast = {'zipcode': '27006', 'coordinates': center, 'reception_time': 1593194400,
+                'weathers': [{'zipcode': '27006', 'instant': 1593205200}]}
+    member = fan_out(forecast, '27012', {'lat': 36.01, 'lon': -80.41})
+    assert member['coordinates'] == {'lat': 36.01, 'lon': -80.41}
+    assert member['weathers'][0]['zipcode'] == '27012'
+    assert forecast['coordinates'] == center and forecast['weathers'][0]['zipcode'] == '27006'
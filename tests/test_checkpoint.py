@@ -0,0 +1,22 @@
+from checkpoint import load_checkpoint, run_key, save_checkpoint, update
+
+
+def test_the_key_is_the_database_and_the_zip_list():
+    assert run_key(['27006', '27007']) == run_key(['27007', '27006'])
+    assert run_key(['27006', '27007']) != run_key(['27006'])
+    assert run_key(['27006'], 'test') != run_key(['27006'], 'owmap')
+
+def test_runs_with_other_zip_lists_do_not_share_progress(tmp_path):
+    nc, ga = run_key(['27006', '27007']), run_key(['30073'])
+    progress = load_checkpoint(1593205200, nc, str(tmp_path))
+    update(progress, ['27006'])
+    save_checkpoint(progress, str(tmp_path))
+    assert load_checkpoint(1593205200, ga, str(tmp_path))['done'] == []
+    assert load_checkpoint(1593205200, nc, str(tmp_path))['done'] == ['27006']
+
+def test_checkpoints_for_past_instants_are_pruned(tmp_path):
+    progress = load_checkpoint(1593205200, run_key(['27006']), str(tmp_path))
+    update(progress, ['27006'])
+    save_checkpoint(progress, str(tmp_path))
+    assert load_checkpoint(1593216000, run_key(['30073']), str(tmp_path))['done'] == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,44 @@
+import daemon
+from daemon import WindowDaemon
+
+
+def window(monkeypatch, clock, now, elapsed=0):
+    ''' Run one window of a daemon for two geocoded zipcodes from now, each phase taking elapsed seconds, and return
+    the endpoints of each phase and the sleeps it made. '''
+
+    clock.now = now
+    monkeypatch.setattr(daemon, 'time', clock)
+    monkeypatch.setattr(daemon.metrics, 'write', lambda: None)
+    phases = []
+    collector = WindowDaemon.__new__(WindowDaemon)
+    collector.codes = ['27006', '27007']
+    collector.geocodes = {'27006': {'lat': 36.0, 'lon': -80.4}, '27007': {'lat': 36.4, 'lon': -80.6}}
+    collector.versions = {}
+    collector.keys = 1
+    collector.breakers = None
+    collector.ledger = None
+    collector.after_window = None
+
+    def phase(endpoints, scheduler, codes=None):
+        phases.append(endpoints)
+        clock.now += elapsed
+        return len(codes)
+
+    collector.phase = phase
+    collector.window()
+    return phases, clock.sleeps
+
+def test_the_forecasts_come_first_when_there_is_time(monkeypatch, clock):
+    phases, sleeps = window(monkeypatch, clock, 1593194400)
+    assert phases == [('forecast',), ('weather',)]
+    assert all(seconds >= 0 for seconds in sleeps)
+
+def test_the_forecasts_come_after_the_observations_when_there_is_no_time(monkeypatch, clock):
+    phases, sleeps = window(monkeypatch, clock, 1593194400 + 10800 - 60)
+    assert phases == [('weather',), ('forecast',)]
+    assert all(seconds >= 0 for seconds in sleeps)
+
+def test_a_phase_running_past_the_instant_is_not_followed_by_a_sleep(monkeypatch, clock):
+    phases, sleeps = window(monkeypatch, clock, 1593194400, elapsed=10800)
+    assert phases == [('forecast',), ('weather',)]
+    assert sleeps == [0, 0]
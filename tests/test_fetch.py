@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+import fetch
+import pipeline
+import request_and_load
+from fetch import collect
+from pipeline import Loader
+from ratelimit import KeyScheduler
+from raw import RawOWM
+from replay import ReplayServer, Recording, save
+from request_and_load import current_weather_at_ids
+
+coords = {'lat': 35.99, 'lon': -80.44}
+
+
+def current(code, key=None, retry=True):
+    instant = 10800*(int(time.time())//10800 + 1)
+    return {'Weather': {'zipcode': code, 'instant': instant, 'time_to_instant': 600, 'temperature': {'temp': 290.1}},
+            'coordinates': coords, 'city_id': None}
+
+def five_day(coords, code=None, key=None, retry=True):
+    reception_time = int(time.time())
+    instant = 10800*(reception_time//10800 + 1)
+    return {'zipcode': code, 'coordinates': coords, 'reception_time': reception_time,
+            'weathers': [{'zipcode': code, 'instant': instant, 'time_to_instant': instant - reception_time,
+                          'temperature': {'temp': 291.4}}]}
+
+def no_current(code, key=None, retry=True):
+    raise AttributeError(f'no current weather returned for {code}')
+
+
+def run(client, versions, get_current_weather, monkeypatch):
+    monkeypatch.setattr(fetch, 'get_current_weather', get_current_weather)
+    monkeypatch.setattr(fetch, 'five_day', five_day)
+    loader = Loader(client, 'test', versions=versions, direct=False)
+    with loader:
+        collect(['27006'], scheduler=KeyScheduler(keys=['a']), geocodes={'27006': coords}, versions=versions,
+                loader=loader, cell_size=0, group_size=0)
+    return loader
+
+
+def test_the_version_is_recorded_once_the_forecast_is_loaded(client, collections, monkeypatch):
+    versions = {}
+    loader = run(client, versions, current, monkeypatch)
+    assert loader.done == ['27006']
+    assert client['test']['cast_temp'].count_documents({}) == 1
+    assert set(versions) == {'27006'}
+
+def test_a_forecast_dropped_with_its_failed_current_weather_is_not_recorded(client, collections, monkeypatch):
+    versions = {}
+    loader = run(client, versions, no_current, monkeypatch)
+    assert loader.done == []
+    assert versions == {}
+
+def test_a_forecast_the_loader_failed_to_write_is_not_recorded(client, collections, monkeypatch):
+    def load_weather(*args, **kwargs):
+        raise ConnectionError('the database went away')
+
+    monkeypatch.setattr(pipeline, 'load_weather', load_weather)
+    versions = {}
+    with pytest.raises(ConnectionError):
+        run(client, versions, current, monkeypatch)
+    assert versions == {}
+
+def recorded(directory, code, city_id):
+    ''' Record a current weather response for the zipcode for the replay server. '''
+
+    save(str(directory), 'weather', code, 200, {
+        'coord': {'lon': -80.44, 'lat': 35.99}, 'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky',
+                                                            'icon': '01d'}],
+        'main': {'temp': 290.1 + city_id % 10, 'pressure': 1016, 'humidity': 60}, 'dt': int(time.time()),
+        'sys': {'country': 'US'}, 'id': city_id, 'name': f'city {city_id}'})
+
+def test_a_group_response_is_split_into_a_document_for_each_zipcode(tmp_path, monkeypatch):
+    for code, city_id in (('27006', 101), ('27012', 102)):
+        recorded(tmp_path, code, city_id)
+    server = ReplayServer(recording=Recording(str(tmp_path)), port=0, latency=0).start()
+    calls = []
+
+    def group(ids, **kwargs):
+        calls.append(ids)
+        return current_weather_at_ids(ids, raw=True, **kwargs)
+
+    monkeypatch.setattr(request_and_load, 'client_for', lambda key, raw=False: RawOWM(key, url=server.url))
+    monkeypatch.setattr(fetch, 'current_weather_at_ids', group)
+    monkeypatch.setattr(fetch, 'get_current_weather', no_current)  # every zipcode has to come from the group
+    try:
+        # 27006 and 27007 are in the same city, so they share its id and its observation
+        city_ids = {'27006': 101, '27007': 101, '27012': 102}
+        results = collect(['27006', '27007', '27012'], scheduler=KeyScheduler(keys=['a']), geocodes={},
+                          endpoints=('weather',), city_ids=city_ids, group_size=20, cell_size=0)
+    finally:
+        server.stop()
+    assert calls == [[101, 102]]
+    currents = [current for current, forecasts in results]
+    assert [current['Weather']['zipcode'] for current in currents] == ['27006', '27007', '27012']
+    assert [current['Weather']['temperature']['temp'] for current in currents] == [291.1, 291.1, 292.1]
+    assert all(current['city_id'] == city_ids[current['Weather']['zipcode']] for current in currents)
+    assert all(current['Weather']['instant'] % 10800 == 0 and 'reference_time' not in current['Weather']
+               for current in currents)
+    assert currents[0]['Weather'] is not currents[1]['Weather']
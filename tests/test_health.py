@@ -0,0 +1,38 @@
+import json
+
+from health import LocationHealth, read_list_from_file, write_list_to_file
+
+
+def tracker(tmp_path, codes=()):
+    fail_zips = tmp_path / 'fail_zips.csv'
+    if codes:
+        write_list_to_file(codes, str(fail_zips))
+    return LocationHealth(str(tmp_path / 'zip_health.json'), str(fail_zips), after=3, reprobe=100)
+
+
+def test_fail_zips_are_quarantined_on_load(tmp_path):
+    health = tracker(tmp_path, ['30073', '30219'])
+    assert health.active(['30073', '30219', '27006']) == ['27006']
+
+def test_save_keeps_the_existing_fail_zips(tmp_path):
+    health = tracker(tmp_path, ['30073', '30219'])
+    for i in range(3):
+        health.failed('27006', KeyError('nope'))
+    health.save()
+    assert read_list_from_file(str(tmp_path / 'fail_zips.csv')) == ['27006', '30073', '30219']
+
+def test_quarantine_survives_a_restart(tmp_path):
+    health = tracker(tmp_path)
+    for i in range(3):
+        health.failed('27006', KeyError('nope'))
+    health.save()
+    assert tracker(tmp_path).active(['27006', '27007']) == ['27007']
+    assert json.loads((tmp_path / 'zip_health.json').read_text())['27006']['failures'] == 3
+
+def test_a_probe_that_succeeds_clears_the_quarantine(tmp_path):
+    health = tracker(tmp_path, ['30073'])
+    now = health.zips['30073']['quarantined']
+    assert health.active(['30073'], now=now + 100) == ['30073']
+    health.succeeded('30073')
+    health.save()
+    assert (tmp_path / 'fail_zips.csv').read_text() == ''
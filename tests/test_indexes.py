@@ -0,0 +1,46 @@
+import pytest
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+import indexes
+from indexes import ensure_indexes, same_index
+
+
+@pytest.fixture
+def declared(monkeypatch):
+    ''' A declaration of the indexes that mongomock reports back in full, which it does not for partial indexes. '''
+
+    declared = {'instant_temp': [IndexModel([('instant', DESCENDING)]),
+                                 IndexModel([('zipcode', ASCENDING), ('instant', ASCENDING)], name='zipcode_instant',
+                                            unique=True)]}
+    monkeypatch.setattr(indexes, 'indexes', declared)
+    return declared
+
+def test_the_declared_indexes_are_made_once(client, declared):
+    assert ensure_indexes(client, 'test', check=False) == [('instant_temp', 'instant_-1'),
+                                                           ('instant_temp', 'zipcode_instant')]
+    assert ensure_indexes(client, 'test', check=False) == []
+
+def test_a_changed_index_is_made_again_and_the_rest_are_left_alone(client, declared, capsys):
+    ensure_indexes(client, 'test', check=False)
+    col = client['test']['instant_temp']
+    col.drop_index('zipcode_instant')
+    col.create_index([('zipcode', 1), ('instant', 1)], name='zipcode_instant')    # no longer unique
+    assert ensure_indexes(client, 'test', check=False) == [('instant_temp', 'zipcode_instant')]
+    assert col.index_information()['zipcode_instant']['unique']
+    assert 'the index zipcode_instant on test.instant_temp has changed' in capsys.readouterr().out
+
+def test_an_undeclared_index_is_reported_and_kept(client, declared, capsys):
+    col = client['test']['instant_temp']
+    col.create_index('temperature')
+    ensure_indexes(client, 'test', check=False)
+    assert 'temperature_1' in col.index_information()
+    assert 'test.instant_temp has the index temperature_1' in capsys.readouterr().out
+
+def test_the_options_of_a_partial_index_are_compared():
+    spec = IndexModel([('zipcode', ASCENDING), ('instant', DESCENDING)], name='observed',
+                      partialFilterExpression={'weather': {'$exists': True}}).document
+    existing = {'key': [('zipcode', 1), ('instant', -1.0)], 'v': 2,
+                'partialFilterExpression': {'weather': {'$exists': True}}}  # as MongoDB reports it
+    assert same_index(existing, spec)
+    assert not same_index(dict(existing, partialFilterExpression={'weather': {'$exists': False}}), spec)
+    assert not same_index(dict(existing, key=[('instant', -1), ('zipcode', 1)]), spec)
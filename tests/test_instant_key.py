@@ -0,0 +1,52 @@
+from instant_key import instant_id, rekey, slot, unique_index, upsert_for
+
+
+def test_the_id_separates_the_location_from_the_instant():
+    # without the separator '2700' at 61593201600 and '27006' at 1593201600 would share an _id
+    assert instant_id('27006', 1593201600) == '27006-1593201600'
+    assert instant_id('2700', 61593201600) != instant_id('27006', 1593201600)
+
+def test_slot_is_the_end_of_the_window():
+    assert slot(1593194400) == 1593205200
+    assert slot(1593205199) == 1593205200
+
+def test_upserts_on_zipcode_and_instant_are_keyed_by_id():
+    filters, updates = upsert_for({'zipcode': '27006', 'instant': 1593201600}, {'$push': {'forecasts': 1}})
+    assert filters == {'_id': '27006-1593201600'}
+    assert updates['$setOnInsert'] == {'zipcode': '27006', 'instant': 1593201600}
+
+def test_rekey_merges_the_old_keys(client):
+    col = client['test']['legit_inst']
+    col.insert_many([
+        {'_id': '270061593201600', 'zipcode': '27006', 'instant': 1593201600, 'forecasts': [{'temp': 1}]},
+        {'_id': '159320160027006', 'zipcode': '27006', 'instant': 1593201600, 'forecasts': [{'temp': 2}],
+         'weather': {'temp': 3}},
+        {'_id': '27007-1593201600', 'zipcode': '27007', 'instant': 1593201600, 'forecasts': []},
+    ])
+    assert rekey(col) == 2
+    assert rekey(col) == 0
+    assert col.count_documents({}) == 2
+    doc = col.find_one({'_id': '27006-1593201600'})
+    assert sorted(cast['temp'] for cast in doc['forecasts']) == [1, 2]
+    assert doc['weather'] == {'temp': 3}
+
+def test_rekey_merges_into_an_existing_canonical_document(client):
+    col = client['test']['legit_inst']
+    col.insert_many([
+        {'_id': '27006-1593201600', 'zipcode': '27006', 'instant': 1593201600, 'forecasts': [{'temp': 1}],
+         'weather': {'temp': 4}},
+        {'_id': '270061593201600', 'zipcode': '27006', 'instant': 1593201600, 'forecasts': [{'temp': 2}]},
+    ])
+    assert rekey(col) == 1
+    assert [doc['_id'] for doc in col.find()] == ['27006-1593201600']
+    doc = col.find_one({'_id': '27006-1593201600'})
+    assert sorted(cast['temp'] for cast in doc['forecasts']) == [1, 2]
+    assert doc['weather'] == {'temp': 4}
+
+def test_rekey_moves_a_document_under_the_unique_index(client):
+    col = client['test']['legit_inst']
+    col.insert_one({'_id': '270061593201600', 'zipcode': '27006', 'instant': 1593201600, 'forecasts': [{'temp': 2}]})
+    assert unique_index(col)
+    assert rekey(col) == 1
+    assert list(col.find()) == [{'_id': '27006-1593201600', 'zipcode': '27006', 'instant': 1593201600,
+                                 'forecasts': [{'temp': 2}]}]
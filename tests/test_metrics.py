@@ -0,0 +1,15 @@
+from metrics import Metrics, prune
+
+
+def test_only_the_latest_snapshots_are_kept(tmp_path):
+    for started in (900, 1000, 80, 1100):
+        (tmp_path / f'run-{started}.json').write_text('{}')
+    assert prune(str(tmp_path), keep=2) == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['run-1000.json', 'run-1100.json']
+
+def test_writing_a_snapshot_prunes_the_old_ones(tmp_path):
+    for started in range(100):
+        (tmp_path / f'run-{started}.json').write_text('{}')
+    path = Metrics().write(str(tmp_path), 'json')
+    assert len(list(tmp_path.iterdir())) == 56
+    assert (tmp_path / path.rsplit('/', 1)[-1]).exists()
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+import pipeline
+from pipeline import Loader
+
+instant = 1593205200
+
+
+def location(code):
+    ''' A location's current weather and forecasts the way the fetch engine puts them on the queue. '''
+
+    return ({'Weather': {'zipcode': code, 'instant': instant, 'temperature': {'temp': 290.1}}},
+            {'zipcode': code, 'weathers': [{'zipcode': code, 'instant': instant, 'temperature': {'temp': 291.4}}]})
+
+
+def test_the_fetches_wait_while_the_queue_is_full(client, monkeypatch):
+    loading = threading.Event()
+    release = threading.Event()
+
+    def load_weather(*args, **kwargs):
+        loading.set()
+        release.wait(5)
+
+    monkeypatch.setattr(pipeline, 'load_weather', load_weather)
+    with Loader(client, 'test', queue_size=1, batch_size=1, direct=False) as loader:
+        loader.put(location('27006'))
+        loading.wait(5)     # the loader is busy with the first location
+        loader.put(location('27007'))   # and the second fills the queue
+        producer = threading.Thread(target=loader.put, args=(location('27008'),))
+        producer.start()
+        producer.join(0.2)
+        assert producer.is_alive() and loader.fetched.waiters == 1
+        release.set()
+        producer.join(5)
+        assert not producer.is_alive()
+    assert loader.done == ['27006', '27007', '27008']
+    assert loader.fetched.waiting > 0
+
+def test_an_error_loading_reaches_the_fetching_side(client, monkeypatch):
+    def load_weather(*args, **kwargs):
+        raise ConnectionError('the database went away')
+
+    monkeypatch.setattr(pipeline, 'load_weather', load_weather)
+    with pytest.raises(ConnectionError):
+        with Loader(client, 'test', queue_size=1, batch_size=1, direct=False) as loader:
+            for code in ('27006', '27007', '27008', '27009'):
+                loader.put(location(code))    # the rest of the queue is drained, so none of these are left waiting
+    assert loader.done == []
+
+def test_everything_on_the_queue_is_loaded_at_shutdown(client, monkeypatch):
+    started = threading.Event()
+    take = Loader.take
+
+    def slow_take(self):
+        started.wait(5)     # nothing is taken until every location is on the queue
+        return take(self)
+
+    monkeypatch.setattr(Loader, 'take', slow_take)
+    codes = [f'{27006 + i}' for i in range(25)]
+    with Loader(client, 'test', queue_size=30, batch_size=10, direct=False) as loader:
+        for code in codes:
+            loader.put(location(code))
+        started.set()
+    assert loader.done == codes
+    assert client['test']['obs_temp'].count_documents({}) == 25
+    assert client['test']['cast_temp'].count_documents({}) == 25
+    assert not loader.bulk.buffers
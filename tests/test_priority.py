@@ -0,0 +1,44 @@
+import priority
+from priority import Prioritizer, by_priority
+
+now = 1593194400 + 3600     # an hour into the window
+deadline = 1593205200
+
+
+def test_the_least_valuable_locations_are_shed_when_the_quota_runs_short(client, collections, clock, monkeypatch):
+    client['test']['instant_temp'].insert_many([
+        # 27006 was observed last window and its next instant has every forecast so far
+        {'zipcode': '27006', 'instant': deadline - 10800, 'weather': {}},
+        {'zipcode': '27006', 'instant': deadline, 'forecasts': [{}]*39},
+        # 27007 was observed last window too, and has nothing pending
+        {'zipcode': '27007', 'instant': deadline - 10800, 'weather': {}},
+        # 27008 was last observed two days ago, and 27009 never has been
+        {'zipcode': '27008', 'instant': deadline - 2*86400, 'weather': {}},
+    ])
+    clock.now = now
+    monkeypatch.setattr(priority, 'time', clock)
+    prioritizer = Prioritizer(client, 'test', now=now)
+    assert prioritizer.order(['27006', '27007', '27008', '27009']) == ['27009', '27008', '27006', '27007']
+    prioritizer.rate = 1/3600   # time for two of the four before the instant
+
+    collected = []
+
+    def run(codes):
+        clock.now += 3600*len(codes)
+        collected.extend(codes)
+        return codes
+
+    assert by_priority(['27006', '27007', '27008', '27009'], run, prioritizer, chunk=1) == 2
+    assert collected == ['27009', '27008']
+
+def test_nothing_is_shed_while_there_is_time(client, collections, clock, monkeypatch):
+    clock.now = now
+    monkeypatch.setattr(priority, 'time', clock)
+    collected = []
+
+    def run(codes):
+        collected.extend(codes)
+        return codes
+
+    assert by_priority(['27006', '27007', '27008'], run, Prioritizer(client, 'test', now=now), chunk=1) == 3
+    assert sorted(collected) == ['27006', '27007', '27008']
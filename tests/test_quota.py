@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from quota import QuotaLedger, key_id
+from ratelimit import KeyScheduler
+
+
+def test_reservations_stop_at_the_quota(client):
+    ledger = QuotaLedger(client, calls_per_minute=3)
+    assert [ledger.reserve('a') for i in range(4)] == [True, True, True, False]
+    assert ledger.reserve('b')
+
+def test_a_batch_is_reserved_whole_or_not_at_all(client):
+    ledger = QuotaLedger(client, calls_per_minute=5)
+    assert ledger.reserve('a', calls=3)
+    assert not ledger.reserve('a', calls=3)
+    assert ledger.reserve('a', calls=2)
+
+def test_the_ledger_is_shared_between_processes(client):
+    first, second = QuotaLedger(client, calls_per_minute=2), QuotaLedger(client, calls_per_minute=2)
+    assert first.reserve('a') and second.reserve('a')
+    assert not first.reserve('a')
+    assert client['owmap']['quota_ledger'].find_one()['_id'].startswith(key_id('a'))
+
+def test_acquire_reserves_off_the_event_loop(client):
+    class Ledger(QuotaLedger):
+        def reserve(self, key, calls=1):
+            threads.append(threading.current_thread())
+            return super().reserve(key, calls)
+
+    threads = []
+    scheduler = KeyScheduler(keys=['a', 'b'], ledger=Ledger(client, calls_per_minute=60))
+
+    async def acquire():
+        return await asyncio.gather(*(scheduler.acquire('weather') for i in range(4)))
+
+    keys = asyncio.run(asyncio.wait_for(acquire(), 5))
+    assert sorted(keys) == ['a', 'a', 'b', 'b']
+    assert threads and threading.main_thread() not in threads
+
+def test_a_key_out_of_quota_is_passed_over(client):
+    ledger = QuotaLedger(client, calls_per_minute=60)
+    ledger.reserve('a', calls=60)
+    scheduler = KeyScheduler(keys=['a', 'b'], ledger=ledger)
+    assert scheduler.try_acquire('weather') is None     # 'a' has the most tokens, but none of the quota
+    assert 'a' in scheduler.blocked
+    assert scheduler.try_acquire('weather') == 'b'
+
+def test_the_ledger_index_is_made_with_the_others(client):
+    from indexes import ensure_indexes
+
+    QuotaLedger(client)
+    assert 'expires_1' not in client['owmap']['quota_ledger'].index_information()
+    ensure_indexes(client, 'test', check=False)
+    assert client['owmap']['quota_ledger'].index_information()['expires_1']['expireAfterSeconds'] == 0
+    assert 'quota_ledger' not in client['test'].list_collection_names()
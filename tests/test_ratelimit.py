@@ -0,0 +1,61 @@
+import pytest
+
+import breaker
+import ratelimit
+from breaker import Breakers
+from ratelimit import KeyScheduler, TokenBucket
+
+
+@pytest.fixture
+def paused(monkeypatch, clock):
+    ''' The fake clock in place of the time module for the buckets and breakers. '''
+
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    monkeypatch.setattr(breaker, 'time', clock)
+    return clock
+
+def test_a_bucket_refills_at_its_rate(paused):
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.try_take() and bucket.try_take()
+    assert not bucket.try_take()
+    assert bucket.wait_time() == 1
+    paused.now += 0.5
+    assert not bucket.try_take()
+    assert bucket.wait_time() == 0.5
+    paused.now += 0.5
+    assert bucket.try_take()
+
+def test_a_bucket_holds_no_more_than_its_capacity(paused):
+    bucket = TokenBucket(rate=1, capacity=2)
+    paused.now += 60
+    assert bucket.available == 2
+
+def test_calls_are_spread_across_the_keys(paused):
+    scheduler = KeyScheduler(keys=['a', 'b'], calls_per_minute=60, burst=2)
+    keys = [scheduler.try_acquire('weather') for i in range(4)]
+    assert sorted(keys) == ['a', 'a', 'b', 'b']
+    assert scheduler.try_acquire('weather') is None
+    paused.now += 1
+    assert scheduler.try_acquire('weather') in ('a', 'b')
+
+def test_a_key_with_an_open_breaker_is_passed_over(paused):
+    breakers = Breakers(window=1, min_calls=1, cooldown=30)
+    breakers.get('a', 'forecast').record(False)
+    scheduler = KeyScheduler(keys=['a', 'b'], calls_per_minute=60, burst=5, breakers=breakers)
+    assert [scheduler.try_acquire('forecast') for i in range(3)] == ['b', 'b', 'b']
+    assert scheduler.try_acquire('weather') == 'a'  # the breaker is only open for the forecasts
+
+def test_reopens_in_is_the_soonest_breaker(paused):
+    breakers = Breakers(window=1, min_calls=1, cooldown=30)
+    breakers.get('a', 'forecast').record(False)
+    paused.now += 10
+    breakers.get('b', 'forecast').record(False)
+    scheduler = KeyScheduler(keys=['a', 'b'], breakers=breakers)
+    assert scheduler.reopens_in('forecast') == 20
+    assert scheduler.reopens_in('weather') == 0
+
+def test_acquire_blocking_waits_for_the_next_token(paused):
+    scheduler = KeyScheduler(keys=['a'], calls_per_minute=30, burst=1)
+    assert scheduler.acquire_blocking('weather') == 'a'
+    assert scheduler.acquire_blocking('weather') == 'a'
+    assert paused.sleeps == [2]     # one token every 2 seconds at 30 calls per minute
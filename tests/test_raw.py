@@ -0,0 +1,67 @@
+''' The raw path against the pyowm path, over the sample responses in samples/ served by the replay server. '''
+
+import os
+
+import pytest
+import requests
+from pyowm import OWM
+
+import request_and_load
+from pool import PooledHttpClient
+from raw import RawOWM
+from replay import ReplayServer, Recording
+from request_and_load import get_current_weather, five_day
+
+samples = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+locations = [('27006', {'lat': 35.99, 'lon': -80.44}), ('28801', {'lat': 35.6, 'lon': -82.56})]
+
+
+class StockOWM:
+    ''' The pyowm client, taking the allow_raw argument that the project's own pyowm build adds to the forecast call.
+    The stock pyowm 2.10 the tests run with does not have it. '''
+
+    def __init__(self, owm):
+        self.owm = owm
+
+    def three_hours_forecast_at_coords(self, lat, lon, allow_raw=False):
+        return self.owm.three_hours_forecast_at_coords(lat, lon)
+
+    def __getattr__(self, name):
+        return getattr(self.owm, name)
+
+
+@pytest.fixture
+def replayed(monkeypatch):
+    ''' Point both clients at a replay server for the samples. '''
+
+    server = ReplayServer(recording=Recording(samples), port=0, latency=0).start()
+
+    def client_for(key, raw=False):
+        if raw:
+            return RawOWM(key, url=server.url)
+        owm = OWM(key)
+        owm._wapi = PooledHttpClient(requests.Session(), url=server.url, cache=owm._wapi.cache)
+        return StockOWM(owm)
+
+    monkeypatch.setattr(request_and_load, 'client_for', client_for)
+    yield server
+    server.stop()
+
+def received(document):
+    ''' The document without the time it was received, and the cast times worked out from it. '''
+
+    reception_time = document.pop('reception_time', None)
+    for cast in document.get('weathers', []):
+        assert cast.pop('time_to_instant') == cast['instant'] - reception_time
+    return document
+
+
+@pytest.mark.parametrize('code, coords', locations)
+def test_the_raw_current_weather_is_the_pyowm_one(replayed, code, coords):
+    raw = get_current_weather(code, key='a', raw=True, retry=False)
+    assert received(raw) == received(get_current_weather(code, key='a', raw=False, retry=False))
+
+@pytest.mark.parametrize('code, coords', locations)
+def test_the_raw_forecast_is_the_pyowm_one(replayed, code, coords):
+    raw = five_day(coords, code, key='a', raw=True, retry=False)
+    assert received(raw) == received(five_day(coords, code, key='a', raw=False, retry=False))
@@ -0,0 +1,15 @@
+from backfill import list_files, read_responses
+from raw import archive
+
+
+def test_archived_responses_are_read_back_by_backfill(tmp_path):
+    current = {'coord': {'lat': 35.99, 'lon': -80.44}, 'dt': 1593201600, 'main': {'temp': 290.1}}
+    forecast = {'city': {'coord': {'lat': 35.99, 'lon': -80.44}}, 'list': []}
+    archive('weather', {'zip': '27006,us'}, current, str(tmp_path))
+    archive('forecast', {'lat': 35.99, 'lon': -80.44}, forecast, str(tmp_path))
+    archive('group', {'id': '4460243'}, {'list': [current]}, str(tmp_path))
+    [filename] = list_files([str(tmp_path)])
+    responses = list(read_responses(filename))
+    assert [(endpoint, name) for endpoint, name, received, body in responses] == \
+        [('weather', '27006'), ('forecast', '35.99,-80.44'), ('group', None)]
+    assert responses[0][3] == current
@@ -0,0 +1,35 @@
+from versions import content_hash, is_fresh, new_version, record_version, load_versions, save_versions
+
+
+def forecast(code, reception_time, temps=(290.1, 291.4)):
+    instants = [10800*(reception_time//10800 + 1 + i) for i in range(len(temps))]
+    return {'zipcode': code, 'reception_time': reception_time,
+            'weathers': [{'zipcode': code, 'instant': instant, 'time_to_instant': instant - reception_time,
+                          'temperature': {'temp': temp}} for instant, temp in zip(instants, temps)]}
+
+
+def test_fresh_within_the_window_it_was_received_in():
+    versions = {'27006': {'reception_time': 1593194400 + 10700, 'hash': ''}}
+    assert is_fresh(versions, '27006', now=1593194400 + 10799)
+    assert not is_fresh(versions, '27006', now=1593194400 + 10800)
+
+def test_a_run_on_the_cadence_is_never_skipped():
+    # each run receives its forecast a little later than the last; counting from the reception would skip the next run
+    versions = {'27006': {'reception_time': 1593194400 + 30, 'hash': ''}}
+    assert not is_fresh(versions, '27006', now=1593194400 + 10800 + 20)
+
+def test_unknown_locations_are_not_fresh():
+    assert not is_fresh({}, '27006', now=1593201600)
+
+def test_the_hash_leaves_out_the_zipcode_and_time_to_instant():
+    assert content_hash(forecast('27006', 1593201600)) == content_hash(forecast('27007', 1593201660))
+    assert content_hash(forecast('27006', 1593201600)) != content_hash(forecast('27006', 1593201600, (290.1, 292.0)))
+
+def test_a_new_version_is_only_recorded_when_asked(tmp_path):
+    versions = {}
+    version, new = new_version(versions, '27006', forecast('27006', 1593201600))
+    assert new and versions == {}
+    record_version(versions, '27006', version)
+    assert not new_version(versions, '27006', forecast('27006', 1593201900))[1]
+    save_versions(versions, str(tmp_path / 'forecast_versions.json'))
+    assert load_versions(str(tmp_path / 'forecast_versions.json'))['27006']['reception_time'] == 1593201600
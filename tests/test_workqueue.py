@@ -0,0 +1,41 @@
+from workqueue import WorkQueue
+from retry import dead_letters
+
+
+def queue(client, worker, **kwargs):
+    return WorkQueue(client, 'test', instant=1593205200, worker=worker, **kwargs)
+
+
+def test_each_task_is_claimed_by_one_worker(client, collections):
+    first, second = queue(client, 'first'), queue(client, 'second')
+    first.enqueue(['27006', '27007', '27008'])
+    second.enqueue(['27006', '27007', '27008'])
+    claimed = first.claim(2) + second.claim(2)
+    assert sorted(claimed) == ['27006', '27007', '27008']
+    assert first.claim(2) == [] and second.held_elsewhere() > 0
+
+def test_an_expired_lease_is_claimed_again(client, collections):
+    first, second = queue(client, 'first', lease=-1), queue(client, 'second')
+    first.enqueue(['27006'])
+    assert first.claim(1) == ['27006']
+    assert second.claim(1) == ['27006']
+    second.complete(['27006'])
+    assert first.claim(1) == [] and second.held_elsewhere() is None
+
+def test_released_tasks_go_back_to_the_queue_until_they_run_out_of_claims(client, collections):
+    worker = queue(client, 'first', claims=2)
+    worker.enqueue(['27006'])
+    worker.release(worker.claim(1))
+    worker.release(worker.claim(1))
+    assert worker.claim(1) == []
+    assert worker.col.find_one()['state'] == 'failed'
+
+def test_a_task_whose_last_lease_runs_out_is_dead_lettered(client, collections):
+    dead = WorkQueue(client, 'test', worker='dead', lease=-1, claims=1)
+    dead.enqueue(['27006', '27007'])
+    assert sorted(dead.claim(2)) == ['27006', '27007']  # and then the worker dies
+    second = WorkQueue(client, 'test', worker='second', claims=1)
+    assert second.claim(2) == []
+    assert {task['state'] for task in dead.col.find()} == {'failed'}
+    assert sorted(dead_letters(client, 'test', second.instant)) == ['27006', '27007']
+    assert second.held_elsewhere() is None